@@ -1,15 +1,74 @@
 """Soporte para Limitador de Consumo."""
-from homeassistant.helpers.event import async_track_time_interval
-from homeassistant.core import callback
+from homeassistant.helpers.event import (
+    async_track_time_interval,
+    async_track_time_change,
+    async_track_point_in_time,
+    async_track_state_change_event,
+)
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.util import dt as dt_util
+from homeassistant.core import callback, Context
 from homeassistant.const import STATE_ON
 from homeassistant.helpers.entity import ToggleEntity
 from homeassistant.helpers.restore_state import RestoreEntity
 from datetime import timedelta
+import asyncio
 import logging
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_SENSORES_POTENCIA,
+    CONF_HORARIO_LIMITES,
+    CONF_ESCALONADO_CLIMATE,
+    CONF_GRADOS_REDUCCION,
+    CONF_SENSOR_PRODUCCION,
+    CONF_SENSOR_RED,
+    CONF_GRUPOS,
+    CONF_BANDA_MUESTREO,
+    CONF_MAXIMETRO,
+    CONF_SOMBRA,
+    SIGNAL_SOBRECARGA,
+    SIGNAL_SOMBRA,
+)
+from .dispositivos import resolver_sensores_dispositivos
+from .limites import HorarioLimites
+from .actuacion import (
+    DisyuntorDispositivos,
+    ErrorActuacion,
+    ESPERA_VERIFICACION,
+    REINTENTOS_APAGADO,
+    TIMEOUT_APAGADO,
+    TimeoutActuacion,
+    llamar_servicio,
+)
+from .diario import DiarioDecisiones, APAGADO, REACTIVACION, EJECUTADA, FALLIDA
+from .sobrecarga import ContadorSobrecarga
+from .red import EnvolventeMaxima, potencia_neta
+from .grupos import es_grupo, normalizar_grupos, unidades_control
+from .muestreo import ASENTAMIENTO, cadencia, cerca_del_limite, intervalo_adelantado
+from .maximetro import VentanaDemanda
+from .sombra import MotorSombra, normalizar_sombra
+from .planificador import (
+    Dispositivo,
+    Instantanea,
+    APAGAR,
+    ENCENDER,
+    ESCALON_NINGUNO,
+    ESCALON_CONSIGNA,
+    ESCALON_ECO,
+    ESCALON_APAGADO,
+    RAZON_SIN_SENSOR,
+    planificar_apagado,
+    planificar_reactivacion,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+PLATFORMS = ["sensor"]
+INTERVALO_SOMBRA = 5  # Segundos entre avances de los temporizadores del motor en sombra
+# Estado de un climate reducido o apagado que se guarda en la entidad de bloqueo
+# (atributos restaurados tras un reinicio para poder devolverlo a su estado original)
+CLAVES_ESCALON = ("hvac_mode", "temperature", "preset_mode", "fan_mode", "eco_via", "consumo", "escalon", "escalones")
+
 
 class LimitadorBloqueoSwitch(ToggleEntity, RestoreEntity):
     """Entidad input_boolean para bloqueo de dispositivo del limitador."""
@@ -24,6 +83,7 @@ class LimitadorBloqueoSwitch(ToggleEntity, RestoreEntity):
         self._attr_icon = "mdi:flash-auto"
         self._attr_is_on = False
         self._estado_personalizado = None  # Para climates: hvac_mode
+        self._estado_escalon = None  # Para climates: estado original y escalón aplicado
         self.entity_id = f"{DOMAIN}.limitador_bloqueo_{device_name}"
         self._attr_should_poll = False
     
@@ -34,6 +94,13 @@ class LimitadorBloqueoSwitch(ToggleEntity, RestoreEntity):
         if self._attr_is_on and self._estado_personalizado:
             return self._estado_personalizado
         return STATE_ON if self._attr_is_on else "off"
+
+    @property
+    def extra_state_attributes(self):
+        """Estado original y escalón del climate mientras está bloqueado."""
+        if self._attr_is_on and self._estado_escalon:
+            return self._estado_escalon
+        return None
     
     @property
     def device_info(self):
@@ -76,6 +143,9 @@ class LimitadorBloqueoSwitch(ToggleEntity, RestoreEntity):
                 # Es un hvac_mode guardado
                 self._attr_is_on = True
                 self._estado_personalizado = old_state.state
+            if self._attr_is_on:
+                guardado = {k: old_state.attributes[k] for k in CLAVES_ESCALON if k in old_state.attributes}
+                self._estado_escalon = guardado or None
         else:
             self._attr_is_on = False
             self._estado_personalizado = None
@@ -112,6 +182,7 @@ async def _gestionar_bloqueo_dispositivo(hass, entry_id, entity_id, bloquear, es
             else:
                 bloqueo_entity._attr_is_on = False
                 bloqueo_entity._estado_personalizado = None
+                bloqueo_entity._estado_escalon = None
             bloqueo_entity.async_write_ha_state()
             estado_mostrado = estado_personalizado if (bloquear and estado_personalizado) else ('ON' if bloquear else 'OFF')
             _LOGGER.debug(f"✓ Estado actualizado: {bloqueo_entity.entity_id} = {estado_mostrado}")
@@ -126,40 +197,187 @@ async def _gestionar_bloqueo_dispositivo(hass, entry_id, entity_id, bloquear, es
         }
     )
 
+
+def _guardar_escalon(hass, entry_id, entity_id, info):
+    """Guarda en la entidad de bloqueo el estado original y el escalón de un climate.
+
+    Se restaura con la entidad tras un reinicio, así que un climate reducido o
+    apagado puede volver después a su consigna, preset y ventilador originales.
+    """
+    for bloqueo_entity in hass.data["limitador_consumo"][entry_id].get("bloqueo_entities", []):
+        if bloqueo_entity._device_entity_id == entity_id:
+            bloqueo_entity._estado_escalon = {
+                k: list(info[k]) if k == "escalones" else info[k]
+                for k in CLAVES_ESCALON if info.get(k) is not None
+            }
+            bloqueo_entity.async_write_ha_state()
+            break
+
+
+async def _restaurar_fuera_de_control(hass, entity_id, info, miembros):
+    """Devuelve a su estado un dispositivo apagado o reducido que deja de controlarse.
+
+    Se usa al quitarlo de las opciones o al cambiarlo de grupo: después ya no habría
+    quien lo reactivase. ``miembros`` son las entidades a encender (las del grupo).
+
+    Returns:
+        True si se restauró; False si no respondió (queda como estaba).
+    """
+    try:
+        if entity_id.startswith("climate.") and isinstance(info, dict):
+            estado = hass.states.get(entity_id)
+            modo = info.get("hvac_mode")
+            if estado is not None and estado.state == "off" and modo and modo not in ("on", "off"):
+                await llamar_servicio(hass, "climate", "set_hvac_mode", {"entity_id": entity_id, "hvac_mode": modo})
+            if info.get("temperature") is not None:
+                await llamar_servicio(hass, "climate", "set_temperature", {"entity_id": entity_id, "temperature": info["temperature"]})
+            if info.get("eco_via") == "preset" and info.get("preset_mode"):
+                await llamar_servicio(hass, "climate", "set_preset_mode", {"entity_id": entity_id, "preset_mode": info["preset_mode"]})
+            elif info.get("eco_via") == "fan" and info.get("fan_mode"):
+                await llamar_servicio(hass, "climate", "set_fan_mode", {"entity_id": entity_id, "fan_mode": info["fan_mode"]})
+        else:
+            await llamar_servicio(hass, "switch", "turn_on", {"entity_id": list(miembros)})
+    except ErrorActuacion as err:
+        _LOGGER.error(f"❌ {entity_id} ya no se controla y no se pudo restaurar: {err}")
+        return False
+    _LOGGER.info(f"✅ {entity_id} ya no se controla: restaurado al quitarlo del limitador")
+    return True
+
 async def async_setup_entry(hass, entry):
     hass.data.setdefault("limitador_consumo", {})
-    config = dict(entry.options) if entry.options else dict(entry.data)
+    # Estado del motor: se conserva cuando se cambian las opciones en caliente
     hass.data["limitador_consumo"][entry.entry_id] = {
-        "config": config,
         "consumo_apagado": {},
-        "dispositivos_bloqueados": set()  # Conjunto de dispositivos bloqueados
+        "dispositivos_bloqueados": set(),  # Conjunto de dispositivos bloqueados
+        "sensores_dispositivos": {},  # entity_id -> {"power": sensor}
+        "disyuntores": DisyuntorDispositivos(),  # Dispositivos que no responden
+        "por_verificar": {},  # entity_id -> instante de una orden sin confirmar (timeout)
+        "diario": DiarioDecisiones(),  # Últimas decisiones (se formatean solo al leerlas)
+        "sobrecarga": ContadorSobrecarga(),  # Exposición a potencia por encima del límite
+        "envolvente_red": EnvolventeMaxima(),  # Máximo reciente de la importación neta (nubes)
+        "ventana_demanda": VentanaDemanda(),  # Energía del cuarto de hora en curso (maxímetro)
+        "sombra": None,  # Motor en sombra con una configuración candidata (si se configura)
+        "generacion": 0  # Se incrementa en cada reconfiguración
     }
+    await _configurar(hass, entry)
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    entry.async_on_unload(entry.add_update_listener(_opciones_actualizadas))
+    return True
+
+
+async def _opciones_actualizadas(hass, entry):
+    """Aplica las nuevas opciones sin recargar la entrada (conserva apagados y bloqueos)."""
+    _LOGGER.info("🔧 Opciones actualizadas: reconfigurando el limitador en caliente")
+    _cancelar_listeners(hass.data["limitador_consumo"][entry.entry_id])
+    await _configurar(hass, entry)
+
+
+def _cancelar_listeners(datos):
+    """Cancela temporizadores y listeners registrados por ``_configurar``."""
+    datos["generacion"] += 1  # Las pasadas en curso no vuelven a programarse
+    for clave in ("listener_desactivar", "listener_activar", "listener_contador", "listener_medianoche"):
+        cancelar = datos.pop(clave, None)
+        if cancelar:
+            cancelar()
+    for cancelar in datos.pop("listener_registros", []) + datos.pop("listener_sombra", []):
+        cancelar()
+    limite = datos.get("limite")
+    if limite and limite["cancelar"]:
+        limite["cancelar"]()
+        limite["cancelar"] = None
+
+
+async def _configurar(hass, entry):
+    """Lee la configuración, prepara el motor y registra temporizadores y listeners.
+
+    Se ejecuta al iniciar y cada vez que cambian las opciones. El estado del motor
+    (apagados, bloqueos, disyuntores, diario, sobrecarga) ya está en ``hass.data``
+    y se reutiliza, así que los dispositivos apagados siguen controlados.
+    """
+    datos = hass.data["limitador_consumo"][entry.entry_id]
+    config = dict(entry.options) if entry.options else dict(entry.data)
+    datos["config"] = config
+    datos["generacion"] += 1
+    generacion = datos["generacion"]
     invertir_orden = config.get("invertir_orden_activacion", True)
 
-    potencia_max = config["potencia"]
+    try:
+        horario = HorarioLimites(config["potencia"], config.get(CONF_HORARIO_LIMITES))
+    except ValueError as err:
+        _LOGGER.error(f"❌ Horario de límites no válido, se usa la potencia fija: {err}")
+        horario = HorarioLimites(config["potencia"])
+    potencia_max = horario.limite(dt_util.now())
+    # Maxímetro: el límite se aplica a la media cuartohoraria y no a la potencia instantánea
+    maximetro = config.get(CONF_MAXIMETRO, False)
+    ventana_demanda = datos["ventana_demanda"]
     sensor_potencia = config["sensor_potencia"]
+    # Autoconsumo: el límite se compara con la importación neta de la red
+    sensor_produccion = config.get(CONF_SENSOR_PRODUCCION)
+    sensor_red = config.get(CONF_SENSOR_RED)
+    fotovoltaica = bool(sensor_produccion or sensor_red)
     switches = config["switches_limitados"]
+    # Unidades de control: dispositivos sueltos y grupos (que se actúan con una sola llamada)
+    try:
+        grupos = normalizar_grupos(config.get(CONF_GRUPOS), switches)
+    except ValueError as err:
+        _LOGGER.error(f"❌ Grupos de dispositivos no válidos, se controlan por separado: {err}")
+        grupos = {}
+    unidades = unidades_control(switches, grupos)
+    grupos_anteriores = datos.get("grupos", {})  # Para restaurar lo que sale de un grupo apagado
+    datos["grupos"] = grupos
     intervalo_desactivacion = config["intervalo_desactivacion"]
+    # Banda (fracción del límite) en la que se muestrea más rápido; 0 = cadencia fija
+    banda_muestreo = config.get(CONF_BANDA_MUESTREO, 10) / 100
     intervalo_activacion = config.get("intervalo_activacion", 60)
     climate_sensors = config.get("climate_power_sensors", {})  # Mapeo climate -> sensor de potencia
+    # Overrides explícitos para cualquier dominio (climate_power_sensors tiene prioridad)
+    sensores_override = {**config.get(CONF_SENSORES_POTENCIA, {}), **climate_sensors}
     notificaciones_activadas = config.get("notificaciones_activadas", True)  # Por defecto activadas
+    escalonado_climate = config.get(CONF_ESCALONADO_CLIMATE, False)  # Consigna/eco antes de apagar
+    grados_reduccion = config.get(CONF_GRADOS_REDUCCION, 2)
 
-    apagados = hass.data["limitador_consumo"][entry.entry_id]["consumo_apagado"]
-    bloqueados = hass.data["limitador_consumo"][entry.entry_id]["dispositivos_bloqueados"]
+    apagados = datos["consumo_apagado"]
+    bloqueados = datos["dispositivos_bloqueados"]
+    sensores_dispositivos = datos["sensores_dispositivos"]
+    disyuntores = datos["disyuntores"]
+    diario = datos["diario"]
+    por_verificar = datos["por_verificar"]
+    envolvente_red = datos["envolvente_red"]
+
+    def actualizar_sensores_dispositivos():
+        """Resuelve (una sola vez) el sensor de potencia de cada dispositivo."""
+        sensores_dispositivos.clear()
+        sensores_dispositivos.update(
+            resolver_sensores_dispositivos(hass, switches, sensores_override)
+        )
+
+    def sensor_potencia_de(entity_id):
+        """Sensor de potencia resuelto para un dispositivo controlado (o None)."""
+        return sensores_dispositivos.get(entity_id, {}).get("power")
+
+    actualizar_sensores_dispositivos()
     
     _LOGGER.info(f"🚀 Limitador de Consumo: Inicializado")
-    _LOGGER.info(f"  📊 Potencia máxima: {potencia_max}W")
+    _LOGGER.info(f"  📊 Potencia máxima: {potencia_max}W{' (variable según horario)' if horario.variable else ''}")
     _LOGGER.info(f"  📡 Sensor de potencia: {sensor_potencia}")
+    if maximetro:
+        _LOGGER.info("  📐 Modo maxímetro: límite sobre la media de cada cuarto de hora")
+    if fotovoltaica:
+        _LOGGER.info(f"  ☀️ Autoconsumo - Sensor de red: {sensor_red or '-'}, producción: {sensor_produccion or '-'}")
     _LOGGER.info(f"  🔌 Dispositivos: {len(switches)} ({switches})")
+    if grupos:
+        _LOGGER.info(f"  🧩 Grupos: {grupos}")
     _LOGGER.info(f"  ⏱️ Intervalo desactivación: {intervalo_desactivacion}s")
     _LOGGER.info(f"  ⏱️ Intervalo activación: {intervalo_activacion}s")
     _LOGGER.info(f"  🔄 Invertir orden: {invertir_orden}")
     _LOGGER.info(f"  🔔 Notificaciones: {'Activadas' if notificaciones_activadas else 'Desactivadas'}")
     if climate_sensors:
         _LOGGER.info(f"  🌡️ Sensores de climates: {climate_sensors}")
+    _LOGGER.info(f"  📈 Sensores de potencia resueltos: { {k: v['power'] for k, v in sensores_dispositivos.items()} }")
     
     # Crear entidades de bloqueo
     from homeassistant.helpers import entity_registry as er
+    from homeassistant.helpers import device_registry as dr
     from homeassistant.helpers.entity_component import EntityComponent
     
     entity_registry = er.async_get(hass)
@@ -184,554 +402,955 @@ async def async_setup_entry(hass, entry):
     else:
         component = hass.data[component_key]
     
-    # Crear las entidades de bloqueo
+    # Al reconfigurar solo se crean o eliminan las entidades de los dispositivos que cambian
+    existentes = {e._device_entity_id: e for e in datos.get("bloqueo_entities", [])}
+    for entity_id, bloqueo_switch in existentes.items():
+        if entity_id in unidades:
+            continue
+        if entity_id in apagados:
+            # Quitado de las opciones o cambiado de grupo: nadie lo reactivaría después
+            miembros = grupos_anteriores.get(entity_id, (entity_id,))
+            if not await _restaurar_fuera_de_control(hass, entity_id, apagados[entity_id], miembros):
+                _LOGGER.warning(f"⚠️ {entity_id} ya no se controla y sigue apagado por el limitador")
+            apagados.pop(entity_id)
+        bloqueados.discard(entity_id)
+        await bloqueo_switch.async_remove()
+        if entity_registry.async_get(bloqueo_switch.entity_id) is not None:
+            entity_registry.async_remove(bloqueo_switch.entity_id)
+        _LOGGER.info(f"🗑️ Entidad de bloqueo eliminada: {bloqueo_switch.entity_id}")
+    # Miembros que salen de un grupo que sigue apagado: el grupo ya no los reactivará
+    for entity_id in list(apagados):
+        if entity_id in grupos and entity_id in grupos_anteriores:
+            sueltos = [m for m in grupos_anteriores[entity_id] if m not in grupos[entity_id]]
+            if sueltos:
+                await _restaurar_fuera_de_control(hass, entity_id, apagados[entity_id], sueltos)
+
+    # Crear las entidades de bloqueo que falten (una por grupo, no por miembro)
     entities_to_add = []
-    for entity_id in switches:
-        bloqueo_switch = LimitadorBloqueoSwitch(hass, entity_id)
-        entities_to_add.append(bloqueo_switch)
+    for entity_id in unidades:
+        if entity_id not in existentes:
+            bloqueo_switch = LimitadorBloqueoSwitch(hass, entity_id)
+            entities_to_add.append(bloqueo_switch)
     
-    # Añadir todas las entidades
-    await component.async_add_entities(entities_to_add)
+    # Añadir las entidades nuevas
+    if entities_to_add:
+        await component.async_add_entities(entities_to_add)
     
     # Guardar referencia a las entidades en hass.data para mantenerlas vivas
-    hass.data["limitador_consumo"][entry.entry_id]["bloqueo_entities"] = entities_to_add
+    nuevas = {e._device_entity_id: e for e in entities_to_add}
+    datos["bloqueo_entities"] = [existentes.get(e) or nuevas[e] for e in unidades]
     
     _LOGGER.info(f"✓ {len(entities_to_add)} entidades de bloqueo creadas: {[e.entity_id for e in entities_to_add]}")
 
+    def leer_potencia(entity_id):
+        """Lee un sensor de potencia como float (None si no hay lectura válida)."""
+        if not entity_id:
+            return None
+        estado_sensor = hass.states.get(entity_id)
+        if estado_sensor is None or estado_sensor.state in (None, "unknown", "unavailable", ""):
+            return None
+        try:
+            return float(estado_sensor.state)
+        except (ValueError, TypeError):
+            return None
+
+    def leer_importacion():
+        """Potencia que ve el ICP: importación neta de red (negativa al exportar) o el consumo."""
+        return potencia_neta(
+            leer_potencia(sensor_potencia),
+            leer_potencia(sensor_produccion),
+            leer_potencia(sensor_red),
+        )
+
+    def limite_efectivo(ahora, reactivar=False):
+        """Límite con el que se compara la potencia instantánea.
+
+        Sin maxímetro es el del horario. Con maxímetro es la potencia que aún se
+        puede mantener hasta el final del cuarto de hora sin que la media supere el
+        límite: superarla equivale a que la proyección de la ventana lo supere. Para
+        reactivar se usa además el límite del horario como tope, porque lo que se
+        encienda seguirá encendido en la ventana siguiente.
+        """
+        limite = horario.limite(ahora)
+        if not maximetro:
+            return limite
+        admisible = round(ventana_demanda.admisible(ahora.timestamp(), limite), 1)
+        return min(admisible, limite) if reactivar else admisible
+
+    def consumo_unidad(entity_id):
+        """Consumo actual de una unidad (suma de los miembros conocidos si es un grupo)."""
+        if not es_grupo(entity_id):
+            return leer_potencia(sensor_potencia_de(entity_id))
+        lecturas = [leer_potencia(sensor_potencia_de(m)) for m in grupos[entity_id]]
+        lecturas = [l for l in lecturas if l is not None]
+        return sum(lecturas) if lecturas else None
+
+    def objetivo(entity_id):
+        """entity_id para la llamada de servicio (la lista de miembros si es un grupo)."""
+        return list(grupos[entity_id]) if es_grupo(entity_id) else entity_id
+
+    def consumo_registrado(info):
+        """Consumo guardado al apagar (float para switches, dict para climates)."""
+        if isinstance(info, dict):
+            return info.get("consumo", 0) or 0
+        return info or 0
+
+    def escalon_registrado(info):
+        """Escalón aplicado a un dispositivo de la lista de apagados."""
+        if isinstance(info, dict):
+            return info.get("escalon", ESCALON_APAGADO)
+        return ESCALON_APAGADO
+
+    def limitador_id(entity_id):
+        """entity_id de la entidad de bloqueo asociada a un dispositivo o grupo."""
+        return f"{DOMAIN}.limitador_bloqueo_{entity_id.replace('.', '_')}"
+
+    def limitador_de(entity_id):
+        """Estado de la entidad de bloqueo asociada a un dispositivo."""
+        return hass.states.get(limitador_id(entity_id))
+
+    def escalones_climate(estado):
+        """Escalones de reducción disponibles para un climate según sus capacidades."""
+        escalones = []
+        if escalonado_climate and estado is not None:
+            atributos = estado.attributes
+            if grados_reduccion > 0 and estado.state in ("heat", "cool") and atributos.get("temperature") is not None:
+                escalones.append(ESCALON_CONSIGNA)
+            if "eco" in (atributos.get("preset_modes") or []) or "low" in (atributos.get("fan_modes") or []):
+                escalones.append(ESCALON_ECO)
+        escalones.append(ESCALON_APAGADO)
+        return tuple(escalones)
+
+    def escalones_unidad(entity_id, estado):
+        """Escalera de un climate: la guardada al reducirlo o la de sus capacidades."""
+        info = apagados.get(entity_id)
+        if isinstance(info, dict) and "escalones" in info:
+            return tuple(info["escalones"])
+        return escalones_climate(estado)
+
+    def instantanea(potencia_actual, potencia_max, excluidos=()):
+        """Construye la instantánea inmutable que consume el planificador.
+
+        Los dispositivos con el disyuntor abierto o en ``excluidos`` (fallidos en
+        esta pasada) se marcan como no disponibles para que se salten.
+        """
+        dispositivos = []
+        for entity_id in unidades:
+            estados = [hass.states.get(m) for m in grupos.get(entity_id, (entity_id,))]
+            estado = estados[0]
+            disponible = (
+                all(e is not None and e.state not in ("unknown", "unavailable") for e in estados)
+                and entity_id not in excluidos
+                and disyuntores.disponible(entity_id)
+            )
+            if entity_id.startswith("climate."):
+                encendido = disponible and estado.state != "off"
+                escalones = escalones_unidad(entity_id, estado)
+            else:
+                # Un grupo está encendido si lo está cualquiera de sus miembros
+                encendido = disponible and any(e.state == STATE_ON for e in estados)
+                escalones = (ESCALON_APAGADO,)
+            if entity_id not in apagados:
+                escalon = ESCALON_NINGUNO
+            else:
+                escalon = escalon_registrado(apagados[entity_id])
+            dispositivos.append(Dispositivo(
+                entity_id, encendido, consumo_unidad(entity_id), disponible,
+                escalon, escalones
+            ))
+        bloqueos = set()
+        for entity_id in apagados:
+            limitador_state = limitador_de(entity_id)
+            if limitador_state is not None and limitador_state.state != "off":
+                bloqueos.add(entity_id)
+        return Instantanea(
+            potencia=potencia_actual,
+            potencia_max=potencia_max,
+            dispositivos=tuple(dispositivos),
+            apagados=tuple((e, consumo_registrado(i)) for e, i in apagados.items()),
+            bloqueados=frozenset(bloqueos),
+            invertir_orden=invertir_orden,
+        )
+
+    async def actuar(entity_id, dominio, servicio, datos_servicio, apagando=False, si_timeout=False):
+        """Llama al servicio con timeout y reintentos y actualiza el disyuntor.
+
+        Al apagar (por encima del límite) se hace un solo intento corto para pasar
+        enseguida al siguiente candidato; cada intento fallido cuenta para el disyuntor.
+
+        Un timeout no es un fallo seguro: la orden puede aplicarse igualmente. Se
+        devuelve ``si_timeout`` (lo que supone quien llama) y el estado real del
+        dispositivo se comprueba más tarde en ``verificar_inciertos``.
+        """
+        opciones = {"timeout": TIMEOUT_APAGADO, "reintentos": REINTENTOS_APAGADO} if apagando else {}
+        try:
+            await llamar_servicio(
+                hass, dominio, servicio, datos_servicio,
+                al_fallar=lambda err: disyuntores.fallo(entity_id, err), **opciones
+            )
+        except TimeoutActuacion as err:
+            _LOGGER.warning(f"⏳ {entity_id} no confirma {dominio}.{servicio}, se comprobará su estado: {err}")
+            por_verificar[entity_id] = dt_util.now().timestamp()
+            return si_timeout
+        except ErrorActuacion as err:
+            _LOGGER.error(f"❌ {entity_id} no responde a {dominio}.{servicio}: {err}")
+            return False
+        disyuntores.exito(entity_id)
+        return True
+
+    def info_climate(estado, accion):
+        """Estado de un climate a guardar antes de reducirlo o apagarlo."""
+        atributos = estado.attributes if estado else {}
+        hvac_mode = atributos.get("hvac_mode") or (estado.state if estado else None)
+        return {
+            "hvac_mode": hvac_mode,
+            "temperature": atributos.get("temperature"),
+            "preset_mode": atributos.get("preset_mode"),
+            "fan_mode": atributos.get("fan_mode"),
+            "consumo": accion.consumo_total,
+            "escalon": ESCALON_NINGUNO,
+            "escalones": list(escalones_climate(estado)),
+        }
+
+    async def ajustar_escalon(entity_id, info, hasta, tras_encender=False):
+        """Lleva un climate encendido al estado del escalón ``hasta`` (0, consigna o eco).
+
+        Los escalones son acumulativos: el escalón eco mantiene también la consigna
+        reducida. Tras encender un climate apagado (``tras_encender``) se aplica o se
+        restaura explícitamente cada escalón disponible.
+        """
+        escalones = info.get("escalones", [ESCALON_APAGADO])
+        desde = ESCALON_APAGADO if tras_encender else info.get("escalon", ESCALON_NINGUNO)
+        apagando = hasta > desde  # Reducir es parte del apagado: un solo intento corto
+        ok = True
+
+        if ESCALON_ECO in escalones:
+            eco_antes = desde >= ESCALON_ECO
+            eco_despues = hasta >= ESCALON_ECO
+            if eco_despues and (tras_encender or not eco_antes):
+                estado = hass.states.get(entity_id)
+                if estado is not None and "eco" in (estado.attributes.get("preset_modes") or []):
+                    info["eco_via"] = "preset"
+                    ok &= await actuar(entity_id, "climate", "set_preset_mode", {"entity_id": entity_id, "preset_mode": "eco"}, apagando=apagando, si_timeout=True)
+                else:
+                    info["eco_via"] = "fan"
+                    ok &= await actuar(entity_id, "climate", "set_fan_mode", {"entity_id": entity_id, "fan_mode": "low"}, apagando=apagando, si_timeout=True)
+            elif not eco_despues and (tras_encender or eco_antes):
+                if info.get("eco_via") == "preset" and info.get("preset_mode"):
+                    ok &= await actuar(entity_id, "climate", "set_preset_mode", {"entity_id": entity_id, "preset_mode": info["preset_mode"]}, apagando=apagando, si_timeout=True)
+                elif info.get("eco_via") == "fan" and info.get("fan_mode"):
+                    ok &= await actuar(entity_id, "climate", "set_fan_mode", {"entity_id": entity_id, "fan_mode": info["fan_mode"]}, apagando=apagando, si_timeout=True)
+
+        if ESCALON_CONSIGNA in escalones and info.get("temperature") is not None:
+            consigna_antes = desde >= ESCALON_CONSIGNA
+            consigna_despues = hasta >= ESCALON_CONSIGNA
+            if consigna_despues and (tras_encender or not consigna_antes):
+                signo = 1 if info.get("hvac_mode") == "cool" else -1
+                temperatura = info["temperature"] + signo * grados_reduccion
+                ok &= await actuar(entity_id, "climate", "set_temperature", {"entity_id": entity_id, "temperature": temperatura}, apagando=apagando, si_timeout=True)
+            elif not consigna_despues and (tras_encender or consigna_antes):
+                ok &= await actuar(entity_id, "climate", "set_temperature", {"entity_id": entity_id, "temperature": info["temperature"]}, apagando=apagando, si_timeout=True)
+
+        if ok:
+            info["escalon"] = hasta
+            _guardar_escalon(hass, entry.entry_id, entity_id, info)
+        return ok
+
+    async def ejecutar_reduccion(accion, potencia_disparo, potencia_max):
+        """Ejecuta una acción REDUCIR (consigna o eco) sobre un climate encendido."""
+        entity_id = accion.entity_id
+        nuevo = entity_id not in apagados
+        if nuevo:
+            apagados[entity_id] = info_climate(hass.states.get(entity_id), accion)
+        info = apagados[entity_id]
+
+        _LOGGER.info(f"🟠 Reduciendo {entity_id} al escalón {accion.escalon} (recupera ~{accion.consumo}W)...")
+        await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=True, estado_personalizado=info["hvac_mode"])
+        if not await ajustar_escalon(entity_id, info, accion.escalon):
+            if nuevo:
+                apagados.pop(entity_id, None)
+                await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
+            return False
+
+        hass.bus.async_fire(
+            "limitador_consumo_climate_reducido",
+            {
+                "climate": entity_id,
+                "escalon": accion.escalon,
+                "razon": accion.razon,
+                "potencia_actual": potencia_disparo,
+                "potencia_max": potencia_max
+            }
+        )
+        hass.bus.async_fire(
+            "logbook_entry",
+            {
+                "name": "Limitador de Consumo",
+                "message": f"Reducido {entity_id} (escalón {accion.escalon}): Potencia excedida ({potencia_disparo}W > {potencia_max}W)",
+                "entity_id": entity_id,
+                "domain": "climate"
+            },
+            context=Context()
+        )
+        return True
+
+    async def ejecutar_apagado(accion, potencia_disparo, potencia_max):
+        """Ejecuta una acción APAGAR del planificador.
+
+        Returns:
+            True si el dispositivo se apagó (o la orden superó el timeout: se da por
+            apagado y se comprueba después); False si falló (se deshace el bloqueo y
+            no se registra como apagado).
+        """
+        if accion.tipo != APAGAR:
+            return await ejecutar_reduccion(accion, potencia_disparo, potencia_max)
+        entity_id = accion.entity_id
+        domain = entity_id.split(".")[0]
+        estado = hass.states.get(entity_id)
+        tipo = {"climate": "climate", "grupo": "grupo"}.get(domain, "interruptor")
+
+        nuevo = entity_id not in apagados  # Un climate reducido ya tiene su estado guardado
+        if domain == "climate":
+            if nuevo:
+                apagados[entity_id] = info_climate(estado, accion)
+            hvac_mode_actual = apagados[entity_id]["hvac_mode"]
+            evento = {"climate": entity_id}
+        else:
+            hvac_mode_actual = None
+            apagados[entity_id] = accion.consumo_total
+            if domain == "grupo":
+                evento = {"grupo": entity_id, "entidades": objetivo(entity_id)}
+            else:
+                evento = {"switch": entity_id}
+
+        _LOGGER.info(f"🔴 Apagando {entity_id} (consumo {accion.consumo}W)...")
+        # Activar bloqueo del dispositivo ANTES de apagar (climates: guardando el hvac_mode)
+        await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=True, estado_personalizado=hvac_mode_actual)
+        if domain == "climate":
+            apagado = await actuar(
+                entity_id, "climate", "set_hvac_mode", {"entity_id": entity_id, "hvac_mode": "off"},
+                apagando=True, si_timeout=True
+            )
+        else:
+            # Un grupo se apaga con una sola llamada a todos sus miembros
+            apagado = await actuar(
+                entity_id, "switch", "turn_off", {"entity_id": objetivo(entity_id)}, apagando=True, si_timeout=True
+            )
+        if not apagado:
+            if nuevo:
+                apagados.pop(entity_id, None)
+                await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
+            return False
+        if domain == "climate":
+            apagados[entity_id]["escalon"] = ESCALON_APAGADO
+            _guardar_escalon(hass, entry.entry_id, entity_id, apagados[entity_id])
+
+        evento.update({
+            "razon": accion.razon,
+            "potencia_actual": potencia_disparo,
+            "potencia_max": potencia_max
+        })
+        hass.bus.async_fire(f"limitador_consumo_{domain}_off", evento)
+        if notificaciones_activadas:
+            await hass.services.async_call(
+                "persistent_notification", "create",
+                {
+                    "title": "Limitador de Consumo",
+                    "message": (
+                        f"El {tipo} {entity_id} ha sido apagado por la integración "
+                        f"porque la potencia ({potencia_disparo}W) superó el límite ({potencia_max}W)."
+                    )
+                },
+                blocking=False
+            )
+        # Crear entrada en logbook con contexto propio
+        hass.bus.async_fire(
+            "logbook_entry",
+            {
+                "name": "Limitador de Consumo",
+                "message": f"Apagado {entity_id}: Potencia excedida ({potencia_disparo}W > {potencia_max}W)",
+                "entity_id": limitador_id(entity_id) if domain == "grupo" else entity_id,
+                "domain": "switch" if domain == "grupo" else domain
+            },
+            context=Context()
+        )
+        _LOGGER.info(f"  ✅ {entity_id} apagado")
+        return True
+
+    def registrar_en_sombra(tipo, accion):
+        """Pasa al motor en sombra una acción ejecutada por el limitador real."""
+        sombra = datos.get("sombra")
+        if sombra is None:
+            return
+        entity_id = accion.entity_id
+        # Apagados, reducciones y subidas de escalón se emparejan por escalón de destino
+        escalon = escalon_registrado(apagados[entity_id]) if entity_id in apagados else ESCALON_NINGUNO
+        sombra.registrar_real(
+            dt_util.now().timestamp(), tipo, entity_id, escalon, consumo_registrado(apagados.get(entity_id))
+        )
+
     @callback
     async def control_consumo(now):
-        valor_potencia = hass.states.get(sensor_potencia)
-        if (
-            valor_potencia is None
-            or valor_potencia.state in (None, "unknown", "unavailable", "")
-        ):
+        potencia_actual = leer_importacion()
+        if potencia_actual is None:
             return
 
-        try:
-            potencia_actual = float(valor_potencia.state)
-        except (ValueError, TypeError):
-            return
+        potencia_max = limite_efectivo(dt_util.now())
 
-        # Log cada verificación (reducido a debug para no llenar logs)
-        _LOGGER.debug(f"⚡ control_consumo - Potencia: {potencia_actual}W / {potencia_max}W")
-        
-        # Apagar switches/climates si la potencia supera el límite
-        # Apagar dispositivos en cascada si el consumo sigue siendo mayor al límite
-        import asyncio
+        # Log cada verificación (debug y con formato diferido para no llenar logs)
+        _LOGGER.debug("⚡ control_consumo - Potencia: %sW / %sW", potencia_actual, potencia_max)
+
+        # Apagar dispositivos en cascada mientras la potencia estimada supere el límite:
+        # se ejecuta la primera acción planificada, se espera y se vuelve a planificar
+        # Un dispositivo que no responde se excluye y se pasa al siguiente sin esperar
+        potencia_disparo = potencia_actual  # Guardar el valor de disparo
+        fallidos = set()
+        await verificar_inciertos()
+        if potencia_actual > potencia_max:
+            # Tras un reinicio, un climate ya reducido no debe volver a guardarse como original
+            recuperar_apagados()
         while potencia_actual > potencia_max:
-            _LOGGER.warning(f"🚨 EXCESO DE POTENCIA: {potencia_actual}W > {potencia_max}W - Iniciando apagado")
-            apagado = False
-            potencia_disparo = potencia_actual  # Guardar el valor de disparo
-            for entity_id in switches:
-                estado = hass.states.get(entity_id)
-                domain = entity_id.split(".")[0]
-                _LOGGER.debug(f"  🔍 Evaluando {entity_id}: estado={estado.state if estado else 'None'}, domain={domain}")
-                if estado is not None:
-                    if domain == "climate":
-                        if estado.state != "off" and entity_id not in apagados:
-                            # Verificar si tiene sensor de potencia asignado
-                            climate_power_sensor = climate_sensors.get(entity_id)
-                            consumo_climate = 0
-                            
-                            if climate_power_sensor:
-                                estado_sensor = hass.states.get(climate_power_sensor)
-                                if estado_sensor and estado_sensor.state not in (None, "unknown", "unavailable", ""):
-                                    try:
-                                        consumo_climate = float(estado_sensor.state)
-                                        _LOGGER.info(f"  📊 Climate {entity_id} consumo actual: {consumo_climate}W")
-                                    except (ValueError, TypeError):
-                                        pass
-                            
-                            hvac_mode_actual = estado.attributes.get("hvac_mode")
-                            apagados[entity_id] = {
-                                "hvac_mode": hvac_mode_actual,
-                                "temperature": estado.attributes.get("temperature"),
-                                "preset_mode": estado.attributes.get("preset_mode"),
-                                "fan_mode": estado.attributes.get("fan_mode"),
-                                "consumo": consumo_climate
-                            }
-                            hass.bus.async_fire(
-                                "limitador_consumo_climate_off",
-                                {
-                                    "climate": entity_id,
-                                    "razon": "potencia_superior_al_limite",
-                                    "potencia_actual": potencia_disparo,
-                                    "potencia_max": potencia_max
-                                }
-                            )
-                            if notificaciones_activadas:
-                                await hass.services.async_call(
-                                    "persistent_notification", "create",
-                                    {
-                                        "title": "Limitador de Consumo",
-                                        "message": (
-                                            f"El climate {entity_id} ha sido apagado por la integración "
-                                            f"porque la potencia ({potencia_disparo}W) superó el límite ({potencia_max}W)."
-                                        )
-                                    },
-                                    blocking=False
-                                )
-                            # Activar bloqueo del dispositivo ANTES de apagar, pasando el hvac_mode
-                            await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=True, estado_personalizado=hvac_mode_actual)
-                            await hass.services.async_call(
-                                "climate", "set_hvac_mode", 
-                                {"entity_id": entity_id, "hvac_mode": "off"},
-                                blocking=True
-                            )
-                            # Crear entrada en logbook con contexto propio
-                            from homeassistant.core import Context
-                            hass.bus.async_fire(
-                                "logbook_entry",
-                                {
-                                    "name": f"Limitador de Consumo",
-                                    "message": f"Apagado {entity_id}: Potencia excedida ({potencia_disparo}W > {potencia_max}W)",
-                                    "entity_id": entity_id,
-                                    "domain": "climate"
-                                },
-                                context=Context()
-                            )
-                            apagado = True
-                            await asyncio.sleep(20)
-                            break
-                    elif domain == "switch":
-                        if estado.state == STATE_ON and entity_id not in apagados:
-                            switch_name = entity_id.split(".", 1)[1]
-                            sensor_name = f"sensor.{switch_name}_potencia"
-                            estado_sensor = hass.states.get(sensor_name)
-                            consumo_dispositivo = 0
-                            if estado_sensor and estado_sensor.state not in (None, "unknown", "unavailable", ""):
-                                try:
-                                    consumo = float(estado_sensor.state)
-                                    apagados[entity_id] = consumo
-                                    consumo_dispositivo = consumo
-                                    potencia_actual -= consumo
-                                except (ValueError, TypeError):
-                                    apagados[entity_id] = 0
-                            else:
-                                apagados[entity_id] = 0
-                            hass.bus.async_fire(
-                                "limitador_consumo_switch_off",
-                                {
-                                    "switch": entity_id,
-                                    "razon": "potencia_superior_al_limite",
-                                    "potencia_actual": potencia_disparo,
-                                    "potencia_max": potencia_max
-                                }
-                            )
-                            if notificaciones_activadas:
-                                await hass.services.async_call(
-                                    "persistent_notification", "create",
-                                    {
-                                        "title": "Limitador de Consumo",
-                                        "message": (
-                                            f"El interruptor {entity_id} ha sido apagado por la integración "
-                                            f"porque la potencia ({potencia_disparo}W) superó el límite ({potencia_max}W)."
-                                        )
-                                    },
-                                    blocking=False
-                                )
-                            # Activar bloqueo del dispositivo ANTES de apagar
-                            _LOGGER.info(f"🔴 Apagando switch {entity_id}...")
-                            await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=True)
-                            _LOGGER.info(f"  📡 Llamando a switch.turn_off para {entity_id}")
-                            await hass.services.async_call(
-                                "switch", "turn_off", 
-                                {"entity_id": entity_id},
-                                blocking=True
-                            )
-                            # Crear entrada en logbook con contexto propio
-                            from homeassistant.core import Context
-                            hass.bus.async_fire(
-                                "logbook_entry",
-                                {
-                                    "name": f"Limitador de Consumo",
-                                    "message": f"Apagado {entity_id}: Potencia excedida ({potencia_disparo}W > {potencia_max}W)",
-                                    "entity_id": entity_id,
-                                    "domain": "switch"
-                                },
-                                context=Context()
+            snapshot = instantanea(potencia_actual, potencia_max, fallidos)
+            acciones = planificar_apagado(snapshot)
+            if not acciones:
+                # Si no se puede apagar ningún dispositivo, salir del bucle
+                _LOGGER.debug("Sin dispositivos que apagar: %sW / %sW", potencia_actual, potencia_max)
+                break
+            _LOGGER.warning("🚨 EXCESO DE POTENCIA: %sW > %sW - Iniciando apagado", potencia_actual, potencia_max)
+            if not await ejecutar_apagado(acciones[0], potencia_disparo, potencia_max):
+                diario.registrar(APAGADO, snapshot, acciones[0], FALLIDA)
+                fallidos.add(acciones[0].entity_id)
+                continue
+            diario.registrar(APAGADO, snapshot, acciones[0], EJECUTADA)
+            registrar_en_sombra(APAGADO, acciones[0])
+            muestreo["ultimo_apagado"] = dt_util.now().timestamp()
+            potencia_actual -= acciones[0].consumo
+            await asyncio.sleep(20)
+            if datos["generacion"] != generacion:
+                break  # Opciones cambiadas: sigue la pasada con la configuración nueva
+
+    def modo_a_restaurar(entity_id, limitador_state, apagado_info):
+        """hvac_mode con el que reactivar un climate (None si no hay ninguno válido)."""
+        modo_restaurar = None
+        # Primero intentar obtener el hvac_mode del limitador (heat, cool, etc.)
+        if limitador_state and limitador_state.state not in ("on", "off"):
+            modo_restaurar = limitador_state.state
+        # Si no está en el limitador, buscar en apagados
+        if not modo_restaurar:
+            modo_restaurar = apagado_info.get("hvac_mode") if isinstance(apagado_info, dict) else None
+        # Si no hay modo guardado, elegir uno de los modos disponibles del climate
+        if not modo_restaurar or modo_restaurar == "off":
+            estado_climate = hass.states.get(entity_id)
+            if estado_climate and hasattr(estado_climate, 'attributes'):
+                modos_disponibles = estado_climate.attributes.get("hvac_modes", [])
+                if "heat" in modos_disponibles:
+                    modo_restaurar = "heat"
+                elif "cool" in modos_disponibles:
+                    modo_restaurar = "cool"
+                elif "heat_cool" in modos_disponibles:
+                    modo_restaurar = "heat_cool"
+                elif len(modos_disponibles) > 1:  # Tiene al menos un modo además de 'off'
+                    modo_restaurar = [m for m in modos_disponibles if m != "off"][0]
+        if modo_restaurar == "off":
+            return None
+        return modo_restaurar
+
+    async def ejecutar_encendido(accion, potencia_actual, potencia_max):
+        """Ejecuta una acción ENCENDER del planificador.
+
+        Returns:
+            True si el dispositivo queda encendido, False si no se pudo reactivar
+            (si no respondió sigue bloqueado y en la lista de apagados).
+        """
+        entity_id = accion.entity_id
+        apagado_info = apagados[entity_id]
+
+        if entity_id.startswith("climate.") and isinstance(apagado_info, dict) \
+                and apagado_info.get("escalon", ESCALON_APAGADO) != ESCALON_APAGADO:
+            # Climate reducido (sigue encendido): subir un escalón
+            _LOGGER.info(f"  ▶️ Restaurando {entity_id} al escalón {accion.escalon}")
+            if not await ajustar_escalon(entity_id, apagado_info, accion.escalon):
+                return False
+            if accion.tipo == ENCENDER:
+                apagados.pop(entity_id)
+                await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
+                hass.bus.async_fire(
+                    "limitador_consumo_climate_on",
+                    {
+                        "climate": entity_id,
+                        "razon": "reactivacion",
+                        "potencia_actual": potencia_actual,
+                        "potencia_max": potencia_max
+                    }
+                )
+            return True
+
+        if entity_id.startswith("climate."):
+            modo_restaurar = modo_a_restaurar(entity_id, limitador_de(entity_id), apagado_info)
+            if not modo_restaurar:
+                # No hay modo válido para restaurar, eliminar de apagados
+                _LOGGER.info(f"  ⏭️ Climate {entity_id} sin modo válido para restaurar, removiendo de lista")
+                apagados.pop(entity_id)
+                return False
+
+            _LOGGER.info(f"  ▶️ Reactivando climate {entity_id} a modo {modo_restaurar}")
+            # Desactivar bloqueo del dispositivo ANTES de encender (si vuelve a un escalón
+            # intermedio de la escalera sigue bloqueado)
+            if accion.tipo == ENCENDER:
+                await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
+            if not await actuar(entity_id, "climate", "set_hvac_mode", {"entity_id": entity_id, "hvac_mode": modo_restaurar}):
+                # Sin respuesta: volver a bloquear y dejarlo en apagados para otra pasada
+                await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=True, estado_personalizado=modo_restaurar)
+                if isinstance(apagado_info, dict):
+                    _guardar_escalon(hass, entry.entry_id, entity_id, apagado_info)
+                return False
+            # Crear entrada en logbook con contexto propio
+            hass.bus.async_fire(
+                "logbook_entry",
+                {
+                    "name": "Limitador de Consumo",
+                    "message": f"Encendido {entity_id}: Potencia disponible ({potencia_actual}W / {potencia_max}W)",
+                    "entity_id": entity_id,
+                    "domain": "climate"
+                },
+                context=Context()
+            )
+            # Esperar a que el estado cambie
+            restaurado = False
+            for _ in range(5):
+                await asyncio.sleep(1)
+                estado_actual = hass.states.get(entity_id)
+                if estado_actual and estado_actual.state != "off":
+                    restaurado = True
+                    break
+            if not restaurado:
+                apagados.pop(entity_id)
+                if notificaciones_activadas:
+                    await hass.services.async_call(
+                        "persistent_notification", "create",
+                        {
+                            "title": "Limitador de Consumo",
+                            "message": (
+                                f"El climate {entity_id} no pudo ser encendido correctamente."
                             )
-                            _LOGGER.info(f"  ✅ Switch {entity_id} apagado")
-                            apagado = True
-                            await asyncio.sleep(20)
-                            break
+                        },
+                        blocking=False
+                    )
+                if accion.tipo != ENCENDER:
+                    await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
+                _LOGGER.warning(f"  ❌ Climate {entity_id} no pudo ser reactivado")
+                return False
+            if accion.tipo != ENCENDER:
+                # Encendido en un escalón intermedio (eco/consigna): sigue controlado
+                await ajustar_escalon(entity_id, apagado_info, accion.escalon, tras_encender=True)
+                apagado_info["escalon"] = accion.escalon  # Encendido aunque falle algún ajuste
+                _guardar_escalon(hass, entry.entry_id, entity_id, apagado_info)
+                return True
+            apagados.pop(entity_id)
+            # Restaurar otros atributos si es necesario
+            if isinstance(apagado_info, dict) and "escalones" in apagado_info:
+                await ajustar_escalon(entity_id, apagado_info, ESCALON_NINGUNO, tras_encender=True)
+            elif isinstance(apagado_info, dict) and apagado_info.get("temperature") is not None:
+                await actuar(entity_id, "climate", "set_temperature", {"entity_id": entity_id, "temperature": apagado_info["temperature"]})
+            hass.bus.async_fire(
+                "limitador_consumo_climate_on",
+                {
+                    "climate": entity_id,
+                    "razon": "reactivacion",
+                    "potencia_actual": potencia_actual,
+                    "potencia_max": potencia_max
+                }
+            )
+            if notificaciones_activadas:
+                await hass.services.async_call(
+                    "persistent_notification", "create",
+                    {
+                        "title": "Limitador de Consumo",
+                        "message": (
+                            f"El climate {entity_id} ha sido encendido por la integración y restaurado a su estado previo."
+                        )
+                    },
+                    blocking=False
+                )
+            _LOGGER.info(f"  ✅ Climate {entity_id} reactivado correctamente")
+            return True
+
+        # Switch o grupo de switches
+        consumo_apagado = accion.consumo
+        tipo = "grupo" if es_grupo(entity_id) else "interruptor"
+        if accion.razon == RAZON_SIN_SENSOR:
+            mensaje = (f"El {tipo} {entity_id} ha sido encendido por la integración "
+                       f"porque no tiene sensor de potencia propio.")
+            logbook = f"Encendido {entity_id}: Hay margen de potencia ({potencia_actual}W < 80% de {potencia_max}W)"
+        else:
+            mensaje = (f"El {tipo} {entity_id} ha sido encendido por la integración "
+                       f"porque la potencia ({potencia_actual}W + {consumo_apagado}W) permite reactivarlo.")
+            logbook = f"Encendido {entity_id}: Potencia disponible ({potencia_actual}W + {consumo_apagado}W ≤ {potencia_max}W)"
+        _LOGGER.info(f"  ▶️ Reactivando {entity_id} ({accion.razon}, {potencia_actual}W + {consumo_apagado}W / {potencia_max}W)")
+        # Desactivar bloqueo del dispositivo ANTES de encender
+        await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
+        if not await actuar(entity_id, "switch", "turn_on", {"entity_id": objetivo(entity_id)}):
+            # Sin respuesta: volver a bloquear y dejarlo en apagados para otra pasada
+            await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=True)
+            return False
+        if es_grupo(entity_id):
+            evento = {"grupo": entity_id, "entidades": objetivo(entity_id)}
+        else:
+            evento = {"switch": entity_id}
+        evento.update({
+            "razon": accion.razon,
+            "potencia_actual": potencia_actual,
+            "potencia_max": potencia_max
+        })
+        hass.bus.async_fire("limitador_consumo_grupo_on" if es_grupo(entity_id) else "limitador_consumo_switch_on", evento)
+        if notificaciones_activadas:
+            await hass.services.async_call(
+                "persistent_notification", "create",
+                {"title": "Limitador de Consumo", "message": mensaje},
+                blocking=False
+            )
+        # Crear entrada en logbook con contexto propio
+        hass.bus.async_fire(
+            "logbook_entry",
+            {
+                "name": "Limitador de Consumo",
+                "message": logbook,
+                "entity_id": limitador_id(entity_id) if es_grupo(entity_id) else entity_id,
+                "domain": "switch"
+            },
+            context=Context()
+        )
+        _LOGGER.info(f"  ✅ {'Grupo' if es_grupo(entity_id) else 'Switch'} {entity_id} reactivado")
+        apagados.pop(entity_id)
+        return True
+
+    async def verificar_inciertos():
+        """Comprueba el estado real de los dispositivos cuya orden superó el timeout.
+
+        Se espera ``ESPERA_VERIFICACION`` segundos para dar tiempo a que la orden se
+        aplique. Si un dispositivo registrado como apagado está encendido (el apagado
+        no llegó a aplicarse o el encendido sí), deja de controlarse: se restaura el
+        estado guardado si es un climate y se quita el bloqueo. Si sigue apagado, se
+        queda como está (apagado o pendiente de reactivar).
+        """
+        ahora = dt_util.now().timestamp()
+        for entity_id, instante in list(por_verificar.items()):
+            if ahora - instante < ESPERA_VERIFICACION:
+                continue
+            del por_verificar[entity_id]
+            info = apagados.get(entity_id)
+            if entity_id not in apagados or escalon_registrado(info) != ESCALON_APAGADO:
+                continue  # Ya reactivado, o un climate reducido (sigue encendido igualmente)
+            estados = [hass.states.get(m) for m in grupos.get(entity_id, (entity_id,))]
+            if any(e is None or e.state in ("unknown", "unavailable") for e in estados):
+                por_verificar[entity_id] = instante  # Sin estado fiable: se vuelve a mirar
+                continue
+            if all(e.state == "off" for e in estados):
+                continue
+            _LOGGER.warning(f"⚠️ {entity_id} está encendido aunque el limitador lo registró como apagado: deja de controlarse")
+            if isinstance(info, dict) and "escalones" in info:
+                await ajustar_escalon(entity_id, info, ESCALON_NINGUNO, tras_encender=True)
+            apagados.pop(entity_id, None)
+            await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
+
+    def recuperar_apagados():
+        """Añade a apagados los dispositivos con limitador activo que no están en memoria.
+
+        Puede pasar después de un reinicio de HA: el bloqueo se restaura pero la lista
+        de apagados en memoria está vacía. Los climates recuperan el estado original y
+        el escalón guardados en los atributos de la entidad de bloqueo, así que también
+        se recuperan los que siguen encendidos en un escalón reducido.
+        """
+        for entity_id in unidades:
+            if entity_id in apagados:
+                continue
+            limitador_state = limitador_de(entity_id)
+            # El limitador está activo si no es "off" (puede ser "on", "heat", "cool", etc.)
+            if not limitador_state or limitador_state.state == "off":
+                continue
+            # Un grupo cuenta como apagado si lo están todos sus miembros
+            estados = [hass.states.get(m) for m in grupos.get(entity_id, (entity_id,))]
+            apagado = all(e and e.state == "off" for e in estados)
+            consumo = consumo_unidad(entity_id) or 0
+            if entity_id.startswith("climate."):
+                guardado = {k: limitador_state.attributes[k] for k in CLAVES_ESCALON if k in limitador_state.attributes}
+                info = {"consumo": consumo, **guardado}
+                if "hvac_mode" not in info and limitador_state.state != "on":
+                    # Para climate, guardar el hvac_mode del limitador si está disponible
+                    info["hvac_mode"] = limitador_state.state
+                reducido = (
+                    estados[0] is not None and estados[0].state not in ("off", "unknown", "unavailable")
+                    and info.get("escalon", ESCALON_NINGUNO) not in (ESCALON_NINGUNO, ESCALON_APAGADO)
+                )
+                if apagado:
+                    # Sin escalones guardados solo queda el apagado (nada que restaurar por pasos)
+                    info["escalon"] = ESCALON_APAGADO
+                    info.setdefault("escalones", [ESCALON_APAGADO])
+                elif not reducido:
+                    continue
+                _LOGGER.warning(
+                    f"⚠️ Climate {entity_id} encontrado con limitador activo (escalón {info['escalon']}) "
+                    f"pero no en lista de apagados (posible reinicio)"
+                )
+                apagados[entity_id] = info
+                continue
             if not apagado:
-                # Si no se pudo apagar ningún dispositivo, salir del bucle
-                break
+                continue
+            _LOGGER.warning(f"⚠️ Dispositivo {entity_id} encontrado con limitador activo pero no en lista de apagados (posible reinicio)")
+            apagados[entity_id] = consumo
 
     async def reactivar_dispositivos(now):
-        _LOGGER.info(f"🔄 INICIO reactivar_dispositivos - Timestamp: {now}")
-        valor_potencia = hass.states.get(sensor_potencia)
-        if (
-            valor_potencia is None
-            or valor_potencia.state in (None, "unknown", "unavailable", "")
-        ):
-            _LOGGER.warning(f"⚠️ Sensor de potencia no disponible: {sensor_potencia}")
+        potencia_actual = leer_importacion()
+        if potencia_actual is None:
+            _LOGGER.debug("⚠️ Sensor de potencia no disponible: %s", sensor_potencia)
             return
+        if fotovoltaica:
+            # Con producción solar se reactiva con el peor valor de la ventana reciente,
+            # para que una nube que pasa no provoque encender y volver a apagar
+            pico = envolvente_red.maximo(dt_util.now().timestamp())
+            if pico is not None and pico > potencia_actual:
+                potencia_actual = pico
 
-        try:
-            potencia_actual = float(valor_potencia.state)
-        except (ValueError, TypeError):
-            _LOGGER.warning(f"⚠️ Error al convertir potencia: {valor_potencia.state}")
+        potencia_max = limite_efectivo(dt_util.now(), reactivar=True)
+
+        recuperar_apagados()
+        await verificar_inciertos()
+        if not apagados:
             return
 
-        _LOGGER.info(f"🔄 Verificando reactivación - Potencia actual: {potencia_actual}W / {potencia_max}W")
-        _LOGGER.info(f"📋 Dispositivos apagados en memoria: {list(apagados.keys())}")
-        _LOGGER.info(f"📋 Switches configurados: {switches}")
-        
-        # Primero verificar si hay dispositivos con limitador ON que no están en apagados
-        # (puede pasar después de un reinicio de HA)
-        _LOGGER.info(f"🔍 Verificando {len(switches)} dispositivos para detectar limitadores ON")
-        for entity_id in switches:
-            device_name = entity_id.replace(".", "_")
-            limitador_entity_id = f"{DOMAIN}.limitador_bloqueo_{device_name}"
-            limitador_state = hass.states.get(limitador_entity_id)
-            
-            _LOGGER.debug(f"   - {entity_id}: limitador={limitador_state.state if limitador_state else 'None'}")
-            
-            # El limitador está activo si no es "off" (puede ser "on", "heat", "cool", etc.)
-            if limitador_state and limitador_state.state != "off":
-                estado_dispositivo = hass.states.get(entity_id)
-                _LOGGER.info(f"🔴 Limitador activo ({limitador_state.state}) para {entity_id}, estado dispositivo: {estado_dispositivo.state if estado_dispositivo else 'None'}")
-                if estado_dispositivo and estado_dispositivo.state == "off":
-                    # El limitador está activo y el dispositivo está OFF, pero no está en apagados
-                    if entity_id not in apagados:
-                        _LOGGER.warning(f"⚠️ Dispositivo {entity_id} encontrado con limitador activo pero no en lista de apagados (posible reinicio)")
-                        # Añadirlo a apagados sin información de consumo
-                        domain = entity_id.split(".")[0]
-                        if domain == "climate":
-                            # Para climate, guardar el hvac_mode del limitador y verificar sensor de potencia
-                            hvac_mode_guardado = limitador_state.state if limitador_state.state != "on" else None
-                            climate_power_sensor = climate_sensors.get(entity_id)
-                            consumo = 0
-                            if climate_power_sensor:
-                                # Leer el consumo del sensor
-                                estado_sensor = hass.states.get(climate_power_sensor)
-                                if estado_sensor and estado_sensor.state not in (None, "unknown", "unavailable", ""):
-                                    try:
-                                        consumo = float(estado_sensor.state)
-                                        _LOGGER.info(f"  📊 Climate {entity_id} consumo detectado: {consumo}W")
-                                    except (ValueError, TypeError):
-                                        pass
-                            
-                            # Guardar con hvac_mode si está disponible
-                            if hvac_mode_guardado:
-                                apagados[entity_id] = {"hvac_mode": hvac_mode_guardado, "consumo": consumo}
-                                _LOGGER.info(f"  🌡️ Climate {entity_id} modo guardado: {hvac_mode_guardado}")
-                            else:
-                                apagados[entity_id] = {"consumo": consumo}
-                        else:
-                            # Para switch, intentar leer el sensor de potencia
-                            switch_name = entity_id.split(".", 1)[1]
-                            sensor_name = f"sensor.{switch_name}_potencia"
-                            estado_sensor = hass.states.get(sensor_name)
-                            if estado_sensor and estado_sensor.state not in (None, "unknown", "unavailable", ""):
-                                try:
-                                    consumo = float(estado_sensor.state)
-                                    apagados[entity_id] = consumo
-                                except (ValueError, TypeError):
-                                    apagados[entity_id] = 0
-                            else:
-                                apagados[entity_id] = 0
-
-        # Intentar reactivar switches apagados si el consumo lo permite
-        switches_apagados = list(apagados.keys())
-        # El orden invertido solo se aplica al reactivar
-        if invertir_orden:
-            switches_apagados = list(reversed(switches_apagados))
-        
-        _LOGGER.info(f"🔍 Intentando reactivar {len(switches_apagados)} dispositivos")
-        
-        for entity_id in switches_apagados:
-            # Verificar si el limitador de bloqueo está activo (ON)
-            device_name = entity_id.replace(".", "_")
-            limitador_entity_id = f"{DOMAIN}.limitador_bloqueo_{device_name}"
-            limitador_state = hass.states.get(limitador_entity_id)
-            
-            _LOGGER.debug(f"  📌 Procesando {entity_id}: limitador={limitador_state.state if limitador_state else 'None'}")
-            
-            # Solo intentar reactivar si el limitador está activo (no "off")
-            # Para switches será "on", para climates será "heat", "cool", etc.
-            if limitador_state is None or limitador_state.state == "off":
-                _LOGGER.debug(f"  ⏭️ Saltando {entity_id} - limitador no está activo")
-                continue
-            
-            estado = hass.states.get(entity_id)
-            domain = entity_id.split(".")[0]
-            apagado_info = apagados[entity_id]
-            
-            _LOGGER.debug(f"  🔍 {entity_id}: estado={estado.state if estado else 'None'}, domain={domain}, info={apagado_info}")
-            
-            if estado is not None and estado.state == "off":
-                if domain == "climate":
-                    # Verificar si tiene sensor de potencia asignado
-                    climate_power_sensor = climate_sensors.get(entity_id)
-                    puede_reactivar = True
-                    
-                    if climate_power_sensor:
-                        # Tiene sensor de potencia, verificar si hay potencia disponible
-                        consumo_climate = apagado_info if isinstance(apagado_info, (int, float)) else apagado_info.get("consumo", 0)
-                        _LOGGER.info(f"  🌡️ Climate {entity_id} tiene sensor {climate_power_sensor}, consumo={consumo_climate}W")
-                        
-                        if consumo_climate > 0:
-                            # Verificar potencia disponible
-                            if potencia_actual + consumo_climate > potencia_max:
-                                puede_reactivar = False
-                                _LOGGER.info(f"  ⏸️ {entity_id} NO reactivado - no hay potencia ({potencia_actual}W + {consumo_climate}W > {potencia_max}W)")
-                        else:
-                            # Sin consumo registrado, usar margen del 80%
-                            margen_80 = potencia_max * 0.8
-                            if potencia_actual >= margen_80:
-                                puede_reactivar = False
-                                _LOGGER.info(f"  ⏸️ {entity_id} NO reactivado - potencia alta ({potencia_actual}W >= {margen_80}W)")
-                    else:
-                        # Sin sensor de potencia: reactivar solo si hay margen suficiente (80%)
-                        margen_80 = potencia_max * 0.8
-                        _LOGGER.info(f"  🌡️ Climate {entity_id} sin sensor de potencia - Potencia actual: {potencia_actual}W, Margen 80%: {margen_80}W")
-                        if potencia_actual >= margen_80:
-                            puede_reactivar = False
-                            _LOGGER.info(f"  ⏸️ {entity_id} NO reactivado - potencia alta ({potencia_actual}W >= {margen_80}W)")
-                    
-                    if not puede_reactivar:
-                        continue  # No reactivar ahora, intentar en la próxima iteración
-                    
-                    # Restaurar estado previo del climate
-                    service_data = {"entity_id": entity_id}
-                    
-                    # Primero intentar obtener el hvac_mode del limitador
-                    modo_restaurar = None
-                    if limitador_state and limitador_state.state not in ("on", "off"):
-                        # El limitador tiene un hvac_mode guardado (heat, cool, etc.)
-                        modo_restaurar = limitador_state.state
-                        _LOGGER.info(f"  🌡️ Usando modo del limitador: {modo_restaurar}")
-                    
-                    # Si no está en el limitador, buscar en apagados
-                    if not modo_restaurar:
-                        modo_restaurar = apagado_info.get("hvac_mode") if isinstance(apagado_info, dict) else None
-                    
-                    # Si no hay modo guardado, intentar obtenerlo del estado actual
-                    if not modo_restaurar or modo_restaurar == "off":
-                        estado_climate = hass.states.get(entity_id)
-                        if estado_climate and hasattr(estado_climate, 'attributes'):
-                            # Intentar con el último modo conocido o usar 'heat' por defecto
-                            modos_disponibles = estado_climate.attributes.get("hvac_modes", [])
-                            if "heat" in modos_disponibles:
-                                modo_restaurar = "heat"
-                            elif "cool" in modos_disponibles:
-                                modo_restaurar = "cool"
-                            elif "heat_cool" in modos_disponibles:
-                                modo_restaurar = "heat_cool"
-                            elif len(modos_disponibles) > 1:  # Tiene al menos un modo además de 'off'
-                                modo_restaurar = [m for m in modos_disponibles if m != "off"][0]
-                    
-                    _LOGGER.info(f"  🌡️ Climate {entity_id}: modo_restaurar={modo_restaurar}, apagado_info={apagado_info}")
-                    
-                    if modo_restaurar and modo_restaurar != "off":
-                        _LOGGER.info(f"  ▶️ Reactivando climate {entity_id} a modo {modo_restaurar}")
-                        service_data["hvac_mode"] = modo_restaurar
-                        # Desactivar bloqueo del dispositivo ANTES de encender
-                        await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
-                        await hass.services.async_call(
-                            "climate", "set_hvac_mode", service_data,
-                            blocking=True
-                        )
-                        # Crear entrada en logbook con contexto propio
-                        from homeassistant.core import Context
-                        hass.bus.async_fire(
-                            "logbook_entry",
-                            {
-                                "name": f"Limitador de Consumo",
-                                "message": f"Encendido {entity_id}: Potencia disponible ({potencia_actual}W / {potencia_max}W)",
-                                "entity_id": entity_id,
-                                "domain": "climate"
-                            },
-                            context=Context()
-                        )
-                        # Esperar a que el estado cambie
-                        import asyncio
-                        restaurado = False
-                        for _ in range(5):
-                            await asyncio.sleep(1)
-                            estado_actual = hass.states.get(entity_id)
-                            if estado_actual and estado_actual.state != "off":
-                                restaurado = True
-                                break
-                        # Restaurar otros atributos si es necesario
-                        if restaurado:
-                            if apagado_info.get("temperature") is not None:
-                                await hass.services.async_call(
-                                    "climate", "set_temperature", {"entity_id": entity_id, "temperature": apagado_info["temperature"]},
-                                    blocking=True
-                                )
-                            hass.bus.async_fire(
-                                "limitador_consumo_climate_on",
-                                {
-                                    "climate": entity_id,
-                                    "razon": "reactivacion",
-                                    "potencia_actual": potencia_actual,
-                                    "potencia_max": potencia_max
-                                }
-                            )
-                            if notificaciones_activadas:
-                                await hass.services.async_call(
-                                    "persistent_notification", "create",
-                                    {
-                                        "title": "Limitador de Consumo",
-                                        "message": (
-                                            f"El climate {entity_id} ha sido encendido por la integración y restaurado a su estado previo."
-                                        )
-                                    },
-                                    blocking=False
-                                )
-                            _LOGGER.info(f"  ✅ Climate {entity_id} reactivado correctamente")
-                            apagados.pop(entity_id)
-                            break  # Salir del bucle, solo reactiva uno a la vez
-                        else:
-                            if notificaciones_activadas:
-                                await hass.services.async_call(
-                                    "persistent_notification", "create",
-                                    {
-                                        "title": "Limitador de Consumo",
-                                        "message": (
-                                            f"El climate {entity_id} no pudo ser encendido correctamente."
-                                        )
-                                    },
-                                    blocking=False
-                                )
-                            _LOGGER.warning(f"  ❌ Climate {entity_id} no pudo ser reactivado")
-                            apagados.pop(entity_id)
-                            continue  # No se pudo reactivar, continuar con el siguiente
-                    else:
-                        # No hay modo válido para restaurar, eliminar de apagados
-                        _LOGGER.info(f"  ⏭️ Climate {entity_id} sin modo válido para restaurar, removiendo de lista")
-                        apagados.pop(entity_id)
-                        continue  # Continuar con el siguiente dispositivo
-                else:
-                    # Switch: verificar si hay suficiente potencia para reactivar
-                    consumo_apagado = apagado_info
-                    _LOGGER.info(f"  🔌 Switch {entity_id}: consumo={consumo_apagado}W, potencia_actual={potencia_actual}W")
-                    
-                    if consumo_apagado == 0 or consumo_apagado is None:
-                        # Sin sensor de potencia: reactivar solo si hay margen suficiente
-                        margen_80 = potencia_max * 0.8
-                        _LOGGER.info(f"    Sin sensor - Potencia actual: {potencia_actual}W, Margen 80%: {margen_80}W")
-                        if potencia_actual < margen_80:
-                            _LOGGER.info(f"  ▶️ Reactivando {entity_id} (sin sensor, hay margen)")
-                            hass.bus.async_fire(
-                                "limitador_consumo_switch_on",
-                                {
-                                    "switch": entity_id,
-                                    "razon": "sin_sensor_potencia",
-                                    "potencia_actual": potencia_actual,
-                                    "potencia_max": potencia_max
-                                }
-                            )
-                            if notificaciones_activadas:
-                                await hass.services.async_call(
-                                    "persistent_notification", "create",
-                                    {
-                                        "title": "Limitador de Consumo",
-                                        "message": (
-                                            f"El interruptor {entity_id} ha sido encendido por la integración "
-                                            f"porque no tiene sensor de potencia propio."
-                                        )
-                                    },
-                                    blocking=False
-                                )
-                            # Desactivar bloqueo del dispositivo ANTES de encender
-                            await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
-                            await hass.services.async_call(
-                                "switch", "turn_on", {"entity_id": entity_id},
-                                blocking=True
-                            )
-                            # Crear entrada en logbook con contexto propio
-                            from homeassistant.core import Context
-                            hass.bus.async_fire(
-                                "logbook_entry",
-                                {
-                                    "name": f"Limitador de Consumo",
-                                    "message": f"Encendido {entity_id}: Hay margen de potencia ({potencia_actual}W < 80% de {potencia_max}W)",
-                                    "entity_id": entity_id,
-                                    "domain": "switch"
-                                },
-                                context=Context()
-                            )
-                            _LOGGER.info(f"  ✅ Switch {entity_id} reactivado")
-                            apagados.pop(entity_id)
-                            break  # Reactivado, salir del bucle
-                        else:
-                            _LOGGER.info(f"  ⏸️ {entity_id} NO reactivado - potencia alta ({potencia_actual}W >= {margen_80}W)")
-                            continue  # No hay margen, continuar con el siguiente
-                    elif potencia_actual + consumo_apagado <= potencia_max:
-                        # Con sensor: verificar que hay suficiente potencia
-                        _LOGGER.info(f"  ▶️ Reactivando {entity_id} (con sensor, {potencia_actual}W + {consumo_apagado}W <= {potencia_max}W)")
-                        hass.bus.async_fire(
-                            "limitador_consumo_switch_on",
-                            {
-                                "switch": entity_id,
-                                "razon": "potencia_dentro_del_limite",
-                                "potencia_actual": potencia_actual,
-                                "potencia_max": potencia_max
-                            }
-                        )
-                        if notificaciones_activadas:
-                            await hass.services.async_call(
-                                "persistent_notification", "create",
-                                {
-                                    "title": "Limitador de Consumo",
-                                    "message": (
-                                        f"El interruptor {entity_id} ha sido encendido por la integración "
-                                        f"porque la potencia ({potencia_actual}W + {consumo_apagado}W) permite reactivarlo."
-                                    )
-                                },
-                                blocking=False
-                            )
-                        # Desactivar bloqueo del dispositivo ANTES de encender
-                        await _gestionar_bloqueo_dispositivo(hass, entry.entry_id, entity_id, bloquear=False)
-                        await hass.services.async_call(
-                            "switch", "turn_on", {"entity_id": entity_id},
-                            blocking=True
-                        )
-                        # Crear entrada en logbook con contexto propio
-                        from homeassistant.core import Context
-                        hass.bus.async_fire(
-                            "logbook_entry",
-                            {
-                                "name": f"Limitador de Consumo",
-                                "message": f"Encendido {entity_id}: Potencia disponible ({potencia_actual}W + {consumo_apagado}W ≤ {potencia_max}W)",
-                                "entity_id": entity_id,
-                                "domain": "switch"
-                            },
-                            context=Context()
-                        )
-                        _LOGGER.info(f"  ✅ Switch {entity_id} reactivado")
-                        apagados.pop(entity_id)
-                        break  # Reactivado, salir del bucle
-                    else:
-                        _LOGGER.info(f"  ⏸️ {entity_id} NO reactivado - no hay potencia suficiente ({potencia_actual}W + {consumo_apagado}W > {potencia_max}W)")
-                        continue  # No hay potencia, continuar con el siguiente
-        
-        _LOGGER.info(f"✅ FIN reactivar_dispositivos - Dispositivos restantes en apagados: {list(apagados.keys())}")
+        _LOGGER.debug(
+            "🔄 Verificando reactivación - Potencia actual: %sW / %sW, apagados: %s",
+            potencia_actual, potencia_max, apagados.keys()
+        )
 
-    # Programa la comprobación periódica para apagar y reactivar
-    hass.data["limitador_consumo"][entry.entry_id]["listener_desactivar"] = async_track_time_interval(
-        hass, control_consumo, timedelta(seconds=intervalo_desactivacion)
-    )
-    hass.data["limitador_consumo"][entry.entry_id]["listener_activar"] = async_track_time_interval(
+        # Reactivar como mucho un dispositivo; si uno no responde, se pasa al siguiente.
+        # Cada acción intentada queda en el diario (descargable desde el diagnóstico)
+        fallidos = set()
+        while True:
+            snapshot = instantanea(potencia_actual, potencia_max, fallidos)
+            acciones = planificar_reactivacion(snapshot)
+            if not acciones:
+                break
+            if await ejecutar_encendido(acciones[0], potencia_actual, potencia_max):
+                diario.registrar(REACTIVACION, snapshot, acciones[0], EJECUTADA)
+                registrar_en_sombra(REACTIVACION, acciones[0])
+                break
+            diario.registrar(REACTIVACION, snapshot, acciones[0], FALLIDA)
+            fallidos.add(acciones[0].entity_id)
+
+    # Programa la comprobación periódica para reactivar (la de apagado es adaptativa, más abajo)
+    datos["listener_activar"] = async_track_time_interval(
         hass, reactivar_dispositivos, timedelta(seconds=intervalo_activacion)
     )
     
-    _LOGGER.info(f"✅ Listeners registrados - control_consumo cada {intervalo_desactivacion}s, reactivar_dispositivos cada {intervalo_activacion}s")
+    # Cambios de límite según horario: lanzar una pasada en el mismo instante del cambio
+    limite_anterior = (datos.get("limite") or {}).get("actual")  # Si se está reconfigurando
+    estado_limite = {"actual": potencia_max, "cancelar": None}
+    datos["limite"] = estado_limite
 
-    return True
+    def programar_cambio_limite(desde):
+        siguiente = horario.siguiente_cambio(dt_util.as_local(desde))
+        if siguiente is not None:
+            estado_limite["cancelar"] = async_track_point_in_time(hass, cambio_limite, siguiente)
+
+    @callback
+    def cambio_limite(now):
+        anterior = estado_limite["actual"]
+        nuevo = horario.limite(dt_util.as_local(now))
+        estado_limite["actual"] = nuevo
+        programar_cambio_limite(now)
+        if nuevo == anterior:
+            return
+        _LOGGER.info(f"⏰ Cambio de límite de potencia: {anterior}W -> {nuevo}W")
+        if nuevo < anterior:
+            hass.async_create_task(control_consumo(now))
+        else:
+            hass.async_create_task(reactivar_dispositivos(now))
+
+    programar_cambio_limite(dt_util.now())
+    if limite_anterior is not None and potencia_max < limite_anterior:
+        # Reconfigurado con un límite menor: comprobar ya, sin esperar al intervalo
+        hass.async_create_task(control_consumo(dt_util.now()))
+
+    # Comprobación de apagado con cadencia adaptativa (ver muestreo.py): más frecuente y
+    # con lectura forzada del contador cerca del límite o tras un apagado, más espaciada lejos
+    sensores_contador = [s for s in (sensor_potencia, sensor_produccion, sensor_red) if s]
+    muestreo = {
+        "cancelar": None,
+        "proxima": None,
+        "intervalo": intervalo_desactivacion,
+        "refrescar": False,
+        "en_curso": False,
+        "ultima": None,  # Instante en que terminó la última evaluación
+        "ultimo_apagado": (datos.get("muestreo") or {}).get("ultimo_apagado"),
+    }
+    datos["muestreo"] = muestreo
+
+    async def refrescar_contador():
+        """Pide una lectura nueva a los sensores principales (contadores que informan poco)."""
+        try:
+            await llamar_servicio(
+                hass, "homeassistant", "update_entity", {"entity_id": sensores_contador},
+                timeout=5, reintentos=0
+            )
+        except ErrorActuacion as err:
+            _LOGGER.debug("No se pudo refrescar el contador: %s", err)
+
+    def programar_evaluacion(cuando):
+        if muestreo["cancelar"]:
+            muestreo["cancelar"]()
+        muestreo["proxima"] = cuando
+        muestreo["cancelar"] = async_track_point_in_time(hass, evaluar_consumo, cuando)
+
+    def cancelar_evaluacion():
+        if muestreo["cancelar"]:
+            muestreo["cancelar"]()
+            muestreo["cancelar"] = None
+
+    def reprogramar_evaluacion():
+        """Programa la siguiente comprobación con la cadencia según la cercanía al límite."""
+        ahora = dt_util.now()
+        try:
+            ultimo = muestreo["ultimo_apagado"]
+            asentando = ultimo is not None and ahora.timestamp() - ultimo < ASENTAMIENTO
+            intervalo, muestreo["refrescar"] = cadencia(
+                leer_importacion(), limite_efectivo(ahora), intervalo_desactivacion, banda_muestreo, asentando
+            )
+        except Exception:  # Sin cadencia calculable se vuelve a la fija
+            _LOGGER.exception("❌ Error al calcular la cadencia de comprobación")
+            intervalo = intervalo_desactivacion
+        if intervalo != muestreo["intervalo"]:
+            _LOGGER.debug("⏱️ Cadencia de comprobación: %ss", intervalo)
+        muestreo["intervalo"] = intervalo
+        programar_evaluacion(ahora + timedelta(seconds=intervalo))
+
+    async def evaluar_consumo(now):
+        muestreo["cancelar"] = None
+        muestreo["en_curso"] = True
+        try:
+            if muestreo["refrescar"]:
+                await refrescar_contador()
+            await control_consumo(now)
+        except Exception:  # Un fallo en una pasada no debe detener las comprobaciones
+            _LOGGER.exception("❌ Error al evaluar el consumo")
+        finally:
+            muestreo["en_curso"] = False
+            muestreo["ultima"] = dt_util.now().timestamp()
+            # Siempre hay siguiente comprobación, salvo si se reconfiguró o descargó durante la pasada
+            if datos["generacion"] == generacion:
+                reprogramar_evaluacion()
+
+    programar_evaluacion(dt_util.now() + timedelta(seconds=intervalo_desactivacion))
+    datos["listener_desactivar"] = cancelar_evaluacion
+
+    # Contabilidad de sobrecarga: integrar el exceso sobre el límite en cada lectura
+    contador_sobrecarga = datos["sobrecarga"]
+
+    @callback
+    def lectura_contador(event):
+        potencia = leer_importacion()
+        ahora = dt_util.now()
+        if fotovoltaica:
+            envolvente_red.anadir(ahora.timestamp(), potencia)
+        if maximetro:
+            ventana_demanda.actualizar(ahora.timestamp(), potencia)
+        if contador_sobrecarga.actualizar(ahora.timestamp(), ahora.date(), potencia, horario.limite(ahora)):
+            async_dispatcher_send(hass, SIGNAL_SOBRECARGA.format(entry.entry_id))
+        limite = limite_efectivo(ahora)
+        # Lectura dentro de la banda con la siguiente comprobación lejos: adelantarla
+        if cerca_del_limite(potencia, limite, banda_muestreo) and not muestreo["en_curso"]:
+            intervalo = 0 if potencia > limite else cadencia(
+                potencia, limite, intervalo_desactivacion, banda_muestreo
+            )[0]
+            intervalo = intervalo_adelantado(ahora.timestamp(), intervalo, muestreo["ultima"])
+            cuando = ahora + timedelta(seconds=intervalo)
+            if muestreo["proxima"] is None or cuando < muestreo["proxima"]:
+                programar_evaluacion(cuando)
+    datos["listener_contador"] = async_track_state_change_event(
+        hass, sensores_contador, lectura_contador
+    )
+
+    @callback
+    def medianoche(now):
+        """Reinicia los contadores diarios de sobrecarga aunque no llegue ninguna lectura."""
+        ahora = dt_util.as_local(now)
+        if contador_sobrecarga.nuevo_dia(ahora.timestamp(), ahora.date()):
+            async_dispatcher_send(hass, SIGNAL_SOBRECARGA.format(entry.entry_id))
+    datos["listener_medianoche"] = async_track_time_change(hass, medianoche, hour=0, minute=0, second=0)
+
+    @callback
+    def registro_actualizado(event):
+        """Refrescar el mapeo de sensores solo cuando cambian los registros."""
+        entity_id = event.data.get("entity_id")
+        if entity_id is not None and not (entity_id.startswith("sensor.") or entity_id in switches):
+            return
+        actualizar_sensores_dispositivos()
+        _LOGGER.debug("Sensores de dispositivos actualizados tras cambio en el registro")
+
+    datos["listener_registros"] = [
+        hass.bus.async_listen(er.EVENT_ENTITY_REGISTRY_UPDATED, registro_actualizado),
+        hass.bus.async_listen(dr.EVENT_DEVICE_REGISTRY_UPDATED, registro_actualizado),
+    ]
+
+    # Motor en sombra: evalúa una configuración candidata con los mismos eventos, sin actuar
+    datos["sombra"] = sombra = None
+    try:
+        cambios_sombra = normalizar_sombra(config.get(CONF_SOMBRA))
+        if cambios_sombra:
+            sombra = MotorSombra(
+                config, cambios_sombra,
+                {e: s["power"] for e, s in sensores_dispositivos.items() if s.get("power")},
+                dt_util.now().timestamp(),
+                dt_util.DEFAULT_TIME_ZONE,
+            )
+    except ValueError as err:
+        _LOGGER.error(f"❌ Configuración en sombra no válida, no se evalúa: {err}")
+    if sombra is not None:
+        datos["sombra"] = sombra
+        ahora = dt_util.now().timestamp()
+        for entity_id in sombra.entidades():
+            estado = hass.states.get(entity_id)
+            sombra.evento(ahora, entity_id, estado.state if estado else None)
+        def escalones_sombra():
+            """Escalera de cada climate, la misma que usa el limitador real."""
+            return {e: escalones_unidad(e, hass.states.get(e)) for e in unidades if e.startswith("climate.")}
+
+        # Lo que el limitador real ya mantiene apagado o reducido
+        sombra.apagados_reales({e: (consumo_registrado(i), escalon_registrado(i)) for e, i in apagados.items()})
+        sombra.escalones(escalones_sombra())
+        ultimo_resumen = {}
+
+        @callback
+        def evento_sombra(event):
+            estado = event.data.get("new_state")
+            sombra.evento(
+                dt_util.now().timestamp(), event.data["entity_id"], estado.state if estado else None
+            )
+
+        @callback
+        def avanzar_sombra(now):
+            sombra.escalones(escalones_sombra())  # Las capacidades de un climate pueden cambiar
+            sombra.avanzar(now.timestamp())
+            resumen = sombra.resumen()
+            if resumen != ultimo_resumen:
+                ultimo_resumen.clear()
+                ultimo_resumen.update(resumen)
+                async_dispatcher_send(hass, SIGNAL_SOMBRA.format(entry.entry_id))
+
+        datos["listener_sombra"] = [
+            async_track_state_change_event(hass, sombra.entidades(), evento_sombra),
+            async_track_time_interval(hass, avanzar_sombra, timedelta(seconds=INTERVALO_SOMBRA)),
+        ]
+        _LOGGER.info(f"  👥 Motor en sombra activo con: {cambios_sombra}")
+    async_dispatcher_send(hass, SIGNAL_SOMBRA.format(entry.entry_id))
+
+    _LOGGER.info(f"✅ Listeners registrados - control_consumo cada {intervalo_desactivacion}s, reactivar_dispositivos cada {intervalo_activacion}s")
 
 async def async_unload_entry(hass, entry):
     """Descargar una entrada de configuración."""
     # Cancelar los listeners
-    if "listener_desactivar" in hass.data["limitador_consumo"][entry.entry_id]:
-        hass.data["limitador_consumo"][entry.entry_id]["listener_desactivar"]()
-    if "listener_activar" in hass.data["limitador_consumo"][entry.entry_id]:
-        hass.data["limitador_consumo"][entry.entry_id]["listener_activar"]()
+    _cancelar_listeners(hass.data["limitador_consumo"][entry.entry_id])
+    await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     
     # Descargar el componente de entidades si existe
     component_key = f"{DOMAIN}_entities"
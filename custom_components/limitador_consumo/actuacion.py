@@ -0,0 +1,133 @@
+"""Actuación sobre dispositivos con timeout, reintentos y disyuntor por dispositivo."""
+import asyncio
+import logging
+import time
+
+from homeassistant.exceptions import HomeAssistantError
+
+_LOGGER = logging.getLogger(__name__)
+
+TIMEOUT_ACTUACION = 10  # Segundos máximos por llamada a servicio
+REINTENTOS = 2  # Reintentos tras el primer intento fallido
+ESPERA_REINTENTO = 1  # Segundos antes del primer reintento (se duplica en cada uno)
+# Al apagar se está por encima del límite: un intento corto y se pasa al siguiente
+TIMEOUT_APAGADO = 3
+REINTENTOS_APAGADO = 0
+ESPERA_VERIFICACION = 30  # Segundos tras un timeout antes de comprobar el estado real
+UMBRAL_FALLOS = 3  # Intentos fallidos seguidos para abrir el disyuntor
+ENFRIAMIENTO = 300  # Segundos que el disyuntor permanece abierto
+
+
+class ErrorActuacion(HomeAssistantError):
+    """El dispositivo no respondió tras agotar los reintentos."""
+
+
+class TimeoutActuacion(ErrorActuacion):
+    """Algún intento superó el timeout: el dispositivo puede haberlo ejecutado igualmente.
+
+    ``asyncio.wait_for`` solo deja de esperar; la orden puede seguir su curso (p. ej.
+    en un dispositivo en la nube) y aplicarse después.
+    """
+
+
+async def llamar_servicio(
+    hass, dominio, servicio, datos, timeout=TIMEOUT_ACTUACION, reintentos=REINTENTOS, al_fallar=None
+):
+    """Llama a un servicio bloqueante con timeout y reintentos con espera exponencial.
+
+    ``al_fallar(error)`` se llama en cada intento fallido (p. ej. para el disyuntor).
+
+    Raises:
+        TimeoutActuacion: si todos los intentos fallan y alguno superó el timeout
+        ErrorActuacion: si todos los intentos fallan con error de Home Assistant
+    """
+    ultimo_error = None
+    hubo_timeout = False
+    for intento in range(reintentos + 1):
+        if intento:
+            await asyncio.sleep(ESPERA_REINTENTO * 2 ** (intento - 1))
+        try:
+            await asyncio.wait_for(
+                hass.services.async_call(dominio, servicio, datos, blocking=True),
+                timeout
+            )
+            return
+        except (asyncio.TimeoutError, HomeAssistantError) as err:
+            ultimo_error = err
+            hubo_timeout |= isinstance(err, asyncio.TimeoutError)
+            # str() de un TimeoutError es vacío
+            error = str(err) or "timeout"
+            if al_fallar:
+                al_fallar(error)
+            _LOGGER.warning(
+                "⚠️ %s.%s (%s) falló en el intento %s/%s: %s",
+                dominio, servicio, datos.get("entity_id"), intento + 1, reintentos + 1, error
+            )
+    excepcion = TimeoutActuacion if hubo_timeout else ErrorActuacion
+    raise excepcion(f"{dominio}.{servicio} sin respuesta para {datos.get('entity_id')}") from ultimo_error
+
+
+class DisyuntorDispositivos:
+    """Disyuntor (circuit breaker) por dispositivo.
+
+    Tras ``umbral`` intentos fallidos seguidos el dispositivo queda excluido de la
+    planificación durante ``enfriamiento`` segundos. Pasado ese tiempo se permite un
+    nuevo intento (semiabierto): si funciona se cierra, si falla se vuelve a abrir.
+    """
+
+    def __init__(self, umbral=UMBRAL_FALLOS, enfriamiento=ENFRIAMIENTO):
+        """Inicializar el disyuntor."""
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self._fallos = {}  # entity_id -> fallos seguidos
+        self._abierto_hasta = {}  # entity_id -> instante (monotonic) de reapertura
+        self._ultimo_error = {}
+
+    def disponible(self, entity_id, ahora=None):
+        """True si el dispositivo puede actuarse (cerrado o semiabierto)."""
+        hasta = self._abierto_hasta.get(entity_id)
+        if hasta is None:
+            return True
+        return (ahora if ahora is not None else time.monotonic()) >= hasta
+
+    def exito(self, entity_id):
+        """Registra una actuación correcta y cierra el disyuntor."""
+        if entity_id in self._fallos or entity_id in self._abierto_hasta:
+            if entity_id in self._abierto_hasta:
+                _LOGGER.info("🔌 Disyuntor cerrado para %s", entity_id)
+            self._fallos.pop(entity_id, None)
+            self._abierto_hasta.pop(entity_id, None)
+            self._ultimo_error.pop(entity_id, None)
+
+    def fallo(self, entity_id, error=None, ahora=None):
+        """Registra un intento fallido; abre el disyuntor al alcanzar el umbral."""
+        ahora = ahora if ahora is not None else time.monotonic()
+        fallos = self._fallos.get(entity_id, 0) + 1
+        self._fallos[entity_id] = fallos
+        self._ultimo_error[entity_id] = str(error) if error else None
+        if fallos >= self.umbral:
+            self._abierto_hasta[entity_id] = ahora + self.enfriamiento
+            _LOGGER.warning(
+                "⛔ Disyuntor abierto para %s tras %s fallos seguidos (%ss)",
+                entity_id, fallos, self.enfriamiento
+            )
+
+    def diagnostico(self, ahora=None):
+        """Estado de los disyuntores para la descarga de diagnóstico."""
+        ahora = ahora if ahora is not None else time.monotonic()
+        resultado = {}
+        for entity_id in set(self._fallos) | set(self._abierto_hasta):
+            hasta = self._abierto_hasta.get(entity_id)
+            if hasta is None:
+                estado = "cerrado"
+            elif ahora < hasta:
+                estado = "abierto"
+            else:
+                estado = "semiabierto"
+            resultado[entity_id] = {
+                "estado": estado,
+                "fallos_seguidos": self._fallos.get(entity_id, 0),
+                "segundos_restantes": round(max(0.0, hasta - ahora), 1) if hasta else 0,
+                "ultimo_error": self._ultimo_error.get(entity_id),
+            }
+        return resultado
@@ -1,13 +1,55 @@
 from homeassistant import config_entries
 import voluptuous as vol
 from homeassistant.helpers import selector
-from .const import DOMAIN, CONF_POTENCIA, CONF_SENSOR, CONF_SWITCHES
+from .const import (
+    DOMAIN, CONF_POTENCIA, CONF_SENSOR, CONF_SWITCHES, CONF_SENSORES_POTENCIA, CONF_HORARIO_LIMITES,
+    CONF_ESCALONADO_CLIMATE, CONF_GRADOS_REDUCCION, CONF_SENSOR_PRODUCCION, CONF_SENSOR_RED,
+    CONF_GRUPOS, CONF_BANDA_MUESTREO, CONF_MAXIMETRO, CONF_SOMBRA,
+)
+from .dispositivos import buscar_sensor_del_dispositivo
+from .limites import HorarioLimites
+from .grupos import normalizar_grupos
+from .sombra import normalizar_sombra
 
 CONF_INTERVALO_DESACTIVACION = "intervalo_desactivacion"
 CONF_INTERVALO_ACTIVACION = "intervalo_activacion"
 CONF_INVERTIR_ORDEN = "invertir_orden_activacion"
 CONF_CLIMATE_SENSORS = "climate_power_sensors"  # Mapeo climate -> sensor de potencia
 
+# Selector de sensores de potencia (con búsqueda, no carga una lista completa en el formulario)
+SELECTOR_SENSOR_POTENCIA = {
+    "entity": {
+        "domain": "sensor",
+        "device_class": "power"
+    }
+}
+
+def _horario_valido(potencia, horario):
+    """Comprueba que el horario de límites se puede compilar."""
+    try:
+        HorarioLimites(potencia, horario)
+    except ValueError:
+        return False
+    return True
+
+def _grupos_validos(grupos, switches):
+    """Comprueba que los grupos solo contienen switches limitados, sin repetir."""
+    try:
+        normalizar_grupos(grupos, switches)
+    except ValueError:
+        return False
+    return True
+
+def _sombra_valida(cambios, potencia, switches):
+    """Comprueba los cambios de la configuración en sombra (opciones, horario y grupos)."""
+    try:
+        cambios = normalizar_sombra(cambios)
+        normalizar_grupos(cambios.get(CONF_GRUPOS), switches)
+        HorarioLimites(cambios.get(CONF_POTENCIA, potencia), cambios.get(CONF_HORARIO_LIMITES))
+    except ValueError:
+        return False
+    return True
+
 class LimitadorConsumoV3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
     
@@ -30,7 +72,11 @@ class LimitadorConsumoV3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     "device_class": "power"
                 }
             }),
+            vol.Optional(CONF_SENSOR_PRODUCCION): selector.selector(SELECTOR_SENSOR_POTENCIA),
+            vol.Optional(CONF_SENSOR_RED): selector.selector(SELECTOR_SENSOR_POTENCIA),
             vol.Required(CONF_INTERVALO_DESACTIVACION, default=32): vol.Coerce(int),
+            vol.Required(CONF_BANDA_MUESTREO, default=10): vol.Coerce(int),
+            vol.Required(CONF_MAXIMETRO, default=False): vol.Coerce(bool),
             vol.Required(CONF_INTERVALO_ACTIVACION, default=45): vol.Coerce(int),
             vol.Required(CONF_SWITCHES): selector.selector({
                 "entity": {
@@ -39,7 +85,12 @@ class LimitadorConsumoV3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 }
             }),
             vol.Required(CONF_INVERTIR_ORDEN, default=False): vol.Coerce(bool),
-            vol.Required("notificaciones_activadas", default=True): vol.Coerce(bool)
+            vol.Required("notificaciones_activadas", default=True): vol.Coerce(bool),
+            vol.Required(CONF_ESCALONADO_CLIMATE, default=False): vol.Coerce(bool),
+            vol.Required(CONF_GRADOS_REDUCCION, default=2): vol.Coerce(int),
+            vol.Optional(CONF_HORARIO_LIMITES): selector.selector({"object": {}}),
+            vol.Optional(CONF_GRUPOS): selector.selector({"object": {}}),
+            vol.Optional(CONF_SOMBRA): selector.selector({"object": {}})
         })
 
         if user_input is not None:
@@ -59,6 +110,16 @@ class LimitadorConsumoV3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 errors["base"] = "invalid_intervalo_desactivacion"
             elif intervalo_activacion is None or intervalo_activacion < 1:
                 errors["base"] = "invalid_intervalo_activacion"
+            elif not 0 <= user_input.get(CONF_BANDA_MUESTREO, 10) < 100:
+                errors["base"] = "invalid_banda"
+            elif not _horario_valido(potencia, user_input.get(CONF_HORARIO_LIMITES)):
+                errors["base"] = "invalid_horario"
+            elif user_input.get(CONF_GRADOS_REDUCCION, 2) < 0:
+                errors["base"] = "invalid_grados"
+            elif not _grupos_validos(user_input.get(CONF_GRUPOS), switches):
+                errors["base"] = "invalid_grupos"
+            elif not _sombra_valida(user_input.get(CONF_SOMBRA), potencia, switches):
+                errors["base"] = "invalid_sombra"
             else:
                 # Guardar datos y pasar al siguiente paso si hay climates
                 self.config_data = user_input
@@ -69,12 +130,9 @@ class LimitadorConsumoV3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 if climates:
                     return await self.async_step_climate_sensors()
                 else:
-                    # No hay climates, crear entrada directamente
+                    # No hay climates, pasar a los sensores del resto de dispositivos
                     self.config_data[CONF_CLIMATE_SENSORS] = {}
-                    return self.async_create_entry(
-                        title="Limitador de Consumo",
-                        data=self.config_data
-                    )
+                    return await self.async_step_power_sensors()
 
         return self.async_show_form(
             step_id="user",
@@ -97,23 +155,14 @@ class LimitadorConsumoV3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 if v and (v.strip() if isinstance(v, str) else True) and v.lower() != 'ninguno'
             }
             self.config_data[CONF_CLIMATE_SENSORS] = climate_sensors_map
-            return self.async_create_entry(
-                title="Limitador de Consumo",
-                data=self.config_data
-            )
-        
-        # Crear un campo para cada climate con opción 'ninguno'
-        # Obtener todos los sensores de potencia disponibles
-        power_sensors = []
-        for state in self.hass.states.async_all():
-            if state.domain == "sensor" and state.attributes.get("device_class") == "power":
-                power_sensors.append(state.entity_id)
+            return await self.async_step_power_sensors()
         
+        # Crear un campo para cada climate, sugiriendo el sensor de su mismo dispositivo
         schema_dict = {}
         for climate in climates:
-            # Lista de opciones: 'ninguno' + sensores disponibles
-            options = ["ninguno"] + power_sensors
-            schema_dict[vol.Optional(climate, default="ninguno")] = vol.In(options)
+            sugerido = buscar_sensor_del_dispositivo(self.hass, climate)
+            clave = vol.Optional(climate, description={"suggested_value": sugerido}) if sugerido else vol.Optional(climate)
+            schema_dict[clave] = selector.selector(SELECTOR_SENSOR_POTENCIA)
         
         return self.async_show_form(
             step_id="climate_sensors",
@@ -121,6 +170,29 @@ class LimitadorConsumoV3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             errors=errors
         )
 
+    async def async_step_power_sensors(self, user_input=None):
+        """Tercer paso: sensores de potencia explícitos para el resto de dispositivos (opcional)"""
+        switches = self.config_data.get(CONF_SWITCHES, [])
+        otros = [s for s in switches if not s.startswith("climate.")]
+
+        if user_input is not None or not otros:
+            # Vacío = detección automática por dispositivo en el registro
+            self.config_data[CONF_SENSORES_POTENCIA] = {k: v for k, v in (user_input or {}).items() if v}
+            return self.async_create_entry(
+                title="Limitador de Consumo",
+                data=self.config_data
+            )
+
+        schema_dict = {
+            vol.Optional(entity_id): selector.selector(SELECTOR_SENSOR_POTENCIA)
+            for entity_id in otros
+        }
+        return self.async_show_form(
+            step_id="power_sensors",
+            data_schema=vol.Schema(schema_dict),
+            errors={}
+        )
+
     def async_get_entry_title(self, data):
         potencia = data.get(CONF_POTENCIA, "N/A")
         sensor = data.get(CONF_SENSOR, "N/A")
@@ -146,11 +218,20 @@ class LimitadorConsumoV3OptionsFlowHandler(config_entries.OptionsFlow):
 
         current_potencia = self.config_entry.options.get(CONF_POTENCIA, self.config_entry.data.get(CONF_POTENCIA, 4.6))
         current_sensor = self.config_entry.options.get(CONF_SENSOR, self.config_entry.data.get(CONF_SENSOR, ""))
+        current_produccion = self.config_entry.options.get(CONF_SENSOR_PRODUCCION, self.config_entry.data.get(CONF_SENSOR_PRODUCCION))
+        current_red = self.config_entry.options.get(CONF_SENSOR_RED, self.config_entry.data.get(CONF_SENSOR_RED))
         current_switches = self.config_entry.options.get(CONF_SWITCHES, self.config_entry.data.get(CONF_SWITCHES, []))
         current_intervalo_desactivacion = self.config_entry.options.get(CONF_INTERVALO_DESACTIVACION, self.config_entry.data.get(CONF_INTERVALO_DESACTIVACION, 10))
         current_intervalo_activacion = self.config_entry.options.get(CONF_INTERVALO_ACTIVACION, self.config_entry.data.get(CONF_INTERVALO_ACTIVACION, 10))
+        current_banda = self.config_entry.options.get(CONF_BANDA_MUESTREO, self.config_entry.data.get(CONF_BANDA_MUESTREO, 10))
+        current_maximetro = self.config_entry.options.get(CONF_MAXIMETRO, self.config_entry.data.get(CONF_MAXIMETRO, False))
         current_invertir_orden = self.config_entry.options.get(CONF_INVERTIR_ORDEN, self.config_entry.data.get(CONF_INVERTIR_ORDEN, False))
         current_notificaciones = self.config_entry.options.get("notificaciones_activadas", self.config_entry.data.get("notificaciones_activadas", True))
+        current_horario = self.config_entry.options.get(CONF_HORARIO_LIMITES, self.config_entry.data.get(CONF_HORARIO_LIMITES))
+        current_grupos = self.config_entry.options.get(CONF_GRUPOS, self.config_entry.data.get(CONF_GRUPOS))
+        current_sombra = self.config_entry.options.get(CONF_SOMBRA, self.config_entry.data.get(CONF_SOMBRA))
+        current_escalonado = self.config_entry.options.get(CONF_ESCALONADO_CLIMATE, self.config_entry.data.get(CONF_ESCALONADO_CLIMATE, False))
+        current_grados = self.config_entry.options.get(CONF_GRADOS_REDUCCION, self.config_entry.data.get(CONF_GRADOS_REDUCCION, 2))
 
         schema = vol.Schema({
             vol.Required(CONF_POTENCIA, default=current_potencia): vol.Coerce(float),
@@ -160,7 +241,11 @@ class LimitadorConsumoV3OptionsFlowHandler(config_entries.OptionsFlow):
                     "device_class": "power"
                 }
             }),
+            vol.Optional(CONF_SENSOR_PRODUCCION, description={"suggested_value": current_produccion}): selector.selector(SELECTOR_SENSOR_POTENCIA),
+            vol.Optional(CONF_SENSOR_RED, description={"suggested_value": current_red}): selector.selector(SELECTOR_SENSOR_POTENCIA),
             vol.Required(CONF_INTERVALO_DESACTIVACION, default=current_intervalo_desactivacion): vol.Coerce(int),
+            vol.Required(CONF_BANDA_MUESTREO, default=current_banda): vol.Coerce(int),
+            vol.Required(CONF_MAXIMETRO, default=current_maximetro): vol.Coerce(bool),
             vol.Required(CONF_INTERVALO_ACTIVACION, default=current_intervalo_activacion): vol.Coerce(int),
             vol.Required(CONF_SWITCHES, default=current_switches): selector.selector({
                 "entity": {
@@ -169,7 +254,12 @@ class LimitadorConsumoV3OptionsFlowHandler(config_entries.OptionsFlow):
                 }
             }),
             vol.Required(CONF_INVERTIR_ORDEN, default=current_invertir_orden): vol.Coerce(bool),
-            vol.Required("notificaciones_activadas", default=current_notificaciones): vol.Coerce(bool)
+            vol.Required("notificaciones_activadas", default=current_notificaciones): vol.Coerce(bool),
+            vol.Required(CONF_ESCALONADO_CLIMATE, default=current_escalonado): vol.Coerce(bool),
+            vol.Required(CONF_GRADOS_REDUCCION, default=current_grados): vol.Coerce(int),
+            vol.Optional(CONF_HORARIO_LIMITES, description={"suggested_value": current_horario}): selector.selector({"object": {}}),
+            vol.Optional(CONF_GRUPOS, description={"suggested_value": current_grupos}): selector.selector({"object": {}}),
+            vol.Optional(CONF_SOMBRA, description={"suggested_value": current_sombra}): selector.selector({"object": {}})
         })
 
         if user_input is not None:
@@ -189,6 +279,16 @@ class LimitadorConsumoV3OptionsFlowHandler(config_entries.OptionsFlow):
                 errors["base"] = "invalid_intervalo_desactivacion"
             elif intervalo_activacion is None or intervalo_activacion < 1:
                 errors["base"] = "invalid_intervalo_activacion"
+            elif not 0 <= user_input.get(CONF_BANDA_MUESTREO, 10) < 100:
+                errors["base"] = "invalid_banda"
+            elif not _horario_valido(potencia, user_input.get(CONF_HORARIO_LIMITES)):
+                errors["base"] = "invalid_horario"
+            elif user_input.get(CONF_GRADOS_REDUCCION, 2) < 0:
+                errors["base"] = "invalid_grados"
+            elif not _grupos_validos(user_input.get(CONF_GRUPOS), switches):
+                errors["base"] = "invalid_grupos"
+            elif not _sombra_valida(user_input.get(CONF_SOMBRA), potencia, switches):
+                errors["base"] = "invalid_sombra"
             else:
                 # Guardar datos y pasar al siguiente paso si hay climates
                 self.options_data = user_input
@@ -196,9 +296,9 @@ class LimitadorConsumoV3OptionsFlowHandler(config_entries.OptionsFlow):
                 if climates:
                     return await self.async_step_climate_sensors()
                 else:
-                    # No hay climates, guardar opciones directamente
+                    # No hay climates, pasar a los sensores del resto de dispositivos
                     self.options_data[CONF_CLIMATE_SENSORS] = {}
-                    return self.async_create_entry(title="", data=self.options_data)
+                    return await self.async_step_power_sensors()
 
         return self.async_show_form(
             step_id="init",
@@ -222,32 +322,46 @@ class LimitadorConsumoV3OptionsFlowHandler(config_entries.OptionsFlow):
                 if v and (v.strip() if isinstance(v, str) else True) and v.lower() != 'ninguno'
             }
             self.options_data[CONF_CLIMATE_SENSORS] = climate_sensors_map
-            return self.async_create_entry(title="", data=self.options_data)
-        
-        # Crear un campo para cada climate con opción 'ninguno'
-        # Obtener todos los sensores de potencia disponibles
-        power_sensors = []
-        for state in self.hass.states.async_all():
-            if state.domain == "sensor" and state.attributes.get("device_class") == "power":
-                power_sensors.append(state.entity_id)
+            return await self.async_step_power_sensors()
         
+        # Crear un campo para cada climate: el sensor ya asignado o, si no hay,
+        # el sensor de potencia de su mismo dispositivo
         schema_dict = {}
         for climate in climates:
-            default_sensor = current_climate_sensors.get(climate, "ninguno")
-            # Si el default no está en las opciones, usar 'ninguno'
-            if default_sensor and default_sensor not in power_sensors:
-                # Verificar si el sensor existe aún
-                if self.hass.states.get(default_sensor) is None:
-                    default_sensor = "ninguno"
-            elif not default_sensor:
-                default_sensor = "ninguno"
-            
-            # Lista de opciones: 'ninguno' + sensores disponibles
-            options = ["ninguno"] + power_sensors
-            schema_dict[vol.Optional(climate, default=default_sensor)] = vol.In(options)
+            sugerido = current_climate_sensors.get(climate)
+            # Si el sensor asignado ya no existe, volver a sugerir por dispositivo
+            if sugerido and self.hass.states.get(sugerido) is None:
+                sugerido = None
+            if not sugerido:
+                sugerido = buscar_sensor_del_dispositivo(self.hass, climate)
+            clave = vol.Optional(climate, description={"suggested_value": sugerido}) if sugerido else vol.Optional(climate)
+            schema_dict[clave] = selector.selector(SELECTOR_SENSOR_POTENCIA)
         
         return self.async_show_form(
             step_id="climate_sensors",
             data_schema=vol.Schema(schema_dict),
             errors=errors
         )
+
+    async def async_step_power_sensors(self, user_input=None):
+        """Tercer paso: sensores de potencia explícitos para el resto de dispositivos (opcional)"""
+        switches = self.options_data.get(CONF_SWITCHES, [])
+        otros = [s for s in switches if not s.startswith("climate.")]
+        current_sensores = self.config_entry.options.get(CONF_SENSORES_POTENCIA, self.config_entry.data.get(CONF_SENSORES_POTENCIA, {}))
+
+        if user_input is not None or not otros:
+            # Vacío = detección automática por dispositivo en el registro
+            self.options_data[CONF_SENSORES_POTENCIA] = {k: v for k, v in (user_input or {}).items() if v}
+            return self.async_create_entry(title="", data=self.options_data)
+
+        schema_dict = {}
+        for entity_id in otros:
+            actual = current_sensores.get(entity_id)
+            clave = vol.Optional(entity_id, description={"suggested_value": actual}) if actual else vol.Optional(entity_id)
+            schema_dict[clave] = selector.selector(SELECTOR_SENSOR_POTENCIA)
+
+        return self.async_show_form(
+            step_id="power_sensors",
+            data_schema=vol.Schema(schema_dict),
+            errors={}
+        )
@@ -5,3 +5,15 @@ CONF_SWITCHES = "switches_limitados"
 CONF_INTERVALO_DESACTIVACION = "intervalo_desactivacion"
 CONF_INTERVALO_ACTIVACION = "intervalo_activacion"
 CONF_NOTIFICACIONES = "notificaciones_activadas"
+CONF_SENSORES_POTENCIA = "sensores_potencia"
+CONF_HORARIO_LIMITES = "horario_limites"
+SIGNAL_SOBRECARGA = "limitador_consumo_sobrecarga_{}"
+CONF_ESCALONADO_CLIMATE = "escalonado_climate"
+CONF_GRADOS_REDUCCION = "grados_reduccion_climate"
+CONF_SENSOR_PRODUCCION = "sensor_produccion"
+CONF_SENSOR_RED = "sensor_red"
+CONF_GRUPOS = "grupos_dispositivos"
+CONF_BANDA_MUESTREO = "banda_muestreo"
+CONF_MAXIMETRO = "modo_maximetro"
+CONF_SOMBRA = "config_sombra"
+SIGNAL_SOMBRA = "limitador_consumo_sombra_{}"
@@ -0,0 +1,46 @@
+"""Diagnóstico del Limitador de Consumo."""
+import time
+
+from .const import DOMAIN
+
+
+async def async_get_config_entry_diagnostics(hass, entry):
+    """Devolver el diagnóstico de una entrada de configuración."""
+    datos = hass.data.get(DOMAIN, {}).get(entry.entry_id, {})
+    limite = datos.get("limite") or {}
+    disyuntores = datos.get("disyuntores")
+    diario = datos.get("diario")
+    sobrecarga = datos.get("sobrecarga")
+    envolvente = datos.get("envolvente_red")
+    muestreo = datos.get("muestreo") or {}
+    ventana = datos.get("ventana_demanda")
+    sombra = datos.get("sombra")
+    ahora = time.time()
+    return {
+        "config": datos.get("config", {}),
+        "potencia_max_actual": limite.get("actual"),
+        "consumo_apagado": datos.get("consumo_apagado", {}),
+        "dispositivos_bloqueados": sorted(datos.get("dispositivos_bloqueados", ())),
+        "sensores_dispositivos": datos.get("sensores_dispositivos", {}),
+        "disyuntores": disyuntores.diagnostico() if disyuntores else {},
+        "sobrecarga": {
+            "energia_wh": round(sobrecarga.energia_wh, 3),
+            "episodios_hoy": sobrecarga.episodios_hoy,
+            "maximo_hoy_s": round(sobrecarga.maximo_hoy, 1),
+            "en_sobrecarga": sobrecarga.en_sobrecarga,
+        } if sobrecarga else {},
+        "muestreo": {
+            "intervalo_s": muestreo.get("intervalo"),
+            "proxima": muestreo["proxima"].isoformat() if muestreo.get("proxima") else None,
+            "refrescar_contador": muestreo.get("refrescar"),
+        },
+        "maximetro": {
+            "media_cuarto_hora": ventana.media(ahora),
+            "proyeccion": ventana.proyeccion(ahora),
+            "ultima_media": ventana.ultima_media,
+            "media_maxima": ventana.maxima,
+        } if ventana else {},
+        "importacion_maxima_ventana": envolvente.maximo(ahora) if envolvente else None,
+        "sombra": {**sombra.resumen(), "acciones": sombra.registro()} if sombra else None,
+        "diario": diario.registros() if diario else [],
+    }
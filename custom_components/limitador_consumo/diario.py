@@ -0,0 +1,70 @@
+"""Diario de decisiones: buffer circular de decisiones estructuradas del limitador.
+
+Cada registro guarda referencias a la instantánea inmutable del planificador y a la
+acción elegida; no se formatea nada al registrar. Los diccionarios se generan solo
+al leer el diario (diagnóstico), así que registrar es prácticamente gratis aunque
+nadie lo consulte. Solo se registran las acciones intentadas: las pasadas sin nada
+que hacer no ocupan sitio en el buffer.
+"""
+from collections import deque
+from datetime import datetime, timezone
+import time
+
+from .planificador import candidatos_apagado
+
+TAM_DIARIO = 500
+
+APAGADO = "apagado"
+REACTIVACION = "reactivacion"
+
+EJECUTADA = "ejecutada"
+FALLIDA = "fallida"
+
+
+class DiarioDecisiones:
+    """Buffer circular de tamaño fijo con las últimas decisiones."""
+
+    def __init__(self, tamano=TAM_DIARIO):
+        """Inicializar el diario."""
+        self._registros = deque(maxlen=tamano)
+
+    def __len__(self):
+        return len(self._registros)
+
+    def registrar(self, tipo, instantanea, accion, resultado):
+        """Añade una decisión (sin formatear nada).
+
+        Args:
+            tipo: APAGADO o REACTIVACION
+            instantanea: Instantánea del planificador usada para decidir
+            accion: Acción elegida
+            resultado: EJECUTADA o FALLIDA
+        """
+        self._registros.append((time.time(), tipo, instantanea, accion, resultado))
+
+    @staticmethod
+    def _candidatos(tipo, instantanea):
+        """Dispositivos que el planificador podía elegir en esa instantánea."""
+        if tipo == REACTIVACION:
+            return [entity_id for entity_id, _consumo in instantanea.apagados]
+        return [d.entity_id for d in candidatos_apagado(instantanea)]
+
+    def registros(self):
+        """Decisiones formateadas como diccionarios (de la más antigua a la más reciente)."""
+        resultado = []
+        for ts, tipo, instantanea, accion, estado in list(self._registros):
+            resultado.append({
+                "timestamp": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+                "tipo": tipo,
+                "potencia": instantanea.potencia,
+                "potencia_max": instantanea.potencia_max,
+                "candidatos": self._candidatos(tipo, instantanea),
+                "accion": accion.tipo,
+                "entity_id": accion.entity_id,
+                "consumo": accion.consumo,
+                "escalon": accion.escalon,
+                "razon": accion.razon,
+                "resultado": estado,
+            })
+        return resultado
+
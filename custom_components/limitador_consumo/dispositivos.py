@@ -0,0 +1,90 @@
+"""Índice de sensores de potencia construido a partir de los registros de HA."""
+from homeassistant.helpers import entity_registry as er
+
+
+def _device_class(entrada):
+    """Device class efectiva de una entrada del registro (la del usuario manda)."""
+    return entrada.device_class or entrada.original_device_class
+
+
+def construir_indice_sensores(hass, device_classes=("power",)):
+    """Construye un índice device_id -> {device_class: [sensores]} en una sola pasada.
+
+    Recorre una vez todas las entradas del registro de entidades (no ``hass.states``):
+    compensa al resolver muchos dispositivos a la vez. Para uno solo basta con
+    ``buscar_sensor_del_dispositivo``.
+
+    Args:
+        hass: Instancia de Home Assistant
+        device_classes: Device classes de sensor a indexar
+    """
+    indice = {}
+    for entrada in er.async_get(hass).entities.values():
+        if entrada.domain != "sensor" or entrada.disabled_by is not None:
+            continue
+        if entrada.device_id is None:
+            continue
+        device_class = _device_class(entrada)
+        if device_class not in device_classes:
+            continue
+        indice.setdefault(entrada.device_id, {}).setdefault(device_class, []).append(entrada.entity_id)
+    return indice
+
+
+def sensor_del_dispositivo(hass, indice, entity_id, device_class="power"):
+    """Devuelve el primer sensor del mismo dispositivo que ``entity_id`` o None."""
+    entrada = er.async_get(hass).async_get(entity_id)
+    if entrada is None or entrada.device_id is None:
+        return None
+    sensores = indice.get(entrada.device_id, {}).get(device_class, [])
+    return sensores[0] if sensores else None
+
+
+def buscar_sensor_del_dispositivo(hass, entity_id, device_class="power"):
+    """Como ``sensor_del_dispositivo`` pero sin índice: solo mira las entradas de su dispositivo."""
+    registro = er.async_get(hass)
+    entrada = registro.async_get(entity_id)
+    if entrada is None or entrada.device_id is None:
+        return None
+    for sensor in er.async_entries_for_device(registro, entrada.device_id):
+        if sensor.domain == "sensor" and _device_class(sensor) == device_class:
+            return sensor.entity_id
+    return None
+
+
+def _sensor_por_convencion(entity_id):
+    """Sensor ``sensor.<nombre>_potencia`` (convención antigua).
+
+    Se devuelve aunque aún no exista: suele ser un sensor template de YAML, que puede
+    no estar en el registro (sin unique_id) y cargarse después de la integración. La
+    lectura se hace en cada comprobación, así que en cuanto aparece se usa.
+    """
+    return f"sensor.{entity_id.split('.', 1)[1]}_potencia"
+
+
+def resolver_sensores_dispositivos(hass, entidades, overrides=None):
+    """Resuelve el sensor de potencia de cada dispositivo controlado.
+
+    Prioridad: override explícito, sensor del mismo dispositivo en el
+    registro y, por último, la convención ``sensor.<nombre>_potencia`` (siempre, como
+    en ``replay.resolver_sensores``).
+
+    Args:
+        hass: Instancia de Home Assistant
+        entidades: Lista de entity_ids controlados (switch, climate, ...)
+        overrides: Mapeo opcional entity_id -> sensor de potencia
+
+    Returns:
+        Diccionario entity_id -> {"power": sensor}
+    """
+    overrides = overrides or {}
+    indice = construir_indice_sensores(hass)
+    resultado = {}
+    for entity_id in entidades:
+        power = (
+            overrides.get(entity_id)
+            or sensor_del_dispositivo(hass, indice, entity_id, "power")
+            or _sensor_por_convencion(entity_id)
+        )
+        resultado[entity_id] = {"power": power}
+    return resultado
@@ -0,0 +1,78 @@
+"""Grupos de dispositivos que se apagan y se reactivan juntos.
+
+Un grupo es una unidad de control: tiene el consumo conjunto de sus miembros, el
+planificador lo trata como un solo dispositivo y se actúa con una única llamada
+de servicio a todos ellos. En la configuración los miembros siguen en
+``switches_limitados`` y el grupo ocupa la prioridad de su primer miembro::
+
+    grupos_dispositivos:
+      suelo_radiante: [switch.zona_1, switch.zona_2, switch.zona_3]
+"""
+import re
+
+PREFIJO_GRUPO = "grupo."
+
+
+def id_grupo(nombre):
+    """Identificador de la unidad de control de un grupo (``grupo.<nombre>``)."""
+    return PREFIJO_GRUPO + re.sub(r"[^a-z0-9_]+", "_", str(nombre).strip().lower()).strip("_")
+
+
+def es_grupo(entity_id):
+    return entity_id.startswith(PREFIJO_GRUPO)
+
+
+def normalizar_grupos(grupos, switches=None):
+    """Valida los grupos y devuelve ``{id_grupo: (miembros...)}``.
+
+    Args:
+        grupos: Diccionario nombre -> lista de entidades (None o vacío = sin grupos)
+        switches: Dispositivos configurados; si se indica, los miembros deben estar
+
+    Raises:
+        ValueError: Si un grupo está vacío, tiene miembros que no son switches o
+            un mismo dispositivo está en dos grupos
+    """
+    if not grupos:
+        return {}
+    if not isinstance(grupos, dict):
+        raise ValueError("Los grupos deben ser un diccionario nombre -> entidades")
+    resultado = {}
+    vistos = set()
+    for nombre, miembros in grupos.items():
+        identificador = id_grupo(nombre)
+        if identificador == PREFIJO_GRUPO or identificador in resultado:
+            raise ValueError(f"Nombre de grupo no válido o repetido: {nombre}")
+        if isinstance(miembros, str):
+            miembros = [miembros]
+        if not isinstance(miembros, (list, tuple)) or not miembros:
+            raise ValueError(f"El grupo {nombre} no tiene dispositivos")
+        for miembro in miembros:
+            if not isinstance(miembro, str) or not miembro.startswith("switch."):
+                raise ValueError(f"Solo se pueden agrupar switches: {miembro}")
+            if miembro in vistos:
+                raise ValueError(f"{miembro} está en más de un grupo")
+            if switches is not None and miembro not in switches:
+                raise ValueError(f"{miembro} no está entre los dispositivos limitados")
+            vistos.add(miembro)
+        resultado[identificador] = tuple(miembros)
+    return resultado
+
+
+def unidades_control(switches, grupos):
+    """Unidades de control en orden de prioridad.
+
+    Los miembros de un grupo se sustituyen por el grupo en la posición del
+    primero de ellos.
+
+    Args:
+        switches: Dispositivos configurados, en orden de prioridad
+        grupos: Grupos normalizados (``normalizar_grupos``)
+    """
+    grupo_de = {m: g for g, miembros in grupos.items() for m in miembros}
+    unidades = []
+    for entity_id in switches:
+        unidad = grupo_de.get(entity_id, entity_id)
+        if unidad not in unidades:
+            unidades.append(unidad)
+    return unidades
@@ -0,0 +1,143 @@
+"""Límites de potencia variables según horario (periodos tarifarios, festivos...)."""
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+MINUTOS_DIA = 24 * 60
+PERFIL_FESTIVO = 7  # Índice del perfil de festivos (0-6 son lunes-domingo)
+
+DIAS = {
+    "lun": 0, "mar": 1, "mie": 2, "mié": 2, "jue": 3, "vie": 4, "sab": 5, "sáb": 5, "dom": 6,
+    "festivo": PERFIL_FESTIVO, "festivos": PERFIL_FESTIVO,
+}
+
+
+def _minuto(valor):
+    """Convierte "HH:MM" en minuto del día (se admite "24:00")."""
+    horas, minutos = str(valor).split(":")
+    resultado = int(horas) * 60 + int(minutos)
+    if not 0 <= resultado <= MINUTOS_DIA or not 0 <= int(minutos) < 60:
+        raise ValueError(f"Hora no válida: {valor}")
+    return resultado
+
+
+def _perfiles(dias):
+    """Perfiles (0-7) a los que aplica un periodo; sin días aplica a todos."""
+    if dias is None:
+        return list(range(PERFIL_FESTIVO + 1))
+    if not isinstance(dias, (list, tuple)):
+        dias = [dias]
+    perfiles = []
+    for dia in dias:
+        if isinstance(dia, int) and 0 <= dia <= 6:
+            perfiles.append(dia)
+        elif isinstance(dia, str) and dia.strip().lower() in DIAS:
+            perfiles.append(DIAS[dia.strip().lower()])
+        else:
+            raise ValueError(f"Día no válido: {dia}")
+    return perfiles
+
+
+def _festivo(valor):
+    """Festivo como (año, mes, día) o (None, mes, día) si es recurrente ("MM-DD")."""
+    partes = [int(p) for p in str(valor).split("-")]
+    if len(partes) == 3:
+        return date(*partes).timetuple()[:3]
+    if len(partes) == 2:
+        date(2000, *partes)  # Validar mes/día (2000 es bisiesto)
+        return (None, partes[0], partes[1])
+    raise ValueError(f"Festivo no válido: {valor}")
+
+
+class HorarioLimites:
+    """Línea temporal precompilada de límites de potencia.
+
+    El horario se compila al iniciar en una tabla minuto a minuto por perfil de día
+    (lunes-domingo y festivos), así que consultar el límite vigente es O(1).
+
+    Formato del horario::
+
+        periodos:
+          - dias: [lun, mar, mie, jue, vie]   # 0-6, abreviaturas o "festivo"; omitido = todos
+            desde: "10:00"
+            hasta: "14:00"                    # si hasta <= desde, el periodo cruza medianoche
+            potencia: 4600
+        festivos: ["2026-01-01", "12-25"]     # fecha concreta o "MM-DD" recurrente
+
+    Si varios periodos se solapan se aplica el límite más bajo; fuera de cualquier
+    periodo se aplica la potencia por defecto.
+    """
+
+    def __init__(self, potencia_defecto, horario=None):
+        """Compilar el horario."""
+        horario = horario or {}
+        if isinstance(horario, list):
+            horario = {"periodos": horario}
+        if not isinstance(horario, dict):
+            raise ValueError("El horario debe ser un diccionario con 'periodos' y 'festivos'")
+
+        self.potencia_defecto = float(potencia_defecto)
+        # None = minuto sin periodo; se rellena con la potencia por defecto al final
+        self._tablas = [[None] * MINUTOS_DIA for _ in range(PERFIL_FESTIVO + 1)]
+        self._festivos = set()
+        self._festivos_recurrentes = set()
+        periodos = horario.get("periodos") or []
+
+        for periodo in periodos:
+            try:
+                potencia = float(periodo["potencia"])
+                desde = _minuto(periodo.get("desde", "00:00"))
+                hasta = _minuto(periodo.get("hasta", "24:00"))
+            except (KeyError, TypeError, AttributeError) as err:
+                raise ValueError(f"Periodo no válido: {periodo}") from err
+            if potencia <= 0:
+                raise ValueError(f"Potencia no válida en periodo: {periodo}")
+            tramos = [(desde, hasta)] if desde < hasta else [(desde, MINUTOS_DIA), (0, hasta)]
+            for perfil in _perfiles(periodo.get("dias")):
+                tabla = self._tablas[perfil]
+                for inicio, fin in tramos:
+                    for minuto in range(inicio, fin):
+                        if tabla[minuto] is None or potencia < tabla[minuto]:
+                            tabla[minuto] = potencia
+        for tabla in self._tablas:
+            for minuto, potencia in enumerate(tabla):
+                if potencia is None:
+                    tabla[minuto] = self.potencia_defecto
+
+        for festivo in horario.get("festivos") or []:
+            anio, mes, dia = _festivo(festivo)
+            if anio is None:
+                self._festivos_recurrentes.add((mes, dia))
+            else:
+                self._festivos.add(date(anio, mes, dia))
+
+        # Minutos del día en los que cambia el límite, por perfil
+        self._cambios = [
+            [m for m in range(1, MINUTOS_DIA) if tabla[m] != tabla[m - 1]]
+            for tabla in self._tablas
+        ]
+        self.variable = bool(periodos)
+
+    def _perfil(self, dia):
+        """Perfil aplicable a una fecha (festivo o día de la semana)."""
+        if dia in self._festivos or (dia.month, dia.day) in self._festivos_recurrentes:
+            return PERFIL_FESTIVO
+        return dia.weekday()
+
+    def limite(self, momento: datetime) -> float:
+        """Límite vigente en ``momento`` (hora local)."""
+        return self._tablas[self._perfil(momento.date())][momento.hour * 60 + momento.minute]
+
+    def siguiente_cambio(self, momento: datetime):
+        """Próximo instante en el que puede cambiar el límite (o None si es fijo).
+
+        Devuelve el siguiente cambio dentro del día o, si no quedan, la medianoche
+        siguiente (el perfil del día puede ser distinto).
+        """
+        if not self.variable:
+            return None
+        cambios = self._cambios[self._perfil(momento.date())]
+        indice = bisect_right(cambios, momento.hour * 60 + momento.minute)
+        inicio_dia = momento.replace(hour=0, minute=0, second=0, microsecond=0)
+        if indice < len(cambios):
+            return inicio_dia + timedelta(minutes=cambios[indice])
+        return inicio_dia + timedelta(days=1)
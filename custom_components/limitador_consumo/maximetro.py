@@ -0,0 +1,98 @@
+"""Ventana de demanda cuartohoraria (maxímetro).
+
+Con maxímetro se factura la potencia media de cada cuarto de hora, no la
+instantánea. La ventana acumula la energía del cuarto de hora en curso (alineado
+al reloj: :00, :15, :30, :45) con cada lectura, en O(1), y permite proyectar la
+media al final de la ventana o calcular la potencia que aún se puede mantener
+hasta el final sin superar el objetivo.
+"""
+
+DURACION_VENTANA = 900  # Segundos (15 minutos)
+RESTANTE_MINIMO = 1  # Segundos; evita divisiones por ~0 justo al final de la ventana
+
+
+class VentanaDemanda:
+    """Energía de la ventana alineada en curso (regla del rectángulo por la izquierda).
+
+    La última lectura se mantiene hasta la siguiente. En la primera ventana se
+    supone que la potencia anterior a la primera lectura era la misma.
+    """
+
+    def __init__(self, duracion=DURACION_VENTANA):
+        """Inicializar la ventana."""
+        self.duracion = duracion
+        self.inicio = None  # ts de inicio de la ventana en curso
+        self.energia_ws = 0.0  # Energía de la ventana en curso hasta self._ts
+        self.ultima_media = None  # Media (W) de la última ventana cerrada
+        self.maxima = None  # Media máxima (W) de las ventanas cerradas
+        self._ts = None
+        self._potencia = 0.0
+
+    def _cerrar(self, media):
+        self.ultima_media = media
+        if self.maxima is None or media > self.maxima:
+            self.maxima = media
+
+    def _avanzar(self, ts):
+        """Integra la última potencia hasta ``ts``, cerrando las ventanas que terminen."""
+        if self._ts is None or ts <= self._ts:
+            return
+        fin = self.inicio + self.duracion
+        if ts >= fin:
+            self.energia_ws += self._potencia * (fin - self._ts)
+            self._cerrar(self.energia_ws / self.duracion)
+            # Ventanas completas sin lecturas: todas con la última potencia
+            if ts - fin >= self.duracion:
+                self._cerrar(self._potencia)
+            self.inicio = ts - ts % self.duracion
+            self._ts = self.inicio
+            self.energia_ws = 0.0
+        self.energia_ws += self._potencia * (ts - self._ts)
+        self._ts = ts
+
+    def actualizar(self, ts, potencia):
+        """Procesa una lectura de importación (None se ignora; la exportación cuenta como 0)."""
+        if potencia is None:
+            return
+        potencia = max(0.0, potencia)
+        if self._ts is None:
+            self.inicio = ts - ts % self.duracion
+            self.energia_ws = potencia * (ts - self.inicio)
+            self._ts = ts
+        else:
+            self._avanzar(ts)
+        self._potencia = potencia
+
+    def restante(self, ts):
+        """Segundos que quedan de la ventana en curso."""
+        self._avanzar(ts)
+        return max(RESTANTE_MINIMO, self.inicio + self.duracion - ts)
+
+    def proyeccion(self, ts, potencia=None):
+        """Media proyectada al final de la ventana si se mantiene ``potencia``
+        (por defecto, la última lectura). None si aún no hay lecturas."""
+        if self._ts is None:
+            return None
+        restante = self.restante(ts)
+        if potencia is None:
+            potencia = self._potencia
+        return (self.energia_ws + max(0.0, potencia) * restante) / self.duracion
+
+    def admisible(self, ts, objetivo):
+        """Potencia constante que se puede mantener hasta el final de la ventana sin
+        que la media supere ``objetivo`` (negativa si la ventana ya está perdida).
+
+        Superar este valor equivale a que la proyección supere el objetivo.
+        """
+        if self._ts is None:
+            return objetivo
+        restante = self.restante(ts)
+        return (objetivo * self.duracion - self.energia_ws) / restante
+
+    def media(self, ts):
+        """Media de lo que va de ventana (None si aún no hay lecturas)."""
+        if self._ts is None:
+            return None
+        self._avanzar(ts)
+        transcurrido = ts - self.inicio
+        return self.energia_ws / transcurrido if transcurrido > 0 else self._potencia
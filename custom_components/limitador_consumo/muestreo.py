@@ -0,0 +1,57 @@
+"""Cadencia adaptativa de la comprobación de apagado.
+
+Cerca del límite (o mientras se asienta un apagado) se evalúa más a menudo y se
+pide al contador una lectura nueva; lejos del límite se espera más entre
+evaluaciones. Una lectura del contador que entra en la banda adelanta la
+siguiente evaluación, así que esperar más no retrasa la reacción a un pico.
+"""
+
+INTERVALO_MINIMO = 5  # Segundos; no se evalúa más rápido aunque el intervalo sea corto
+FACTOR_RAPIDO = 0.25  # Cerca del límite: una cuarta parte del intervalo configurado
+FACTOR_LENTO = 2  # Lejos del límite: el doble del intervalo configurado
+UMBRAL_LEJOS = 0.5  # Por debajo del 50 % del límite se considera lejos
+ASENTAMIENTO = 60  # Segundos tras un apagado en los que se sigue muestreando rápido
+
+
+def cerca_del_limite(potencia, limite, banda):
+    """True si la potencia está dentro de la banda (fracción) por debajo del límite o lo supera."""
+    return banda > 0 and potencia is not None and potencia >= limite * (1 - banda)
+
+
+def cadencia(potencia, limite, base, banda, asentando=False):
+    """Segundos hasta la siguiente evaluación y si hay que refrescar el contador antes.
+
+    Args:
+        potencia: Última potencia leída (None si no hay lectura)
+        limite: Límite vigente en W
+        base: Intervalo de desactivación configurado
+        banda: Fracción del límite que se considera "cerca" (0 = cadencia fija)
+        asentando: True si hace poco que se apagó algo
+
+    Returns:
+        (intervalo, refrescar)
+    """
+    if banda <= 0 or potencia is None:
+        return base, False
+    if asentando or cerca_del_limite(potencia, limite, banda):
+        return min(base, max(INTERVALO_MINIMO, base * FACTOR_RAPIDO)), True
+    if potencia < limite * UMBRAL_LEJOS:
+        return base * FACTOR_LENTO, False
+    return base, False
+
+
+def intervalo_adelantado(ts, intervalo, ultima):
+    """Segundos hasta una evaluación adelantada por una lectura del contador.
+
+    No se adelanta a menos de ``INTERVALO_MINIMO`` del final de la última evaluación:
+    con la potencia por encima del límite y nada más que apagar, cada lectura pediría
+    una evaluación inmediata (con su lectura forzada del contador).
+
+    Args:
+        ts: Instante de la lectura (segundos)
+        intervalo: Segundos que pide la lectura (0 si supera el límite)
+        ultima: Instante en que terminó la última evaluación (None si no hubo)
+    """
+    if ultima is None:
+        return intervalo
+    return max(intervalo, ultima + INTERVALO_MINIMO - ts)
@@ -0,0 +1,162 @@
+"""Planificador puro del limitador: instantánea inmutable -> lista de acciones.
+
+No depende de Home Assistant ni tiene efectos secundarios (sin servicios, eventos,
+logs ni esperas), así que puede evaluarse miles de veces por segundo en pruebas,
+benchmarks o simulaciones. La integración construye la instantánea a partir de
+``hass.states`` y ejecuta las acciones devueltas.
+
+Escalones de reducción: cada dispositivo tiene una escalera de escalones
+acumulativos. Los switches solo tienen ``ESCALON_APAGADO``; los climates pueden
+tener además bajar/subir la consigna y el preset eco (o ventilador bajo) antes de
+apagarse. Al apagar se elige el escalón más barato que recupera suficiente
+potencia; al reactivar se sube la escalera de uno en uno.
+"""
+from typing import NamedTuple, Optional, Tuple, FrozenSet
+
+MARGEN_SIN_CONSUMO = 0.8  # Sin consumo conocido se reactiva solo por debajo del 80 % del límite
+
+APAGAR = "apagar"
+REDUCIR = "reducir"
+ENCENDER = "encender"
+RESTAURAR = "restaurar"  # Subir un escalón sin llegar a restaurar del todo
+
+ESCALON_NINGUNO = 0
+ESCALON_CONSIGNA = 1
+ESCALON_ECO = 2
+ESCALON_APAGADO = 3
+
+# Fracción estimada del consumo del dispositivo que se recupera en cada escalón.
+# Es una heurística, no una medida: el ahorro real de bajar la consigna o pasar a
+# eco depende del equipo y de la temperatura exterior. Si un escalón recupera menos
+# de lo estimado, la siguiente pasada del control ve que sigue el exceso y sube
+# otro escalón o apaga otro dispositivo.
+FRACCION_ESCALON = {
+    ESCALON_NINGUNO: 0.0,
+    ESCALON_CONSIGNA: 0.3,
+    ESCALON_ECO: 0.5,
+    ESCALON_APAGADO: 1.0,
+}
+
+RAZON_EXCESO = "potencia_superior_al_limite"
+RAZON_DENTRO_LIMITE = "potencia_dentro_del_limite"
+RAZON_SIN_SENSOR = "sin_sensor_potencia"
+
+
+class Dispositivo(NamedTuple):
+    """Estado de un dispositivo controlado en el momento de la instantánea."""
+
+    entity_id: str
+    encendido: bool
+    consumo: Optional[float] = None  # Lectura actual de su sensor de potencia
+    disponible: bool = True  # False si el estado es unknown/unavailable
+    escalon: int = ESCALON_NINGUNO  # Escalón aplicado por el limitador
+    escalones: Tuple[int, ...] = (ESCALON_APAGADO,)  # Escalones disponibles, ordenados
+
+
+class Instantanea(NamedTuple):
+    """Entradas del planificador.
+
+    ``dispositivos`` va en el orden de configuración (prioridad de apagado) y
+    ``apagados`` en el orden en que se apagaron, como pares (entity_id, consumo
+    registrado antes de reducirlo).
+    """
+
+    potencia: float
+    potencia_max: float
+    dispositivos: Tuple[Dispositivo, ...]
+    apagados: Tuple[Tuple[str, float], ...] = ()
+    bloqueados: FrozenSet[str] = frozenset()
+    invertir_orden: bool = True
+
+
+class Accion(NamedTuple):
+    """Acción decidida por el planificador."""
+
+    tipo: str  # APAGAR, REDUCIR, ENCENDER o RESTAURAR
+    entity_id: str
+    consumo: float  # Potencia que se recupera (apagar/reducir) o se reserva (encender/restaurar)
+    potencia: float  # Potencia estimada en el momento de decidir
+    razon: str
+    escalon: int = ESCALON_APAGADO  # Escalón de destino
+    consumo_total: float = 0.0  # Consumo del dispositivo sin reducir
+
+
+def candidatos_apagado(instantanea: Instantanea):
+    """Dispositivos que aún pueden bajar algún escalón."""
+    return [
+        d for d in instantanea.dispositivos
+        if d.disponible and d.encendido and d.escalones and d.escalones[-1] > d.escalon
+    ]
+
+
+def planificar_apagado(instantanea: Instantanea):
+    """Dispositivos a reducir/apagar, en orden, hasta volver a estar por debajo del límite.
+
+    Para cada candidato se elige el primer escalón cuya recuperación estimada cubre
+    el exceso; si ninguno basta (o no se conoce su consumo) se aplica el último.
+    Sin consumo conocido se descuenta 0 y se sigue con el siguiente.
+    """
+    potencia = instantanea.potencia
+    limite = instantanea.potencia_max
+    if potencia <= limite:
+        return []
+
+    registrados = dict(instantanea.apagados)
+    acciones = []
+    for dispositivo in candidatos_apagado(instantanea):
+        if potencia <= limite:
+            break
+        total = registrados.get(dispositivo.entity_id) or dispositivo.consumo or 0.0
+        base = FRACCION_ESCALON[dispositivo.escalon]
+        siguientes = [e for e in dispositivo.escalones if e > dispositivo.escalon]
+        elegido = siguientes[-1]
+        if total > 0:
+            necesario = potencia - limite
+            for escalon in siguientes:
+                if total * (FRACCION_ESCALON[escalon] - base) >= necesario:
+                    elegido = escalon
+                    break
+        recuperado = total * (FRACCION_ESCALON[elegido] - base)
+        tipo = APAGAR if elegido == ESCALON_APAGADO else REDUCIR
+        acciones.append(Accion(
+            tipo, dispositivo.entity_id, recuperado, potencia, RAZON_EXCESO, elegido, total
+        ))
+        potencia -= recuperado
+    return acciones
+
+
+def puede_reactivar(potencia, potencia_max, consumo):
+    """Regla de reactivación: cabe el consumo conocido o hay margen del 80 %."""
+    if consumo:
+        return potencia + consumo <= potencia_max
+    return potencia < potencia_max * MARGEN_SIN_CONSUMO
+
+
+def planificar_reactivacion(instantanea: Instantanea):
+    """Dispositivo a reactivar o subir un escalón (como mucho uno por pasada).
+
+    Solo se consideran dispositivos con bloqueo activo; los apagados deben seguir
+    apagados y los reducidos seguir encendidos. El orden es el de apagado,
+    invertido si ``invertir_orden``.
+    """
+    apagados = instantanea.apagados
+    if not apagados:
+        return []
+    candidatos = reversed(apagados) if instantanea.invertir_orden else apagados
+    por_entidad = {d.entity_id: d for d in instantanea.dispositivos}
+    for entity_id, total in candidatos:
+        dispositivo = por_entidad.get(entity_id)
+        if entity_id not in instantanea.bloqueados or dispositivo is None or not dispositivo.disponible:
+            continue
+        escalon = dispositivo.escalon
+        # Apagado por el limitador pero encendido a mano, o reducido pero apagado a mano
+        if dispositivo.encendido == (escalon == ESCALON_APAGADO):
+            continue
+        anteriores = [e for e in dispositivo.escalones if e < escalon]
+        destino = anteriores[-1] if anteriores else ESCALON_NINGUNO
+        consumo = (total or 0.0) * (FRACCION_ESCALON[escalon] - FRACCION_ESCALON[destino])
+        if puede_reactivar(instantanea.potencia, instantanea.potencia_max, consumo):
+            razon = RAZON_DENTRO_LIMITE if consumo else RAZON_SIN_SENSOR
+            tipo = ENCENDER if destino == ESCALON_NINGUNO else RESTAURAR
+            return [Accion(tipo, entity_id, consumo, instantanea.potencia, razon, destino, total or 0.0)]
+    return []
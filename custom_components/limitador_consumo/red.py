@@ -0,0 +1,66 @@
+"""Potencia neta de red para instalaciones con producción solar (autoconsumo).
+
+El ICP solo ve la potencia importada de la red, así que con placas solares el
+límite se compara con la importación neta (consumo - producción) y no con el
+consumo de la casa. Si hay un sensor de red con signo (positivo al importar,
+negativo al exportar) se usa directamente.
+
+Para reactivar dispositivos se usa una envolvente pesimista: el máximo de la
+importación neta en una ventana reciente. Una nube que pasa sube la importación
+durante unos segundos y retrasa la reactivación hasta que la producción se ha
+mantenido, en lugar de encender y volver a apagar en cuanto el sol sale un momento.
+"""
+from collections import deque
+
+VENTANA_NUBES = 120  # Segundos de la envolvente usada para reactivar
+
+
+def potencia_neta(consumo, produccion=None, red=None):
+    """Importación neta de la red en W (negativa si se exporta).
+
+    Args:
+        consumo: Consumo de la casa (sensor de potencia principal)
+        produccion: Producción solar, o None si no hay sensor o no tiene lectura
+            (p. ej. de noche algunos inversores quedan ``unavailable``)
+        red: Lectura del sensor de red con signo; si existe tiene prioridad
+
+    Returns:
+        Importación neta, o None si no hay lectura válida
+    """
+    if red is not None:
+        return red
+    if consumo is None:
+        return None
+    return consumo - (produccion or 0.0)
+
+
+class EnvolventeMaxima:
+    """Máximo deslizante de la importación neta en los últimos ``ventana`` segundos.
+
+    Cola monótona decreciente: cada lectura entra y sale como mucho una vez, así
+    que añadir y consultar cuestan O(1) amortizado.
+    """
+
+    def __init__(self, ventana=VENTANA_NUBES):
+        """Inicializar la envolvente."""
+        self.ventana = ventana
+        self._cola = deque()  # (ts, valor) con valores decrecientes
+
+    def anadir(self, ts, valor):
+        """Registra una lectura (None se ignora)."""
+        if valor is None:
+            return
+        while self._cola and self._cola[-1][1] <= valor:
+            self._cola.pop()
+        self._cola.append((ts, valor))
+        self._caducar(ts)
+
+    def _caducar(self, ts):
+        # La lectura más reciente se mantiene siempre: sigue vigente hasta la siguiente
+        while len(self._cola) > 1 and self._cola[0][0] < ts - self.ventana:
+            self._cola.popleft()
+
+    def maximo(self, ts):
+        """Máximo de la ventana que termina en ``ts`` (None si no hay lecturas)."""
+        self._caducar(ts)
+        return self._cola[0][1] if self._cola else None
@@ -0,0 +1,619 @@
+"""Reproducción del historial del recorder a través de las reglas del limitador.
+
+Permite evaluar cómo se habría comportado otra configuración (intervalos, margen,
+orden de reactivación, horario de límites...) con datos reales, sin actuar sobre
+ningún dispositivo. Se ejecuta desde el directorio de configuración de Home Assistant::
+
+    python -m custom_components.limitador_consumo.replay \\
+        --desde 2025-12-01 --hasta 2026-03-01 --set intervalo_desactivacion=20
+
+Al ejecutarse como módulo se importa el paquete de la integración, que necesita
+Home Assistant instalado: hay que lanzarlo en el mismo entorno de Python que HA
+(p. ej. ``docker exec -it homeassistant python -m ...``).
+
+Las fechas y el horario de límites se interpretan en la zona horaria configurada en
+Home Assistant (``.storage/core.config``), no en la del equipo.
+
+El historial se lee de la base de datos SQLite del recorder por bloques (memoria
+acotada) y se mezcla en orden temporal. El tiempo se simula de forma acelerada: los
+temporizadores se disparan entre eventos sin esperas reales.
+
+Los climates se simulan con los escalones que se indiquen en ``escalones`` (los de
+la integración, en vivo). Desde el historial solo se simula el escalón de apagado:
+los escalones de consigna y eco dependen de atributos que el recorder no guarda de
+forma fiable. El ahorro de un escalón se estima con ``FRACCION_ESCALON``.
+
+Con sensores de producción o de red configurados se simula la importación neta y
+la envolvente anti-nubes de la reactivación, igual que la integración.
+
+En modo maxímetro las decisiones usan la proyección de la media cuartohoraria; el
+informe incluye siempre la media cuartohoraria máxima resultante.
+
+Limitación: el historial ya incluye las acciones del limitador real. La potencia
+simulada es la medida menos el consumo de los dispositivos que la simulación
+mantiene apagados; lo que el limitador real apagó y la simulación no, no se suma.
+En vivo (motor en sombra, ver ``sombra.py``) las acciones reales sí se conocen y se suman.
+"""
+import argparse
+from collections import deque
+import heapq
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from .diario import APAGADO, REACTIVACION
+from .grupos import normalizar_grupos, unidades_control
+from .limites import HorarioLimites
+from .maximetro import VentanaDemanda
+from .muestreo import ASENTAMIENTO, cadencia, cerca_del_limite, intervalo_adelantado
+from .red import EnvolventeMaxima, potencia_neta
+from .planificador import (
+    ENCENDER,
+    ESCALON_APAGADO,
+    ESCALON_NINGUNO,
+    FRACCION_ESCALON,
+    Dispositivo,
+    Instantanea,
+    planificar_apagado,
+    planificar_reactivacion,
+)
+
+ESTADOS_INVALIDOS = (None, "unknown", "unavailable", "")
+ESPERA_TRAS_APAGADO = 20  # Segundos que espera control_consumo tras cada apagado
+TAM_BLOQUE = 5000
+
+
+def _a_float(valor):
+    """Convierte un estado a float (None si no es numérico)."""
+    if valor in ESTADOS_INVALIDOS:
+        return None
+    try:
+        return float(valor)
+    except (ValueError, TypeError):
+        return None
+
+
+# --------------------------------------------------------------------------
+# Lectura del recorder
+# --------------------------------------------------------------------------
+
+def _esquema_moderno(con):
+    """True si la base de datos usa la tabla states_meta (HA 2023.4+)."""
+    fila = con.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='states_meta'"
+    ).fetchone()
+    return fila is not None
+
+
+def _a_db_texto(ts):
+    """Timestamp como texto UTC, el formato de ``last_updated`` en esquemas antiguos."""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _de_db_texto(valor):
+    """``last_updated`` de un esquema antiguo (texto UTC) a timestamp."""
+    momento = datetime.fromisoformat(valor)
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=timezone.utc)
+    return momento.timestamp()
+
+
+def _columna_tiempo(con):
+    """Columna de instante de los estados y conversiones desde/hacia timestamp.
+
+    Los esquemas anteriores a HA 2023.3 no tienen ``last_updated_ts``: guardan
+    ``last_updated`` como texto en UTC.
+    """
+    columnas = {fila[1] for fila in con.execute("PRAGMA table_info(states)")}
+    if "last_updated_ts" in columnas:
+        return "last_updated_ts", float, float
+    return "last_updated", _a_db_texto, _de_db_texto
+
+
+def _filtro_entidad(con, entity_id):
+    """Condición SQL y parámetro para filtrar los estados de una entidad."""
+    if _esquema_moderno(con):
+        fila = con.execute(
+            "SELECT metadata_id FROM states_meta WHERE entity_id = ?", (entity_id,)
+        ).fetchone()
+        if fila is None:
+            return None
+        return "metadata_id = ?", fila[0]
+    return "entity_id = ?", entity_id
+
+
+def historial_entidad(con, entity_id, desde, hasta, tam_bloque=TAM_BLOQUE):
+    """Genera (ts, entity_id, estado) de una entidad en orden, por bloques.
+
+    Incluye como primer elemento el último estado anterior a ``desde`` para que la
+    simulación arranque con el estado correcto (un estado justo en ``desde`` ya sale
+    en el primer bloque).
+    """
+    filtro = _filtro_entidad(con, entity_id)
+    if filtro is None:
+        return
+    condicion, parametro = filtro
+    columna, a_db, de_db = _columna_tiempo(con)
+
+    previo = con.execute(
+        f"SELECT state FROM states WHERE {condicion} AND {columna} < ? "
+        f"ORDER BY {columna} DESC LIMIT 1",
+        (parametro, a_db(desde)),
+    ).fetchone()
+    if previo is not None:
+        yield desde, entity_id, previo[0]
+
+    ultimo_ts, ultimo_id = a_db(desde), -1
+    while True:
+        filas = con.execute(
+            f"SELECT {columna}, state_id, state FROM states WHERE {condicion} "
+            f"AND ({columna} > ? OR ({columna} = ? AND state_id > ?)) "
+            f"AND {columna} < ? ORDER BY {columna}, state_id LIMIT ?",
+            (parametro, ultimo_ts, ultimo_ts, ultimo_id, a_db(hasta), tam_bloque),
+        ).fetchall()
+        for ts, _state_id, estado in filas:
+            yield de_db(ts), entity_id, estado
+        if len(filas) < tam_bloque:
+            return
+        ultimo_ts, ultimo_id = filas[-1][0], filas[-1][1]
+
+
+def historial(con, entidades, desde, hasta, tam_bloque=TAM_BLOQUE):
+    """Mezcla en orden temporal el historial de varias entidades (memoria acotada)."""
+    return heapq.merge(
+        *(historial_entidad(con, e, desde, hasta, tam_bloque) for e in entidades),
+        key=lambda evento: evento[0],
+    )
+
+
+# --------------------------------------------------------------------------
+# Configuración
+# --------------------------------------------------------------------------
+
+def _leer_storage(config_dir, nombre):
+    """Lee un fichero JSON de ``.storage`` (None si no existe)."""
+    ruta = os.path.join(config_dir, ".storage", nombre)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding="utf-8") as fichero:
+        return json.load(fichero).get("data", {})
+
+
+def zona_horaria(config_dir):
+    """Zona horaria configurada en Home Assistant (None = la del equipo)."""
+    nombre = (_leer_storage(config_dir, "core.config") or {}).get("time_zone")
+    return ZoneInfo(nombre) if nombre else None
+
+
+def cargar_config(config_dir):
+    """Configuración efectiva de la entrada del limitador (options o data)."""
+    datos = _leer_storage(config_dir, "core.config_entries") or {}
+    for entrada in datos.get("entries", []):
+        if entrada.get("domain") == "limitador_consumo":
+            return dict(entrada.get("options") or entrada.get("data") or {})
+    raise SystemExit("No se encontró ninguna entrada de limitador_consumo en .storage")
+
+
+def resolver_sensores(config_dir, entidades, overrides):
+    """entity_id -> sensor de potencia, con las mismas prioridades que la integración.
+
+    Override explícito, sensor del mismo dispositivo en ``core.entity_registry`` y
+    convención ``sensor.<nombre>_potencia``.
+    """
+    registro = (_leer_storage(config_dir, "core.entity_registry") or {}).get("entities", [])
+    por_entidad = {e["entity_id"]: e for e in registro}
+    por_dispositivo = {}
+    for e in registro:
+        if not e["entity_id"].startswith("sensor.") or e.get("disabled_by") or not e.get("device_id"):
+            continue
+        if (e.get("device_class") or e.get("original_device_class")) == "power":
+            por_dispositivo.setdefault(e["device_id"], []).append(e["entity_id"])
+
+    resultado = {}
+    for entity_id in entidades:
+        device_id = (por_entidad.get(entity_id) or {}).get("device_id")
+        mismos = por_dispositivo.get(device_id, []) if device_id else []
+        resultado[entity_id] = (
+            overrides.get(entity_id)
+            or (mismos[0] if mismos else None)
+            or f"sensor.{entity_id.split('.', 1)[1]}_potencia"
+        )
+    return resultado
+
+
+# --------------------------------------------------------------------------
+# Simulación
+# --------------------------------------------------------------------------
+
+class Simulacion:
+    """Planificador del limitador con la actuación simulada.
+
+    Se alimenta con cambios de estado (del historial o en vivo, ver ``sombra.py``)
+    y dispara sus temporizadores en tiempo simulado con ``avanzar_hasta``.
+    """
+
+    def __init__(self, config, sensores, max_registros=None, al_actuar=None, zona=None):
+        """Preparar la simulación a partir de la configuración de la entrada.
+
+        Args:
+            config: Configuración de la entrada (con los cambios a evaluar)
+            sensores: entity_id -> sensor de potencia del dispositivo
+            max_registros: Tamaño máximo de las listas de acciones (None = sin límite)
+            al_actuar: Callback opcional ``(ts, tipo, entity_id, escalon)`` en cada acción simulada
+            zona: Zona horaria del horario de límites (la de HA; None = la del equipo)
+        """
+        self.sensor = config["sensor_potencia"]
+        self.sensor_produccion = config.get("sensor_produccion")
+        self.sensor_red = config.get("sensor_red")
+        self.fotovoltaica = bool(self.sensor_produccion or self.sensor_red)
+        self.principales = [s for s in (self.sensor, self.sensor_produccion, self.sensor_red) if s]
+        self.dispositivos = list(config["switches_limitados"])
+        self.grupos = normalizar_grupos(config.get("grupos_dispositivos"), self.dispositivos)
+        self.unidades = unidades_control(self.dispositivos, self.grupos)
+        self.intervalo_desactivacion = float(config["intervalo_desactivacion"])
+        self.banda_muestreo = config.get("banda_muestreo", 10) / 100
+        self.maximetro = config.get("modo_maximetro", False)
+        self.intervalo_activacion = float(config.get("intervalo_activacion", 60))
+        self.invertir_orden = config.get("invertir_orden_activacion", True)
+        self.horario = HorarioLimites(config["potencia"], config.get("horario_limites"))
+        self.zona = zona
+        self.sensores = sensores
+        self._dispositivo_de_sensor = {}
+        for entity_id, sensor in sensores.items():
+            self._dispositivo_de_sensor.setdefault(sensor, []).append(entity_id)
+
+        self.estados = {}  # entity_id -> estado real (historial)
+        self.consumos = {}  # entity_id -> último consumo medido del dispositivo
+        self.lecturas = {}  # Última lectura de los sensores principales (consumo, producción, red)
+        self.medida = None  # Importación neta (o consumo) según las últimas lecturas
+        self.envolvente = EnvolventeMaxima()
+        self.ventana = VentanaDemanda()  # Media cuartohoraria de la potencia simulada
+        self.escalones = {}  # entity_id -> escalones disponibles (climates; por defecto solo apagado)
+        # entity_id -> (consumo registrado, ts del apagado, escalón aplicado, escalones)
+        self.apagados = {}
+        # entity_id -> (consumo registrado, escalón), apagados o reducidos por el limitador real (en vivo)
+        self.apagados_reales = {}
+        self.continuacion = None  # (ts, potencia estimada) del bucle de apagado en curso
+        self.ultimo_apagado = None
+        self.ultima_evaluacion = None  # Instante de la última comprobación de apagado
+
+        self.apagados_simulados = deque(maxlen=max_registros)
+        self.reactivados_simulados = deque(maxlen=max_registros)
+        self.al_actuar = al_actuar
+        self.siguiente_des = None
+        self.siguiente_act = None
+        self.segundos_exceso = 0.0
+        self.energia_exceso = 0.0  # W·s por encima del límite
+        self._ultimo_ts = None
+
+    # Entidades cuyo historial hace falta
+    def entidades(self):
+        return self.principales + self.dispositivos + sorted(set(self.sensores.values()))
+
+    def escalon(self, entity_id):
+        """Escalón en que la simulación tiene una unidad (ESCALON_NINGUNO si no la controla)."""
+        return self.apagados[entity_id][2] if entity_id in self.apagados else ESCALON_NINGUNO
+
+    def escalon_real(self, entity_id):
+        """Escalón en que el limitador real tiene una unidad (ESCALON_NINGUNO si no la controla)."""
+        return self.apagados_reales[entity_id][1] if entity_id in self.apagados_reales else ESCALON_NINGUNO
+
+    def potencia_simulada(self):
+        """Potencia medida con los escalones de la simulación en vez de los reales.
+
+        Lo que la simulación reduce más que el limitador real se descuenta de la
+        medida (la fracción que falta del consumo actual, si sigue encendido). Lo que
+        el limitador real reduce más que la simulación (solo se sabe en vivo) se suma
+        con el consumo que registró al apagarlo. Sin limitador real (historial) es la
+        medida menos la fracción de cada escalón simulado.
+        """
+        if self.medida is None:
+            return None
+        ajuste = 0.0
+        for entity_id in set(self.apagados) | set(self.apagados_reales):
+            simulada = FRACCION_ESCALON[self.escalon(entity_id)]
+            real = FRACCION_ESCALON[self.escalon_real(entity_id)]
+            if simulada > real and self._encendido_real(entity_id):
+                ajuste -= (self._consumo(entity_id) or 0.0) * (simulada - real) / (1 - real)
+            elif simulada < real:
+                ajuste += (self.apagados_reales[entity_id][0] or 0.0) * (real - simulada)
+        return self.medida + ajuste
+
+    def _miembros(self, unidad):
+        return self.grupos.get(unidad, (unidad,))
+
+    def _consumo(self, unidad):
+        """Último consumo medido de una unidad (suma de los miembros si es un grupo)."""
+        lecturas = [self.consumos.get(m) for m in self._miembros(unidad)]
+        lecturas = [l for l in lecturas if l is not None]
+        return sum(lecturas) if lecturas else None
+
+    def _limite(self, ts):
+        return self.horario.limite(datetime.fromtimestamp(ts, self.zona))
+
+    def _limite_efectivo(self, ts, reactivar=False):
+        """Igual que ``limite_efectivo`` de la integración (maxímetro o límite del horario)."""
+        limite = self._limite(ts)
+        if not self.maximetro:
+            return limite
+        admisible = self.ventana.admisible(ts, limite)
+        return min(admisible, limite) if reactivar else admisible
+
+    def _registrar_demanda(self, ts):
+        """Lleva a la ventana cuartohoraria la potencia simulada tras un cambio."""
+        self.ventana.actualizar(ts, self.potencia_simulada())
+
+    def _encendido_real(self, entity_id):
+        if entity_id in self.grupos:
+            return any(self.estados.get(m) == "on" for m in self.grupos[entity_id])
+        estado = self.estados.get(entity_id)
+        if entity_id.startswith("climate."):
+            return estado not in (None, "off") and estado not in ESTADOS_INVALIDOS
+        return estado == "on"
+
+    def _disponible(self, unidad):
+        return all(self.estados.get(m) not in ESTADOS_INVALIDOS for m in self._miembros(unidad))
+
+    def _avanzar(self, ts):
+        """Integra el exceso sobre el límite desde el último instante hasta ``ts``."""
+        if self._ultimo_ts is not None and ts > self._ultimo_ts:
+            potencia = self.potencia_simulada()
+            if potencia is not None:
+                exceso = potencia - self._limite(self._ultimo_ts)
+                if exceso > 0:
+                    duracion = ts - self._ultimo_ts
+                    self.segundos_exceso += duracion
+                    self.energia_exceso += exceso * duracion
+        self._ultimo_ts = ts
+
+    def aplicar_evento(self, ts, entity_id, estado):
+        """Aplica un cambio de estado del historial."""
+        self._avanzar(ts)
+        if entity_id in self.principales:
+            self.lecturas[entity_id] = _a_float(estado)
+            self.medida = potencia_neta(
+                self.lecturas.get(self.sensor),
+                self.lecturas.get(self.sensor_produccion),
+                self.lecturas.get(self.sensor_red),
+            )
+            if self.fotovoltaica:
+                self.envolvente.anadir(ts, self.potencia_simulada())
+        if entity_id in self.dispositivos:
+            self.estados[entity_id] = estado
+        for dispositivo in self._dispositivo_de_sensor.get(entity_id, []):
+            self.consumos[dispositivo] = _a_float(estado)
+        self._registrar_demanda(ts)
+
+    def _dispositivo(self, e):
+        """Dispositivo del planificador con el escalón y los escalones de la simulación."""
+        if e in self.apagados:
+            _consumo, _ts, escalon, escalones = self.apagados[e]
+        else:
+            escalon, escalones = ESCALON_NINGUNO, self.escalones.get(e, (ESCALON_APAGADO,))
+        return Dispositivo(
+            e,
+            escalon != ESCALON_APAGADO and (self._encendido_real(e) or e in self.apagados_reales),
+            (self.apagados_reales[e][0] if e in self.apagados_reales else None) or self._consumo(e),
+            self._disponible(e),
+            escalon,
+            escalones,
+        )
+
+    def instantanea(self, potencia, limite):
+        """Instantánea del planificador con el estado simulado."""
+        return Instantanea(
+            potencia=potencia,
+            potencia_max=limite,
+            dispositivos=tuple(self._dispositivo(e) for e in self.unidades),
+            apagados=tuple((e, consumo) for e, (consumo, *_resto) in self.apagados.items()),
+            bloqueados=frozenset(self.apagados),
+            invertir_orden=self.invertir_orden,
+        )
+
+    def tick_desactivacion(self, ts):
+        """Equivalente a control_consumo (un apagado por iteración del bucle)."""
+        self._avanzar(ts)
+        if self.continuacion is not None:
+            return  # Hay un bucle de apagado en curso (esperando tras un apagado)
+        self.ultima_evaluacion = ts
+        potencia = self.potencia_simulada()
+        if potencia is None:
+            return
+        self._bucle_apagado(ts, potencia)
+
+    def _bucle_apagado(self, ts, potencia):
+        limite = self._limite_efectivo(ts)
+        acciones = planificar_apagado(self.instantanea(potencia, limite))
+        if not acciones:
+            return
+        accion = acciones[0]
+        self.ultimo_apagado = ts
+        if accion.entity_id in self.apagados:
+            # Ya reducido: conserva el consumo original, el instante y la escalera
+            consumo, ts_apagado, _escalon, escalones = self.apagados[accion.entity_id]
+        else:
+            consumo, ts_apagado = accion.consumo_total, ts
+            escalones = self.escalones.get(accion.entity_id, (ESCALON_APAGADO,))
+        self.apagados[accion.entity_id] = (consumo, ts_apagado, accion.escalon, escalones)
+        self._registrar_demanda(ts)
+        self.apagados_simulados.append(
+            {"ts": ts, "entity_id": accion.entity_id, "escalon": accion.escalon,
+             "potencia": potencia, "limite": limite}
+        )
+        if self.al_actuar:
+            self.al_actuar(ts, APAGADO, accion.entity_id, accion.escalon)
+        # control_consumo descuenta el consumo y sigue tras ESPERA_TRAS_APAGADO
+        self.continuacion = (ts + ESPERA_TRAS_APAGADO, potencia - accion.consumo)
+
+    def continuar_apagado(self, ts):
+        """Siguiente iteración del bucle de apagado tras la espera."""
+        self._avanzar(ts)
+        _ts, potencia = self.continuacion
+        self.continuacion = None
+        self.ultima_evaluacion = ts
+        self._bucle_apagado(ts, potencia)
+
+    def tick_activacion(self, ts):
+        """Equivalente a reactivar_dispositivos (reactiva como mucho uno)."""
+        self._avanzar(ts)
+        potencia = self.potencia_simulada()
+        if potencia is None:
+            return
+        if self.fotovoltaica:
+            pico = self.envolvente.maximo(ts)
+            if pico is not None and pico > potencia:
+                potencia = pico
+        for accion in planificar_reactivacion(self.instantanea(potencia, self._limite_efectivo(ts, True))):
+            consumo, ts_apagado, _escalon, escalones = self.apagados[accion.entity_id]
+            if accion.tipo == ENCENDER:
+                del self.apagados[accion.entity_id]
+                self.reactivados_simulados.append(
+                    {"ts": ts, "entity_id": accion.entity_id, "retraso": ts - ts_apagado}
+                )
+            else:
+                # Sube un escalón y sigue controlado (en su posición del orden de apagado)
+                self.apagados[accion.entity_id] = (consumo, ts_apagado, accion.escalon, escalones)
+            self._registrar_demanda(ts)
+            if self.al_actuar:
+                self.al_actuar(ts, REACTIVACION, accion.entity_id, accion.escalon)
+
+    def intervalo_adaptativo(self, ts):
+        """Segundos hasta la siguiente comprobación de apagado (cadencia adaptativa)."""
+        asentando = self.ultimo_apagado is not None and ts - self.ultimo_apagado < ASENTAMIENTO
+        return cadencia(
+            self.potencia_simulada(), self._limite_efectivo(ts), self.intervalo_desactivacion,
+            self.banda_muestreo, asentando
+        )[0]
+
+    def iniciar(self, desde):
+        """Programa los primeros temporizadores a partir de ``desde``."""
+        self.siguiente_des = desde + self.intervalo_desactivacion
+        self.siguiente_act = desde + self.intervalo_activacion
+
+    def procesar(self, ts, entity_id, estado):
+        """Dispara los temporizadores vencidos y aplica un cambio de estado."""
+        self.avanzar_hasta(ts)
+        self.aplicar_evento(ts, entity_id, estado)
+        if entity_id in self.principales and self.continuacion is None:
+            # Una lectura cerca del límite adelanta la siguiente comprobación
+            potencia, limite = self.potencia_simulada(), self._limite_efectivo(ts)
+            if cerca_del_limite(potencia, limite, self.banda_muestreo):
+                adelanto = 0 if potencia > limite else self.intervalo_adaptativo(ts)
+                adelanto = intervalo_adelantado(ts, adelanto, self.ultima_evaluacion)
+                self.siguiente_des = min(self.siguiente_des, ts + adelanto)
+
+    def ejecutar(self, eventos, desde, hasta):
+        """Recorre el historial disparando los temporizadores en tiempo acelerado."""
+        self.iniciar(desde)
+        for ts, entity_id, estado in eventos:
+            self.procesar(ts, entity_id, estado)
+        self.avanzar(hasta)
+        self.ventana.actualizar(hasta, self.potencia_simulada())  # Cierra la última ventana completa
+        return self.informe(desde, hasta)
+
+    def avanzar(self, ts):
+        """Dispara los temporizadores vencidos y acumula el exceso hasta ``ts``."""
+        self.avanzar_hasta(ts)
+        self._avanzar(ts)
+
+    def avanzar_hasta(self, hasta):
+        """Dispara en orden todos los temporizadores vencidos antes de ``hasta``."""
+        while True:
+            pendientes = [self.siguiente_des, self.siguiente_act]
+            if self.continuacion is not None:
+                pendientes.append(self.continuacion[0])
+            ts = min(pendientes)
+            if ts > hasta:
+                return
+            if self.continuacion is not None and ts == self.continuacion[0]:
+                self.continuar_apagado(ts)
+            elif ts == self.siguiente_des:
+                self.tick_desactivacion(ts)
+                self.siguiente_des = ts + self.intervalo_adaptativo(ts)
+            else:
+                self.tick_activacion(ts)
+                self.siguiente_act += self.intervalo_activacion
+
+    def informe(self, desde, hasta):
+        """Resumen de la simulación."""
+        retrasos = [r["retraso"] for r in self.reactivados_simulados]
+        return {
+            "desde": datetime.fromtimestamp(desde, self.zona).isoformat(),
+            "hasta": datetime.fromtimestamp(hasta, self.zona).isoformat(),
+            "apagados": len(self.apagados_simulados),
+            "reactivaciones": len(self.reactivados_simulados),
+            "segundos_exceso": round(self.segundos_exceso, 1),
+            "energia_exceso_wh": round(self.energia_exceso / 3600, 2),
+            "demanda_maxima_w": round(self.ventana.maxima, 1) if self.ventana.maxima is not None else None,
+            "retraso_reactivacion_medio_s": round(sum(retrasos) / len(retrasos), 1) if retrasos else None,
+            "retraso_reactivacion_max_s": round(max(retrasos), 1) if retrasos else None,
+            "apagados_por_dispositivo": {
+                e: sum(1 for a in self.apagados_simulados if a["entity_id"] == e)
+                for e in self.unidades
+            },
+            "pendientes_al_final": list(self.apagados),
+        }
+
+
+# --------------------------------------------------------------------------
+# Línea de comandos
+# --------------------------------------------------------------------------
+
+def _valor(texto):
+    """Interpreta el valor de ``--set`` como JSON si es posible."""
+    try:
+        return json.loads(texto)
+    except ValueError:
+        return texto
+
+
+def _instante(texto, zona):
+    """Fecha ISO de la línea de comandos a timestamp (sin zona: la de Home Assistant)."""
+    momento = datetime.fromisoformat(texto)
+    if momento.tzinfo is None and zona is not None:
+        momento = momento.replace(tzinfo=zona)
+    return momento.timestamp()
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos."""
+    parser = argparse.ArgumentParser(description="Reproduce el historial del recorder con el limitador simulado")
+    parser.add_argument("--config-dir", default=".", help="Directorio de configuración de Home Assistant")
+    parser.add_argument("--db", help="Base de datos del recorder (por defecto home-assistant_v2.db)")
+    parser.add_argument("--desde", required=True, help="Inicio (ISO, hora local de Home Assistant)")
+    parser.add_argument("--hasta", required=True, help="Fin (ISO, hora local de Home Assistant)")
+    parser.add_argument("--set", action="append", default=[], metavar="CLAVE=VALOR",
+                        help="Sobrescribe una opción (valor JSON), p. ej. intervalo_desactivacion=20")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args(argv)
+
+    config = cargar_config(args.config_dir)
+    for asignacion in args.set:
+        clave, _, valor = asignacion.partition("=")
+        config[clave] = _valor(valor)
+
+    overrides = {**config.get("sensores_potencia", {}), **config.get("climate_power_sensors", {})}
+    sensores = resolver_sensores(args.config_dir, config["switches_limitados"], overrides)
+    zona = zona_horaria(args.config_dir)
+    simulacion = Simulacion(config, sensores, zona=zona)
+
+    desde = _instante(args.desde, zona)
+    hasta = _instante(args.hasta, zona)
+    ruta_db = args.db or os.path.join(args.config_dir, "home-assistant_v2.db")
+    con = sqlite3.connect(f"file:{ruta_db}?mode=ro", uri=True)
+    try:
+        informe = simulacion.ejecutar(historial(con, simulacion.entidades(), desde, hasta), desde, hasta)
+    finally:
+        con.close()
+
+    if args.json:
+        print(json.dumps(informe, indent=2, ensure_ascii=False))
+    else:
+        for clave, valor in informe.items():
+            print(f"{clave}: {valor}")
+
+
+if __name__ == "__main__":
+    main()
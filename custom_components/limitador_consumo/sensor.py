@@ -0,0 +1,189 @@
+"""Sensores de exposición a sobrecarga y del motor en sombra del Limitador de Consumo."""
+from homeassistant.components.sensor import (
+    RestoreSensor,
+    SensorEntity,
+    SensorDeviceClass,
+    SensorStateClass,
+)
+from homeassistant.const import UnitOfEnergy, UnitOfTime
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, SIGNAL_SOBRECARGA, SIGNAL_SOMBRA
+
+
+async def async_setup_entry(hass, entry, async_add_entities):
+    """Crear los sensores de sobrecarga y el del motor en sombra."""
+    contador = hass.data[DOMAIN][entry.entry_id]["sobrecarga"]
+    async_add_entities([
+        EnergiaSobrecargaSensor(entry, contador),
+        SobrecargaMaximaSensor(entry, contador),
+        EpisodiosSobrecargaSensor(entry, contador),
+        DivergenciasSombraSensor(hass, entry),
+    ])
+
+
+class _SobrecargaSensor(RestoreSensor):
+    """Base de los sensores de sobrecarga (se actualizan por señal, sin polling)."""
+
+    _attr_should_poll = False
+    _attr_has_entity_name = True
+    _clave = None
+
+    def __init__(self, entry, contador):
+        """Inicializar el sensor."""
+        self._entry_id = entry.entry_id
+        self._contador = contador
+        self._attr_unique_id = f"limitador_{self._clave}"
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, entry.entry_id)},
+            "name": "Limitador de Consumo",
+            "manufacturer": "Limitador Consumo v3",
+            "model": "Limitador",
+        }
+
+    async def async_added_to_hass(self):
+        """Restaurar el valor previo y suscribirse a las actualizaciones."""
+        await super().async_added_to_hass()
+        estado = await self.async_get_last_state()
+        ultimo = await self.async_get_last_sensor_data()
+        if estado is not None and ultimo is not None and ultimo.native_value is not None:
+            self._restaurar(float(ultimo.native_value), dt_util.as_local(estado.last_updated).date())
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_SOBRECARGA.format(self._entry_id), self._actualizado
+            )
+        )
+
+    def _restaurar(self, valor, dia):
+        """Recuperar el estado del contador tras un reinicio."""
+
+    def _restaurar_diario(self, dia):
+        """True si un valor diario guardado el día ``dia`` sigue siendo de hoy."""
+        hoy = dt_util.now().date()
+        if dia != hoy or self._contador.dia not in (None, hoy):
+            return False
+        self._contador.dia = hoy
+        return True
+
+    @callback
+    def _actualizado(self):
+        self.async_write_ha_state()
+
+
+class EnergiaSobrecargaSensor(_SobrecargaSensor):
+    """Energía consumida por encima del límite (Wh, acumulada)."""
+
+    _clave = "energia_sobrecarga"
+    _attr_name = "Energía en sobrecarga"
+    _attr_icon = "mdi:flash-alert"
+    _attr_device_class = SensorDeviceClass.ENERGY
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = UnitOfEnergy.WATT_HOUR
+    _attr_suggested_display_precision = 2
+
+    def _restaurar(self, valor, dia):
+        self._contador.energia_ws = max(self._contador.energia_ws, valor * 3600)
+
+    @property
+    def native_value(self):
+        return round(self._contador.energia_wh, 3)
+
+
+class SobrecargaMaximaSensor(_SobrecargaSensor):
+    """Episodio continuo de sobrecarga más largo del día (segundos)."""
+
+    _clave = "sobrecarga_maxima"
+    _attr_name = "Sobrecarga continua más larga hoy"
+    _attr_icon = "mdi:timer-alert"
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+
+    def _restaurar(self, valor, dia):
+        if self._restaurar_diario(dia):
+            self._contador.maximo_hoy = max(self._contador.maximo_hoy, valor)
+
+    @property
+    def native_value(self):
+        return round(self._contador.maximo_hoy, 1)
+
+    @property
+    def extra_state_attributes(self):
+        return {"en_sobrecarga": self._contador.en_sobrecarga}
+
+
+class EpisodiosSobrecargaSensor(_SobrecargaSensor):
+    """Número de episodios de sobrecarga del día (se reinicia a medianoche)."""
+
+    _clave = "episodios_sobrecarga"
+    _attr_name = "Episodios de sobrecarga hoy"
+    _attr_icon = "mdi:counter"
+    _attr_state_class = SensorStateClass.TOTAL
+    _attr_native_unit_of_measurement = "episodios"
+
+    def _restaurar(self, valor, dia):
+        if self._restaurar_diario(dia):
+            self._contador.episodios_hoy = max(self._contador.episodios_hoy, int(valor))
+
+    @property
+    def native_value(self):
+        return self._contador.episodios_hoy
+
+    @property
+    def last_reset(self):
+        # El instante real del reinicio: hasta entonces el valor es el del día anterior
+        if self._contador.reinicio is not None:
+            return dt_util.utc_from_timestamp(self._contador.reinicio)
+        return dt_util.start_of_local_day()
+
+
+class DivergenciasSombraSensor(SensorEntity):
+    """Acciones del motor en sombra sin equivalente en el limitador real (y viceversa).
+
+    No disponible si no hay configuración en sombra; el resumen completo está en
+    los atributos y en el diagnóstico.
+    """
+
+    _attr_should_poll = False
+    _attr_has_entity_name = True
+    _attr_name = "Divergencias del motor en sombra"
+    _attr_icon = "mdi:compare-horizontal"
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_native_unit_of_measurement = "acciones"
+
+    def __init__(self, hass, entry):
+        """Inicializar el sensor."""
+        self._datos = hass.data[DOMAIN][entry.entry_id]
+        self._entry_id = entry.entry_id
+        self._attr_unique_id = "limitador_divergencias_sombra"
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, entry.entry_id)},
+            "name": "Limitador de Consumo",
+            "manufacturer": "Limitador Consumo v3",
+            "model": "Limitador",
+        }
+
+    async def async_added_to_hass(self):
+        """Suscribirse a las actualizaciones del motor en sombra."""
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_SOMBRA.format(self._entry_id), self.async_write_ha_state
+            )
+        )
+
+    @property
+    def available(self):
+        return self._datos.get("sombra") is not None
+
+    @property
+    def native_value(self):
+        sombra = self._datos.get("sombra")
+        return sombra.divergencias if sombra else None
+
+    @property
+    def extra_state_attributes(self):
+        sombra = self._datos.get("sombra")
+        return sombra.resumen() if sombra else None
@@ -0,0 +1,88 @@
+"""Contabilidad de la exposición a sobrecarga (potencia por encima del límite)."""
+
+
+class ContadorSobrecarga:
+    """Integra ``max(0, potencia - límite)`` en el tiempo con cada lectura del contador.
+
+    Se usa la regla del rectángulo por la izquierda: el exceso de la lectura anterior
+    se mantiene hasta la lectura actual. Además de la energía acumulada lleva la
+    cuenta de los episodios de sobrecarga del día y del episodio más largo.
+    """
+
+    def __init__(self):
+        """Inicializar el contador."""
+        self.energia_ws = 0.0  # W·s por encima del límite (acumulado)
+        self.episodios_hoy = 0
+        self.maximo_hoy = 0.0  # Segundos del episodio continuo más largo de hoy
+        self.dia = None
+        self.reinicio = None  # Instante (ts) en que se reiniciaron los contadores diarios
+        self._ultimo = None  # (ts, exceso) de la lectura anterior
+        self._inicio_episodio = None
+
+    @property
+    def energia_wh(self):
+        return self.energia_ws / 3600
+
+    @property
+    def en_sobrecarga(self):
+        return self._inicio_episodio is not None
+
+    def nuevo_dia(self, ts, dia):
+        """Reinicia los contadores diarios si ``dia`` es un día nuevo.
+
+        Se llama a medianoche y, por si acaso, con cada lectura.
+
+        Returns:
+            True si se han reiniciado
+        """
+        if dia == self.dia:
+            return False
+        self.dia = dia
+        self.reinicio = ts
+        self.episodios_hoy = 0
+        self.maximo_hoy = 0.0
+        if self._inicio_episodio is not None:
+            # El episodio en curso cuenta también para el nuevo día
+            self._inicio_episodio = ts
+            self.episodios_hoy = 1
+        return True
+
+    def actualizar(self, ts, dia, potencia, limite):
+        """Procesa una lectura del contador.
+
+        Args:
+            ts: Marca de tiempo en segundos
+            dia: Fecha local de la lectura (para los contadores diarios)
+            potencia: Potencia medida en W (None si no hay lectura válida)
+            limite: Límite vigente en W
+
+        Returns:
+            True si ha cambiado algún valor expuesto
+        """
+        cambios = self.nuevo_dia(ts, dia)
+
+        if self._ultimo is not None:
+            ts_anterior, exceso_anterior = self._ultimo
+            if exceso_anterior > 0 and ts > ts_anterior:
+                self.energia_ws += exceso_anterior * (ts - ts_anterior)
+                cambios = True
+
+        exceso = max(0.0, potencia - limite) if potencia is not None else 0.0
+        if exceso > 0:
+            if self._inicio_episodio is None:
+                self._inicio_episodio = ts
+                self.episodios_hoy += 1
+                cambios = True
+            duracion = ts - self._inicio_episodio
+            if duracion > self.maximo_hoy:
+                self.maximo_hoy = duracion
+                cambios = True
+        elif self._inicio_episodio is not None:
+            duracion = ts - self._inicio_episodio
+            if duracion > self.maximo_hoy:
+                self.maximo_hoy = duracion
+            self._inicio_episodio = None
+            cambios = True
+
+        self._ultimo = (ts, exceso)
+        return cambios
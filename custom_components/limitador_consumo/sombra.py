@@ -0,0 +1,189 @@
+"""Motor en sombra: una configuración candidata evaluada en vivo, sin actuar.
+
+Es la misma ``Simulacion`` del simulador de historial, alimentada con los cambios
+de estado en vivo del contador y de los dispositivos. Sus acciones solo se
+registran: no hay llamadas a servicios ni tráfico hacia los dispositivos. Los
+climates usan la misma escalera de escalones que el limitador real. Cada acción se
+empareja con la del limitador real (mismo tipo, dispositivo y escalón en menos de
+``VENTANA_COINCIDENCIA`` segundos). Lo que queda sin pareja es una divergencia.
+"""
+from collections import deque
+
+from .planificador import ESCALON_NINGUNO
+from .replay import Simulacion
+
+VENTANA_COINCIDENCIA = 120  # Segundos para considerar que dos acciones coinciden
+TAM_REGISTRO = 200  # Últimas acciones de cada motor que se guardan
+
+# Opciones que se pueden cambiar en la configuración candidata
+CLAVES_SOMBRA = (
+    "potencia",
+    "intervalo_desactivacion",
+    "intervalo_activacion",
+    "invertir_orden_activacion",
+    "horario_limites",
+    "banda_muestreo",
+    "modo_maximetro",
+    "grupos_dispositivos",
+)
+
+# Opciones numéricas: valor mínimo (excluido) y máximo (excluido, None = sin máximo)
+RANGOS_SOMBRA = {
+    "potencia": (0, None),
+    "intervalo_desactivacion": (0, None),
+    "intervalo_activacion": (0, None),
+    "banda_muestreo": (0, 100),
+}
+# Opciones cuyo valor mínimo sí se admite (banda 0 = cadencia fija)
+MINIMO_ADMITIDO = ("banda_muestreo",)
+
+REAL = "real"
+SOMBRA = "sombra"
+
+
+def normalizar_sombra(cambios):
+    """Valida los cambios de la configuración candidata (None o vacío = sin sombra).
+
+    Raises:
+        ValueError: Si no es un diccionario, cambia opciones no admitidas o un
+            valor numérico está fuera de rango (horario y grupos los valida la simulación)
+    """
+    if not cambios:
+        return {}
+    if not isinstance(cambios, dict):
+        raise ValueError("La configuración en sombra debe ser un diccionario opción -> valor")
+    desconocidas = sorted(set(cambios) - set(CLAVES_SOMBRA))
+    if desconocidas:
+        raise ValueError(f"Opciones no admitidas en sombra: {', '.join(desconocidas)}")
+    for clave, (minimo, maximo) in RANGOS_SOMBRA.items():
+        if clave not in cambios:
+            continue
+        valor = cambios[clave]
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)) \
+                or valor < minimo or (valor == minimo and clave not in MINIMO_ADMITIDO) \
+                or (maximo is not None and valor >= maximo):
+            raise ValueError(f"Valor no válido para {clave}: {valor}")
+    return dict(cambios)
+
+
+class MotorSombra:
+    """Configuración candidata ejecutada junto al limitador real."""
+
+    def __init__(self, config, cambios, sensores, ts, zona=None):
+        """Preparar el motor en sombra.
+
+        Args:
+            config: Configuración real de la entrada
+            cambios: Opciones que cambian en la candidata (``normalizar_sombra``)
+            sensores: entity_id -> sensor de potencia del dispositivo
+            ts: Instante de inicio (segundos)
+            zona: Zona horaria de Home Assistant (para el horario de límites)
+        """
+        self.cambios = cambios
+        self.sim = Simulacion(
+            {**config, **cambios}, sensores, max_registros=TAM_REGISTRO,
+            al_actuar=self._accion_sombra, zona=zona,
+        )
+        self.sim.iniciar(ts)
+        self.desde = ts
+        self.acciones = {REAL: 0, SOMBRA: 0}
+        self.coincidencias = 0
+        self.solo = {REAL: 0, SOMBRA: 0}  # Acciones sin pareja en el otro motor
+        self._pendientes = {REAL: deque(), SOMBRA: deque()}  # (ts, tipo, entity_id, escalon) sin pareja aún
+        self.ultimas = deque(maxlen=TAM_REGISTRO)  # (ts, motor, tipo, entity_id, escalon)
+
+    def entidades(self):
+        """Entidades cuyos cambios de estado alimentan la simulación."""
+        return self.sim.entidades()
+
+    def evento(self, ts, entity_id, estado):
+        """Cambio de estado en vivo (estado como texto, None si se eliminó)."""
+        self.sim.procesar(ts, entity_id, estado)
+
+    def avanzar(self, ts):
+        """Dispara los temporizadores de la sombra vencidos hasta ``ts``."""
+        self.sim.avanzar(ts)
+        self._caducar(ts)
+
+    def apagados_reales(self, apagados):
+        """Dispositivos que el limitador real ya mantiene apagados o reducidos.
+
+        Args:
+            apagados: entity_id -> (consumo registrado, escalón)
+        """
+        self.sim.apagados_reales.clear()
+        self.sim.apagados_reales.update(apagados)
+
+    def escalones(self, escalones):
+        """Escalones disponibles de cada climate (los mismos que usa el limitador real)."""
+        self.sim.escalones.update(escalones)
+
+    def registrar_real(self, ts, tipo, entity_id, escalon, consumo=0):
+        """Acción ejecutada por el limitador real (APAGADO o REACTIVACION del diario).
+
+        ``escalon`` es el escalón de destino (``ESCALON_NINGUNO`` si se restauró del
+        todo) y ``consumo`` el registrado antes de reducirlo o apagarlo.
+        """
+        self.sim.avanzar_hasta(ts)  # La sombra decide antes con lo que había hasta ahora
+        if escalon == ESCALON_NINGUNO:
+            self.sim.apagados_reales.pop(entity_id, None)
+        else:
+            self.sim.apagados_reales[entity_id] = (consumo, escalon)
+        self._emparejar(ts, REAL, tipo, entity_id, escalon)
+
+    def _accion_sombra(self, ts, tipo, entity_id, escalon):
+        self._emparejar(ts, SOMBRA, tipo, entity_id, escalon)
+
+    def _emparejar(self, ts, motor, tipo, entity_id, escalon):
+        otro = SOMBRA if motor == REAL else REAL
+        self.acciones[motor] += 1
+        self.ultimas.append((ts, motor, tipo, entity_id, escalon))
+        self._caducar(ts)
+        pendientes = self._pendientes[otro]
+        for i, (_ts, *accion_otro) in enumerate(pendientes):
+            if accion_otro == [tipo, entity_id, escalon]:
+                del pendientes[i]
+                self.coincidencias += 1
+                return
+        self._pendientes[motor].append((ts, tipo, entity_id, escalon))
+
+    def _caducar(self, ts):
+        """Las acciones sin pareja tras la ventana de coincidencia cuentan como divergentes."""
+        for motor, pendientes in self._pendientes.items():
+            while pendientes and pendientes[0][0] < ts - VENTANA_COINCIDENCIA:
+                pendientes.popleft()
+                self.solo[motor] += 1
+
+    @property
+    def divergencias(self):
+        return self.solo[REAL] + self.solo[SOMBRA]
+
+    def apagados_divergentes(self):
+        """Dispositivos apagados o reducidos ahora en un escalón distinto en cada motor."""
+        return sorted(
+            e for e in set(self.sim.apagados) | set(self.sim.apagados_reales)
+            if self.sim.escalon(e) != self.sim.escalon_real(e)
+        )
+
+    def resumen(self):
+        """Resumen para el sensor y el diagnóstico."""
+        return {
+            "cambios": self.cambios,
+            "acciones_real": self.acciones[REAL],
+            "acciones_sombra": self.acciones[SOMBRA],
+            "coincidencias": self.coincidencias,
+            "solo_real": self.solo[REAL],
+            "solo_sombra": self.solo[SOMBRA],
+            "apagados_sombra": sorted(self.sim.apagados),
+            "apagados_divergentes": self.apagados_divergentes(),
+            "segundos_exceso_sombra": round(self.sim.segundos_exceso, 1),
+            "energia_exceso_sombra_wh": round(self.sim.energia_exceso / 3600, 2),
+            "demanda_maxima_sombra_w": round(self.sim.ventana.maxima, 1) if self.sim.ventana.maxima is not None else None,
+        }
+
+    def registro(self):
+        """Últimas acciones de ambos motores (para el diagnóstico)."""
+        return [
+            {"ts": ts, "motor": motor, "tipo": tipo, "entity_id": entity_id, "escalon": escalon}
+            for ts, motor, tipo, entity_id, escalon in self.ultimas
+        ]
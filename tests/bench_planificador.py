@@ -0,0 +1,50 @@
+"""Benchmark del planificador: ``python tests/bench_planificador.py [dispositivos]``.
+
+Mide cuántas planificaciones de apagado y de reactivación por segundo se pueden
+evaluar con una instantánea de ``dispositivos`` dispositivos (20 por defecto).
+"""
+import sys
+import timeit
+
+from paquete import cargar
+
+p = cargar("planificador")
+
+
+def instantaneas(n):
+    """Instantánea con exceso (todos encendidos) y otra con la mitad apagados."""
+    escalera = (p.ESCALON_CONSIGNA, p.ESCALON_ECO, p.ESCALON_APAGADO)
+    encendidos = tuple(
+        p.Dispositivo(f"climate.c{i}", True, 1000.0, escalones=escalera) if i % 4 == 0
+        else p.Dispositivo(f"switch.s{i}", True, 500.0)
+        for i in range(n)
+    )
+    apagado = p.Instantanea(potencia=n * 600.0, potencia_max=n * 300.0, dispositivos=encendidos)
+    mitad = tuple(
+        d._replace(encendido=False, escalon=p.ESCALON_APAGADO) if i % 2 else d
+        for i, d in enumerate(encendidos)
+    )
+    apagados = tuple((d.entity_id, d.consumo) for d in mitad if not d.encendido)
+    reactivacion = p.Instantanea(
+        potencia=n * 350.0, potencia_max=n * 400.0, dispositivos=mitad,
+        apagados=apagados, bloqueados=frozenset(e for e, _ in apagados),
+    )
+    return apagado, reactivacion
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    n = int(argv[0]) if argv else 20
+    apagado, reactivacion = instantaneas(n)
+    for nombre, funcion, instantanea in (
+        ("planificar_apagado", p.planificar_apagado, apagado),
+        ("planificar_reactivacion", p.planificar_reactivacion, reactivacion),
+    ):
+        temporizador = timeit.Timer(lambda: funcion(instantanea))
+        repeticiones, _ = temporizador.autorange()
+        mejor = min(temporizador.repeat(repeat=5, number=repeticiones)) / repeticiones
+        print(f"{nombre} ({n} dispositivos): {mejor * 1e6:.1f} µs/llamada, {1 / mejor:,.0f} llamadas/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Importa los módulos puros de la integración sin necesitar Home Assistant."""
+import importlib
+import sys
+import types
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+PAQUETE = "custom_components.limitador_consumo"
+
+
+def cargar(nombre):
+    """Importa ``custom_components.limitador_consumo.<nombre>``.
+
+    Los módulos puros (planificador, limites, maximetro...) no dependen de Home
+    Assistant, pero el ``__init__`` del paquete sí. Si HA no está instalado se
+    registra el paquete sin ejecutar su ``__init__``.
+    """
+    if str(RAIZ) not in sys.path:
+        sys.path.insert(0, str(RAIZ))
+    if PAQUETE not in sys.modules:
+        try:
+            importlib.import_module(PAQUETE)
+        except ImportError:
+            paquete = types.ModuleType(PAQUETE)
+            paquete.__path__ = [str(RAIZ / "custom_components" / "limitador_consumo")]
+            sys.modules[PAQUETE] = paquete
+    return importlib.import_module(f"{PAQUETE}.{nombre}")
@@ -0,0 +1,124 @@
+"""Pruebas de la actuación con reintentos y del disyuntor por dispositivo."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from homeassistant.exceptions import HomeAssistantError  # noqa: E402
+
+from paquete import cargar  # noqa: E402
+
+actuacion = cargar("actuacion")
+
+
+class _Servicios:
+    """``hass.services`` que responde a cada llamada según un guion."""
+
+    def __init__(self, guion):
+        self.guion = list(guion)  # "ok", "error" o "timeout" por intento
+        self.llamadas = 0
+
+    async def async_call(self, dominio, servicio, datos, blocking=False):
+        resultado = self.guion[self.llamadas]
+        self.llamadas += 1
+        if resultado == "error":
+            raise HomeAssistantError("sin conexión")
+        if resultado == "timeout":
+            await asyncio.Event().wait()
+
+
+class _Hass:
+    def __init__(self, guion):
+        self.services = _Servicios(guion)
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Sustituye las esperas entre reintentos y devuelve las duraciones pedidas."""
+    registradas = []
+
+    async def dormir(segundos):
+        registradas.append(segundos)
+
+    monkeypatch.setattr(actuacion.asyncio, "sleep", dormir)
+    return registradas
+
+
+def _llamar(hass, **opciones):
+    fallos = []
+    coro = actuacion.llamar_servicio(
+        hass, "switch", "turn_off", {"entity_id": "switch.termo"}, al_fallar=fallos.append, **opciones
+    )
+    return asyncio.run(coro), fallos
+
+
+def test_exito_tras_reintentos_con_espera_exponencial(esperas):
+    hass = _Hass(["error", "error", "ok"])
+    _resultado, fallos = _llamar(hass, reintentos=2)
+    assert hass.services.llamadas == 3
+    assert fallos == ["sin conexión", "sin conexión"]
+    assert esperas == [actuacion.ESPERA_REINTENTO, actuacion.ESPERA_REINTENTO * 2]
+
+
+def test_error_en_todos_los_intentos(esperas):
+    hass = _Hass(["error", "error"])
+    with pytest.raises(actuacion.ErrorActuacion) as err:
+        _llamar(hass, reintentos=1)
+    assert not isinstance(err.value, actuacion.TimeoutActuacion)
+
+
+def test_timeout_se_distingue_y_se_nombra(esperas):
+    hass = _Hass(["timeout", "error"])
+    fallos = []
+    with pytest.raises(actuacion.TimeoutActuacion):
+        asyncio.run(actuacion.llamar_servicio(
+            hass, "switch", "turn_off", {"entity_id": "switch.termo"},
+            timeout=0.01, reintentos=1, al_fallar=fallos.append,
+        ))
+    # Un timeout anterior puede haberse aplicado aunque el último intento diera error
+    assert fallos == ["timeout", "sin conexión"]
+
+
+def test_disyuntor_se_abre_al_alcanzar_el_umbral():
+    disyuntor = actuacion.DisyuntorDispositivos(umbral=3, enfriamiento=300)
+    for _ in range(2):
+        disyuntor.fallo("switch.termo", "timeout", ahora=0)
+    assert disyuntor.disponible("switch.termo", ahora=0)
+    disyuntor.fallo("switch.termo", "timeout", ahora=10)
+    assert not disyuntor.disponible("switch.termo", ahora=10)
+    estado = disyuntor.diagnostico(ahora=10)["switch.termo"]
+    assert estado["estado"] == "abierto"
+    assert estado["fallos_seguidos"] == 3
+    assert estado["segundos_restantes"] == 300
+    assert estado["ultimo_error"] == "timeout"
+
+
+def test_disyuntor_semiabierto_se_cierra_con_un_exito():
+    disyuntor = actuacion.DisyuntorDispositivos(umbral=1, enfriamiento=300)
+    disyuntor.fallo("switch.termo", ahora=0)
+    assert disyuntor.diagnostico(ahora=300)["switch.termo"]["estado"] == "semiabierto"
+    assert disyuntor.disponible("switch.termo", ahora=300)
+    disyuntor.exito("switch.termo")
+    assert disyuntor.diagnostico(ahora=300) == {}
+    assert disyuntor.disponible("switch.termo", ahora=300)
+
+
+def test_disyuntor_semiabierto_se_reabre_con_un_fallo():
+    disyuntor = actuacion.DisyuntorDispositivos(umbral=2, enfriamiento=300)
+    disyuntor.fallo("switch.termo", ahora=0)
+    disyuntor.fallo("switch.termo", ahora=0)
+    disyuntor.fallo("switch.termo", ahora=300)  # Intento de prueba fallido
+    assert not disyuntor.disponible("switch.termo", ahora=300)
+    assert disyuntor.diagnostico(ahora=300)["switch.termo"]["segundos_restantes"] == 300
+
+
+def test_disyuntor_cuenta_cada_intento_fallido(esperas):
+    disyuntor = actuacion.DisyuntorDispositivos(umbral=3)
+    hass = _Hass(["error", "error", "error"])
+    with pytest.raises(actuacion.ErrorActuacion):
+        asyncio.run(actuacion.llamar_servicio(
+            hass, "switch", "turn_off", {"entity_id": "switch.termo"}, reintentos=2,
+            al_fallar=lambda err: disyuntor.fallo("switch.termo", err),
+        ))
+    assert not disyuntor.disponible("switch.termo")
@@ -0,0 +1,85 @@
+"""Pruebas de la compilación del horario de límites en la tabla por minutos."""
+from datetime import datetime
+
+import pytest
+
+from paquete import cargar
+
+limites = cargar("limites")
+HorarioLimites = limites.HorarioLimites
+
+LUNES = datetime(2026, 3, 2)
+SABADO = datetime(2026, 3, 7)
+
+
+def _a_las(dia, hora, minuto=0):
+    return dia.replace(hour=hora, minute=minuto)
+
+
+def test_sin_horario_el_limite_es_fijo():
+    horario = HorarioLimites(4600)
+    assert horario.limite(_a_las(LUNES, 12)) == 4600
+    assert not horario.variable
+    assert horario.siguiente_cambio(_a_las(LUNES, 12)) is None
+
+
+def test_periodo_por_debajo_de_la_potencia_por_defecto():
+    horario = HorarioLimites(4600, {"periodos": [
+        {"dias": ["lun", "mar", "mie", "jue", "vie"], "desde": "18:00", "hasta": "22:00", "potencia": 4000},
+    ]})
+    assert horario.limite(_a_las(LUNES, 17, 59)) == 4600
+    assert horario.limite(_a_las(LUNES, 18)) == 4000
+    assert horario.limite(_a_las(LUNES, 21, 59)) == 4000
+    assert horario.limite(_a_las(LUNES, 22)) == 4600
+    assert horario.limite(_a_las(SABADO, 19)) == 4600
+
+
+def test_periodo_valle_por_encima_de_la_potencia_por_defecto_cruzando_medianoche():
+    horario = HorarioLimites(4600, [{"desde": "22:00", "hasta": "06:00", "potencia": 6000}])
+    assert horario.limite(_a_las(LUNES, 2)) == 6000
+    assert horario.limite(_a_las(LUNES, 23)) == 6000
+    assert horario.limite(_a_las(LUNES, 6)) == 4600
+    assert horario.limite(_a_las(LUNES, 12)) == 4600
+
+
+def test_periodos_solapados_aplican_el_mas_bajo():
+    horario = HorarioLimites(4600, [
+        {"desde": "00:00", "hasta": "08:00", "potencia": 6000},
+        {"desde": "02:00", "hasta": "04:00", "potencia": 5000},
+    ])
+    assert horario.limite(_a_las(LUNES, 1)) == 6000
+    assert horario.limite(_a_las(LUNES, 3)) == 5000
+    assert horario.limite(_a_las(LUNES, 5)) == 6000
+
+
+def test_festivos_usan_su_perfil():
+    horario = HorarioLimites(4600, {
+        "periodos": [
+            {"dias": [0, 1, 2, 3, 4], "desde": "08:00", "hasta": "24:00", "potencia": 4000},
+            {"dias": "festivo", "potencia": 6000},
+        ],
+        "festivos": ["2026-03-02", "12-25"],
+    })
+    assert horario.limite(_a_las(LUNES, 10)) == 6000
+    assert horario.limite(datetime(2026, 3, 3, 10)) == 4000
+    assert horario.limite(datetime(2027, 12, 25, 10)) == 6000
+
+
+def test_siguiente_cambio():
+    horario = HorarioLimites(4600, [{"desde": "18:00", "hasta": "22:00", "potencia": 4000}])
+    assert horario.siguiente_cambio(_a_las(LUNES, 10)) == _a_las(LUNES, 18)
+    assert horario.siguiente_cambio(_a_las(LUNES, 18)) == _a_las(LUNES, 22)
+    assert horario.siguiente_cambio(_a_las(LUNES, 23)) == datetime(2026, 3, 3)
+
+
+@pytest.mark.parametrize("horario", [
+    "no es un horario",
+    [{"desde": "10:00"}],
+    [{"desde": "25:00", "potencia": 4000}],
+    [{"potencia": 0}],
+    [{"dias": ["lunes"], "potencia": 4000}],
+    {"periodos": [], "festivos": ["2026-02-30"]},
+])
+def test_horarios_no_validos(horario):
+    with pytest.raises(ValueError):
+        HorarioLimites(4600, horario)
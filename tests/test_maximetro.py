@@ -0,0 +1,58 @@
+"""Pruebas de la ventana de demanda cuartohoraria."""
+import pytest
+
+from paquete import cargar
+
+maximetro = cargar("maximetro")
+VentanaDemanda = maximetro.VentanaDemanda
+
+INICIO = 900 * 1000  # Alineado al inicio de una ventana
+
+
+def test_sin_lecturas():
+    ventana = VentanaDemanda()
+    assert ventana.proyeccion(INICIO) is None
+    assert ventana.media(INICIO) is None
+    assert ventana.admisible(INICIO, 4000) == 4000
+
+
+def test_potencia_constante_se_proyecta_igual():
+    ventana = VentanaDemanda()
+    ventana.actualizar(INICIO, 3000)
+    assert ventana.proyeccion(INICIO + 300) == pytest.approx(3000)
+    assert ventana.media(INICIO + 300) == pytest.approx(3000)
+
+
+def test_proyeccion_con_un_pico():
+    ventana = VentanaDemanda()
+    ventana.actualizar(INICIO, 2000)
+    ventana.actualizar(INICIO + 300, 5000)
+    # 300 s a 2000 W y el resto (600 s) a 5000 W
+    assert ventana.proyeccion(INICIO + 300) == pytest.approx((2000 * 300 + 5000 * 600) / 900)
+    assert ventana.proyeccion(INICIO + 300, 0) == pytest.approx(2000 * 300 / 900)
+
+
+def test_admisible_lleva_la_proyeccion_al_objetivo():
+    ventana = VentanaDemanda()
+    ventana.actualizar(INICIO, 6000)
+    ventana.actualizar(INICIO + 450, 6000)
+    admisible = ventana.admisible(INICIO + 450, 4000)
+    assert admisible == pytest.approx(2000)
+    assert ventana.proyeccion(INICIO + 450, admisible) == pytest.approx(4000)
+
+
+def test_cierre_de_ventanas_y_maxima():
+    ventana = VentanaDemanda()
+    ventana.actualizar(INICIO, 3000)
+    ventana.actualizar(INICIO + 900, 1000)  # Cierra la primera ventana
+    assert ventana.ultima_media == pytest.approx(3000)
+    ventana.actualizar(INICIO + 3 * 900 + 10, 1000)  # Ventanas completas sin lecturas
+    assert ventana.ultima_media == pytest.approx(1000)
+    assert ventana.maxima == pytest.approx(3000)
+    assert ventana.inicio == INICIO + 3 * 900
+
+
+def test_exportacion_cuenta_como_cero():
+    ventana = VentanaDemanda()
+    ventana.actualizar(INICIO, -2000)
+    assert ventana.proyeccion(INICIO + 100) == 0
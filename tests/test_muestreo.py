@@ -0,0 +1,43 @@
+"""Pruebas del muestreo adaptativo y de las evaluaciones adelantadas por lecturas."""
+from paquete import cargar
+
+muestreo = cargar("muestreo")
+sombra = cargar("sombra")
+
+
+def test_adelanto_sin_evaluacion_previa():
+    assert muestreo.intervalo_adelantado(100, 0, None) == 0
+    assert muestreo.intervalo_adelantado(100, 7, None) == 7
+
+
+def test_adelanto_no_baja_del_intervalo_minimo():
+    assert muestreo.intervalo_adelantado(101, 0, 100) == muestreo.INTERVALO_MINIMO - 1
+    assert muestreo.intervalo_adelantado(200, 0, 100) == 0
+    assert muestreo.intervalo_adelantado(101, 30, 100) == 30
+
+
+def test_simulacion_no_evalua_en_cada_lectura_sin_nada_que_apagar():
+    config = {
+        "sensor_potencia": "sensor.potencia",
+        "switches_limitados": ["switch.termo"],
+        "potencia": 3000,
+        "intervalo_desactivacion": 60,
+        "intervalo_activacion": 30,
+        "banda_muestreo": 0.1,
+    }
+    motor = sombra.MotorSombra(config, {"potencia": 3000}, {"switch.termo": "sensor.termo"}, 0)
+    evaluaciones = []
+    tick = motor.sim.tick_desactivacion
+
+    def contar(ts):
+        evaluaciones.append(ts)
+        tick(ts)
+
+    motor.sim.tick_desactivacion = contar
+    motor.evento(0, "switch.termo", "off")
+    for ts in range(0, 21):  # Por encima del límite sin nada encendido, una lectura por segundo
+        motor.evento(ts, "sensor.potencia", "3400")
+    motor.avanzar(21)
+    assert motor.sim.apagados == {}
+    assert all(b - a >= muestreo.INTERVALO_MINIMO for a, b in zip(evaluaciones, evaluaciones[1:]))
+    assert len(evaluaciones) == 21 // muestreo.INTERVALO_MINIMO + 1
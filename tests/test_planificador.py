@@ -0,0 +1,154 @@
+"""Pruebas del planificador puro (escalones de apagado y reactivación)."""
+from paquete import cargar
+
+p = cargar("planificador")
+
+ESCALERA_CLIMATE = (p.ESCALON_CONSIGNA, p.ESCALON_ECO, p.ESCALON_APAGADO)
+
+
+def _instantanea(potencia, limite, *dispositivos, apagados=(), invertir_orden=True):
+    return p.Instantanea(
+        potencia=potencia,
+        potencia_max=limite,
+        dispositivos=tuple(dispositivos),
+        apagados=tuple(apagados),
+        bloqueados=frozenset(e for e, _ in apagados),
+        invertir_orden=invertir_orden,
+    )
+
+
+def test_sin_exceso_no_hay_acciones():
+    instantanea = _instantanea(3000, 4000, p.Dispositivo("switch.a", True, 1000))
+    assert p.planificar_apagado(instantanea) == []
+
+
+def test_apaga_en_orden_hasta_volver_al_limite():
+    instantanea = _instantanea(
+        5000, 4000,
+        p.Dispositivo("switch.a", True, 600),
+        p.Dispositivo("switch.b", True, 800),
+        p.Dispositivo("switch.c", True, 2000),
+    )
+    acciones = p.planificar_apagado(instantanea)
+    assert [(a.tipo, a.entity_id, a.consumo) for a in acciones] == [
+        (p.APAGAR, "switch.a", 600),
+        (p.APAGAR, "switch.b", 800),
+    ]
+    assert acciones[1].potencia == 4400
+
+
+def test_omite_apagados_no_disponibles_y_sin_escalones_libres():
+    instantanea = _instantanea(
+        5000, 4000,
+        p.Dispositivo("switch.apagado", False, 1500),
+        p.Dispositivo("switch.caido", True, 1500, disponible=False),
+        p.Dispositivo("switch.ya_limitado", True, 1500, escalon=p.ESCALON_APAGADO),
+        p.Dispositivo("switch.b", True, 1500),
+    )
+    assert [a.entity_id for a in p.planificar_apagado(instantanea)] == ["switch.b"]
+
+
+def test_sin_consumo_conocido_apaga_y_sigue_con_el_siguiente():
+    instantanea = _instantanea(
+        5000, 4000,
+        p.Dispositivo("switch.sin_sensor", True, None),
+        p.Dispositivo("switch.b", True, 1500),
+    )
+    acciones = p.planificar_apagado(instantanea)
+    assert [(a.entity_id, a.consumo) for a in acciones] == [("switch.sin_sensor", 0.0), ("switch.b", 1500)]
+
+
+def _climate(consumo, escalon=p.ESCALON_NINGUNO):
+    return p.Dispositivo("climate.salon", True, consumo, escalon=escalon, escalones=ESCALERA_CLIMATE)
+
+
+def test_climate_elige_el_escalon_mas_barato_que_cubre_el_exceso():
+    total = 2000
+    fraccion = p.FRACCION_ESCALON
+    casos = [
+        (total * fraccion[p.ESCALON_CONSIGNA], p.REDUCIR, p.ESCALON_CONSIGNA),
+        (total * fraccion[p.ESCALON_ECO], p.REDUCIR, p.ESCALON_ECO),
+        (total * fraccion[p.ESCALON_ECO] + 1, p.APAGAR, p.ESCALON_APAGADO),
+    ]
+    for exceso, tipo, escalon in casos:
+        accion, = p.planificar_apagado(_instantanea(4000 + exceso, 4000, _climate(total)))
+        assert (accion.tipo, accion.escalon) == (tipo, escalon)
+        assert accion.consumo == total * fraccion[escalon]
+        assert accion.consumo_total == total
+
+
+def test_climate_reducido_usa_el_consumo_registrado_y_descuenta_lo_ya_recuperado():
+    total = 2000
+    fraccion = p.FRACCION_ESCALON
+    instantanea = _instantanea(
+        4100, 4000, _climate(900, escalon=p.ESCALON_CONSIGNA),
+        apagados=[("climate.salon", total)],
+    )
+    accion, = p.planificar_apagado(instantanea)
+    assert accion.escalon == p.ESCALON_ECO
+    assert accion.consumo == total * (fraccion[p.ESCALON_ECO] - fraccion[p.ESCALON_CONSIGNA])
+
+
+def _apagado(entity_id, consumo):
+    """Switch apagado por el limitador (así lo describe la instantánea de la integración)."""
+    return p.Dispositivo(entity_id, False, consumo, escalon=p.ESCALON_APAGADO)
+
+
+def test_reactiva_el_ultimo_apagado_si_cabe():
+    instantanea = _instantanea(
+        2000, 4000,
+        _apagado("switch.a", 0),
+        _apagado("switch.b", 0),
+        apagados=[("switch.a", 1500), ("switch.b", 1000)],
+    )
+    accion, = p.planificar_reactivacion(instantanea)
+    assert (accion.tipo, accion.entity_id, accion.consumo) == (p.ENCENDER, "switch.b", 1000)
+
+
+def test_reactivacion_sin_invertir_y_solo_si_cabe():
+    dispositivos = (_apagado("switch.a", 0), _apagado("switch.b", 0))
+    apagados = [("switch.a", 2500), ("switch.b", 1000)]
+    accion, = p.planificar_reactivacion(
+        _instantanea(2000, 4000, *dispositivos, apagados=apagados, invertir_orden=False)
+    )
+    assert accion.entity_id == "switch.b"  # switch.a (2500 W) no cabe
+    assert p.planificar_reactivacion(_instantanea(3500, 4000, *dispositivos, apagados=apagados)) == []
+
+
+def test_reactivacion_sin_consumo_usa_el_margen():
+    dispositivos = (_apagado("switch.a", None),)
+    limite = 4000
+    dentro = limite * p.MARGEN_SIN_CONSUMO - 1
+    accion, = p.planificar_reactivacion(_instantanea(dentro, limite, *dispositivos, apagados=[("switch.a", 0)]))
+    assert accion.razon == p.RAZON_SIN_SENSOR
+    assert p.planificar_reactivacion(
+        _instantanea(dentro + 2, limite, *dispositivos, apagados=[("switch.a", 0)])
+    ) == []
+
+
+def test_reactivacion_omite_encendidos_a_mano_y_sin_bloqueo():
+    instantanea = p.Instantanea(
+        potencia=1000,
+        potencia_max=4000,
+        dispositivos=(p.Dispositivo("switch.a", True, 500, escalon=p.ESCALON_APAGADO), _apagado("switch.b", 500)),
+        apagados=(("switch.a", 500), ("switch.b", 500)),
+        bloqueados=frozenset({"switch.a"}),
+    )
+    assert p.planificar_reactivacion(instantanea) == []
+
+
+def test_climate_reducido_se_restaura_de_escalon_en_escalon():
+    total = 2000
+    fraccion = p.FRACCION_ESCALON
+    instantanea = _instantanea(
+        1000, 4000, _climate(700, escalon=p.ESCALON_ECO), apagados=[("climate.salon", total)]
+    )
+    accion, = p.planificar_reactivacion(instantanea)
+    assert (accion.tipo, accion.escalon) == (p.RESTAURAR, p.ESCALON_CONSIGNA)
+    assert accion.consumo == total * (fraccion[p.ESCALON_ECO] - fraccion[p.ESCALON_CONSIGNA])
+
+    instantanea = _instantanea(
+        1000, 4000, _climate(1400, escalon=p.ESCALON_CONSIGNA), apagados=[("climate.salon", total)]
+    )
+    accion, = p.planificar_reactivacion(instantanea)
+    assert (accion.tipo, accion.escalon) == (p.ENCENDER, p.ESCALON_NINGUNO)
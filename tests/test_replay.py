@@ -0,0 +1,92 @@
+"""Pruebas de la lectura del recorder (esquema moderno y anterior a 2023.3)."""
+import sqlite3
+
+import pytest
+
+from paquete import cargar
+
+replay = cargar("replay")
+
+
+def _moderna(estados):
+    """Base de datos con states_meta y last_updated_ts (HA 2023.4+)."""
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE states_meta (metadata_id INTEGER PRIMARY KEY, entity_id TEXT)")
+    con.execute(
+        "CREATE TABLE states (state_id INTEGER PRIMARY KEY, metadata_id INTEGER, "
+        "state TEXT, last_updated_ts FLOAT)"
+    )
+    ids = {}
+    for entity_id, ts, estado in estados:
+        if entity_id not in ids:
+            ids[entity_id] = con.execute(
+                "INSERT INTO states_meta (entity_id) VALUES (?)", (entity_id,)
+            ).lastrowid
+        con.execute(
+            "INSERT INTO states (metadata_id, state, last_updated_ts) VALUES (?, ?, ?)",
+            (ids[entity_id], estado, ts),
+        )
+    return con
+
+
+def _antigua(estados):
+    """Base de datos anterior a 2023.3: entity_id y last_updated como texto UTC."""
+    con = sqlite3.connect(":memory:")
+    con.execute(
+        "CREATE TABLE states (state_id INTEGER PRIMARY KEY, entity_id TEXT, "
+        "state TEXT, last_updated DATETIME)"
+    )
+    for entity_id, ts, estado in estados:
+        con.execute(
+            "INSERT INTO states (entity_id, state, last_updated) VALUES (?, ?, ?)",
+            (entity_id, estado, replay._a_db_texto(ts)),
+        )
+    return con
+
+
+ESTADOS = [
+    ("sensor.potencia", 50.0, "1000"),
+    ("sensor.potencia", 100.0, "2000"),  # Justo en ``desde``
+    ("sensor.potencia", 110.0, "2100"),
+    ("sensor.potencia", 110.0, "2200"),  # Mismo instante: se ordena por state_id
+    ("sensor.potencia", 120.0, "2300"),
+    ("sensor.potencia", 200.0, "9999"),  # En ``hasta``: queda fuera
+]
+
+
+@pytest.mark.parametrize("crear", [_moderna, _antigua])
+@pytest.mark.parametrize("tam_bloque", [1, 2, 100])
+def test_historial_entidad_sin_duplicados_y_por_bloques(crear, tam_bloque):
+    con = crear(ESTADOS)
+    eventos = list(replay.historial_entidad(con, "sensor.potencia", 100.0, 200.0, tam_bloque))
+    assert [(ts, estado) for ts, _e, estado in eventos] == [
+        (100.0, "1000"),  # Estado previo, al inicio
+        (100.0, "2000"),
+        (110.0, "2100"),
+        (110.0, "2200"),
+        (120.0, "2300"),
+    ]
+
+
+def test_entidad_sin_historial():
+    con = _moderna(ESTADOS)
+    assert list(replay.historial_entidad(con, "sensor.otro", 0.0, 1000.0)) == []
+
+
+@pytest.mark.parametrize("crear", [_moderna, _antigua])
+def test_historial_mezcla_en_orden_temporal(crear):
+    con = crear([
+        ("sensor.potencia", 10.0, "1000"),
+        ("switch.termo", 15.0, "on"),
+        ("sensor.potencia", 20.0, "3000"),
+        ("switch.termo", 25.0, "off"),
+        ("sensor.potencia", 30.0, "1500"),
+    ])
+    eventos = list(replay.historial(con, ["sensor.potencia", "switch.termo"], 0.0, 100.0, tam_bloque=1))
+    assert [(ts, e) for ts, e, _estado in eventos] == [
+        (10.0, "sensor.potencia"),
+        (15.0, "switch.termo"),
+        (20.0, "sensor.potencia"),
+        (25.0, "switch.termo"),
+        (30.0, "sensor.potencia"),
+    ]
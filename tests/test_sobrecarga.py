@@ -0,0 +1,68 @@
+"""Pruebas del contador de exposición a sobrecarga."""
+from datetime import date
+
+import pytest
+
+from paquete import cargar
+
+ContadorSobrecarga = cargar("sobrecarga").ContadorSobrecarga
+
+HOY = date(2026, 3, 2)
+MANANA = date(2026, 3, 3)
+
+
+def test_integra_el_exceso_con_el_rectangulo_por_la_izquierda():
+    contador = ContadorSobrecarga()
+    contador.actualizar(0, HOY, 5000, 4000)
+    contador.actualizar(10, HOY, 4500, 4000)  # 10 s a 1000 W de exceso
+    contador.actualizar(30, HOY, 3000, 4000)  # 20 s a 500 W de exceso
+    assert contador.energia_ws == pytest.approx(10 * 1000 + 20 * 500)
+    assert contador.energia_wh == pytest.approx(20000 / 3600)
+
+
+def test_episodios_y_episodio_mas_largo():
+    contador = ContadorSobrecarga()
+    for ts, potencia in [(0, 5000), (30, 5000), (40, 3000), (100, 5000), (110, 3000)]:
+        contador.actualizar(ts, HOY, potencia, 4000)
+    assert contador.episodios_hoy == 2
+    assert contador.maximo_hoy == 40
+    assert not contador.en_sobrecarga
+
+
+def test_lectura_no_valida_no_es_sobrecarga():
+    contador = ContadorSobrecarga()
+    contador.actualizar(0, HOY, None, 4000)
+    contador.actualizar(10, HOY, None, 4000)
+    assert contador.energia_ws == 0
+    assert contador.episodios_hoy == 0
+
+
+def test_cambio_de_dia_reinicia_los_contadores_diarios():
+    contador = ContadorSobrecarga()
+    contador.actualizar(0, HOY, 5000, 4000)
+    contador.actualizar(100, HOY, 3000, 4000)
+    assert contador.actualizar(200, MANANA, 3000, 4000)
+    assert (contador.episodios_hoy, contador.maximo_hoy) == (0, 0)
+    assert contador.energia_ws == pytest.approx(100 * 1000)  # La energía es acumulada
+
+
+def test_episodio_que_cruza_medianoche_cuenta_en_el_dia_nuevo():
+    contador = ContadorSobrecarga()
+    contador.actualizar(0, HOY, 5000, 4000)
+    contador.actualizar(50, MANANA, 5000, 4000)
+    assert contador.episodios_hoy == 1
+    assert contador.en_sobrecarga
+    contador.actualizar(80, MANANA, 3000, 4000)
+    assert contador.maximo_hoy == 30
+
+
+def test_reinicio_de_medianoche_sin_lecturas():
+    contador = ContadorSobrecarga()
+    contador.actualizar(0, HOY, 5000, 4000)
+    contador.actualizar(100, HOY, 3000, 4000)
+    assert contador.nuevo_dia(500, MANANA)
+    assert (contador.episodios_hoy, contador.maximo_hoy, contador.reinicio) == (0, 0, 500)
+    # La primera lectura del día nuevo no vuelve a reiniciar
+    assert not contador.nuevo_dia(600, MANANA)
+    contador.actualizar(600, MANANA, 3000, 4000)
+    assert contador.reinicio == 500
@@ -0,0 +1,85 @@
+"""Pruebas del motor en sombra (escalones de climate y emparejamiento)."""
+import pytest
+
+from paquete import cargar
+
+sombra = cargar("sombra")
+p = cargar("planificador")
+
+CONFIG = {
+    "sensor_potencia": "sensor.potencia",
+    "switches_limitados": ["climate.salon", "switch.termo"],
+    "potencia": 3000,
+    "intervalo_desactivacion": 10,
+    "intervalo_activacion": 30,
+    "banda_muestreo": 0,
+}
+SENSORES = {"climate.salon": "sensor.salon", "switch.termo": "sensor.termo"}
+ESCALERA = (p.ESCALON_CONSIGNA, p.ESCALON_ECO, p.ESCALON_APAGADO)
+
+
+def _motor(escalones=ESCALERA):
+    motor = sombra.MotorSombra(CONFIG, {"potencia": 3000}, SENSORES, 0)
+    motor.escalones({"climate.salon": escalones})
+    for entity_id, estado in [
+        ("climate.salon", "heat"), ("switch.termo", "on"),
+        ("sensor.salon", "2000"), ("sensor.termo", "500"), ("sensor.potencia", "2800"),
+    ]:
+        motor.evento(0, entity_id, estado)
+    return motor
+
+
+def test_reduce_el_climate_con_el_escalon_mas_suave():
+    motor = _motor()
+    motor.evento(5, "sensor.potencia", "3400")
+    motor.avanzar(15)
+    _consumo, _ts, escalon, _escalones = motor.sim.apagados["climate.salon"]
+    assert escalon == p.ESCALON_CONSIGNA
+    fraccion = p.FRACCION_ESCALON[p.ESCALON_CONSIGNA]
+    assert motor.sim.potencia_simulada() == pytest.approx(3400 - 2000 * fraccion)
+
+
+def test_sin_escalones_apaga_el_climate():
+    motor = _motor(escalones=(p.ESCALON_APAGADO,))
+    motor.evento(5, "sensor.potencia", "3400")
+    motor.avanzar(15)
+    assert motor.sim.apagados["climate.salon"][2] == p.ESCALON_APAGADO
+
+
+def test_empareja_por_escalon():
+    motor = _motor()
+    motor.evento(5, "sensor.potencia", "3400")
+    motor.avanzar(15)
+    motor.registrar_real(16, "apagado", "climate.salon", p.ESCALON_APAGADO, 2000)
+    for entity_id, estado in [("climate.salon", "off"), ("sensor.salon", "0"), ("sensor.potencia", "1400")]:
+        motor.evento(17, entity_id, estado)
+    # Con el climate solo reducido la sombra estima 1400 + 70 % de 2000: dentro del límite
+    assert motor.sim.potencia_simulada() == pytest.approx(2800)
+    motor.avanzar(16 + sombra.VENTANA_COINCIDENCIA + 1)
+    assert motor.coincidencias == 0
+    assert motor.solo == {sombra.REAL: 1, sombra.SOMBRA: 1}
+    assert motor.apagados_divergentes() == ["climate.salon"]
+    assert motor.sim.escalon("climate.salon") == p.ESCALON_CONSIGNA
+    assert motor.sim.escalon_real("climate.salon") == p.ESCALON_APAGADO
+    assert motor.sim.escalon("switch.termo") == p.ESCALON_NINGUNO
+
+
+def test_misma_reduccion_coincide_y_no_se_descuenta_dos_veces():
+    motor = _motor()
+    motor.evento(5, "sensor.potencia", "3400")
+    motor.avanzar(15)
+    motor.registrar_real(16, "apagado", "climate.salon", p.ESCALON_CONSIGNA, 2000)
+    assert motor.coincidencias == 1
+    assert motor.apagados_divergentes() == []
+    motor.evento(20, "sensor.potencia", "2900")
+    assert motor.sim.potencia_simulada() == pytest.approx(2900)
+
+
+def test_banda_de_muestreo_admite_cero():
+    assert sombra.normalizar_sombra({"banda_muestreo": 0}) == {"banda_muestreo": 0}
+    with pytest.raises(ValueError):
+        sombra.normalizar_sombra({"banda_muestreo": -1})
+    with pytest.raises(ValueError):
+        sombra.normalizar_sombra({"banda_muestreo": 100})
+    with pytest.raises(ValueError):
+        sombra.normalizar_sombra({"potencia": 0})